@@ -13,10 +13,12 @@ The data populated will be for 1 month from NYT archives API.
 
 
 # Python Standard Library imports
+from argparse import ArgumentParser
 from urllib.request import urlopen
 from json import loads
 from json import dumps
 from datetime import datetime
+import re
 
 
 # pymongo imports
@@ -32,6 +34,8 @@ __ARCHIVES_DOC_KEY__ = 'docs'
 __RESPONSE__ = 'response'
 __DB__ = 'archivesdb'
 __COLLECTION__ = 'month4'
+__ELEM_MATCH__ = '$elemMatch'
+__REGEX__ = '$regex'
 
 
 # Article fields
@@ -82,6 +86,29 @@ def get_client():
   return client
 
 
+# Archives API location
+def set_archives_api(base_path=None, api_key=None):
+  '''
+  Sets the base path and the API key of the NYT archives API, eg: `http://localhost:8000/svc/` for
+  the local stand-in of `nyt_archive_server.py`. Leaves the value unchanged when None.
+
+  :param: base_path `str` - Default value = None - The base path, must end with a `/`
+  :param: api_key `str` - Default value = None - The API key sent with the request
+
+  :return: `None`
+  '''
+
+  global __NYT_API_BASE_PATH__, __API_KEY__
+
+  if base_path is not None:
+    __NYT_API_BASE_PATH__ = base_path if base_path.endswith('/') else base_path + '/'
+
+  if api_key is not None:
+    __API_KEY__ = api_key
+
+  return
+
+
 # Creation of archives dataset
 # NYT Arcives API for fetching data from NYT
 def __archives_api__(year=2000, month=4):
@@ -123,7 +150,7 @@ def dump_data_scluster():
 
 
 # query 5
-def query_5(flag_person=False, search_string):
+def query_5(search_string, flag_person=False):
   '''
   docs -- ignore for now
   ~ sid
@@ -131,7 +158,7 @@ def query_5(flag_person=False, search_string):
 
   client = get_client()
 
-  db = client.get_database(__DATABASE_NAME__)
+  db = client.get_database(__DB__)
 
   '''
   Mongo shell sample query:
@@ -173,11 +200,20 @@ def query_5(flag_person=False, search_string):
       }
   }
 
-  cursor = db[__COLLECTION_NAME__].find(query)
+  cursor = db[__COLLECTION__].find(query)
 
   return cursor
 
 if __name__ == '__main__':
+  parser = ArgumentParser(description='Populates the midterm sharding cluster')
+  parser.add_argument('-api', '--api-base-path',
+                      help='base path of the NYT archives API, eg: http://localhost:8000/svc/')
+  parser.add_argument('-key', '--api-key', help='NYT archives API key')
+
+  args = parser.parse_args()
+
+  set_archives_api(base_path=args.api_base_path, api_key=args.api_key)
+
   print('Dumping data into Sharding cluster running on {hostname}:{port}'.format(
       hostname=__HOSTNAME__, port=__PORT__))
   dump_data_scluster()
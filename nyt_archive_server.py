@@ -0,0 +1,356 @@
+# nyt_archive_server.py
+# -*- coding: utf-8 -*-
+
+
+'''
+Local stand-in for the NYT archives API, for load testing the ingest without the real API.
+
+Serves `/svc/archive/v1/{year}/{month}.json` like `api.nytimes.com`, either from the recorded months
+of an archives cache directory (see `nyt_cache`) or from synthetic months (see `nyt_synthetic`).
+The payload size, the latency and bandwidth of the responses, the server side rate limit
+(`429 Too Many Requests` with a `Retry-After` header) and the share of failed (`500`, `503`) and
+truncated responses can all be configured.
+
+Usage:
+
+  python nyt_archive_server.py --port 8000 --docs-per-month 5000 --latency 0.2 \\
+      --requests-per-second 5 --error-rate 0.02
+
+  python nyt_archiver.py --api-base-path http://localhost:8000/svc/ ...
+'''
+
+# python standard library imports
+from argparse import ArgumentParser
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from json import dumps
+from logging import basicConfig
+from logging import info
+from logging import warning
+from random import Random
+from threading import Lock
+from threading import Thread
+from time import sleep
+import re
+
+
+# NYT Archiver imports
+from nyt_queries import TokenBucket
+from nyt_cache import ArchivesCache
+from nyt_synthetic import generate_month
+from nyt_synthetic import __DEFAULT_SEED__
+
+
+# Constants
+__ARCHIVE_PATH_PATTERN__ = re.compile(r'^/svc/archive/v1/(\d{4})/(\d{1,2})\.json$')
+__CONTENT_TYPE__ = 'application/json; charset=utf-8'
+__COPYRIGHT__ = 'Copyright (c) The New York Times Company. All Rights Reserved.'
+__DOCS_PER_MONTH__ = 1000
+__WRITE_CHUNK_SIZE__ = 16 * 1024
+__CACHED_MONTHS__ = 8
+__RETRY_AFTER_SECONDS__ = 1
+
+
+class ArchiveStandIn(object):
+  '''
+  ArchiveStandIn(docs_per_month=1000, seed=185, recorded_dir=None, recorded_only=False,
+                 latency=0.0, jitter=0.0, bytes_per_second=None, requests_per_second=None,
+                 throttle_rate=0.0, error_rate=0.0, truncate_rate=0.0, retry_after=1)
+
+  The behaviour of the stand-in server.
+
+  Input(s):
+
+    :param: docs_per_month `int` -- The articles of a synthetic month, i.e the payload size --
+    defaults to 1000
+
+    :param: seed `int` -- The seed of the synthetic months -- defaults to 185
+
+    :param: recorded_dir `str` -- An archives cache directory whose months are served as recorded
+    -- defaults to None
+
+    :param: recorded_only `bool` -- Answer `404` for the months that were not recorded instead of
+    generating them -- defaults to False
+
+    :param: latency `float` -- The seconds waited before answering -- defaults to 0
+
+    :param: jitter `float` -- Up to that many more seconds, at random -- defaults to 0
+
+    :param: bytes_per_second `int` -- The bandwidth of every response -- defaults to unlimited
+
+    :param: requests_per_second `float` -- The rate limit, requests above it get a `429` --
+    defaults to unlimited
+
+    :param: throttle_rate `float` -- The share of the requests answered `429` at random --
+    defaults to 0
+
+    :param: error_rate `float` -- The share of the requests answered `500` or `503` -- defaults
+    to 0
+
+    :param: truncate_rate `float` -- The share of the responses cut off half way -- defaults to 0
+
+    :param: retry_after `int` -- The `Retry-After` seconds sent with the `429`s -- defaults to 1
+  '''
+
+  def __init__(self, docs_per_month=__DOCS_PER_MONTH__, seed=__DEFAULT_SEED__, recorded_dir=None,
+               recorded_only=False, latency=0.0, jitter=0.0, bytes_per_second=None,
+               requests_per_second=None, throttle_rate=0.0, error_rate=0.0, truncate_rate=0.0,
+               retry_after=__RETRY_AFTER_SECONDS__):
+    self.docs_per_month = docs_per_month
+    self.seed = seed
+    self.recorded = ArchivesCache(recorded_dir) if recorded_dir is not None else None
+    self.recorded_only = recorded_only
+    self.latency = latency
+    self.jitter = jitter
+    self.bytes_per_second = bytes_per_second
+    self.limiter = TokenBucket(requests_per_second) if requests_per_second else None
+    self.throttle_rate = throttle_rate
+    self.error_rate = error_rate
+    self.truncate_rate = truncate_rate
+    self.retry_after = retry_after
+    self._random = Random(seed)
+    self._months = OrderedDict()
+    self._lock = Lock()
+    self._stats = {'requests': 0, 'served': 0, 'throttled': 0, 'errors': 0, 'truncated': 0,
+                   'not_found': 0, 'bytes_sent': 0}
+
+  def count(self, **increments):
+    with self._lock:
+      for key, increment in increments.items():
+        self._stats[key] += increment
+
+  def stats(self):
+    '''
+    stats() -> dict
+
+    The `requests` received, `served`, `throttled` (429), `errors` (5xx), `truncated`,
+    `not_found` and the `bytes_sent`.
+    '''
+
+    with self._lock:
+      return dict(self._stats)
+
+  def outcome(self):
+    '''
+    outcome() -> (str, int)
+
+    Draws what happens to the next request, `throttled`, `error`, `truncated` or `served`, and
+    the HTTP status answered.
+    '''
+
+    if self.limiter is not None and not self.limiter.try_acquire():
+      return 'throttled', 429
+
+    with self._lock:
+      roll = self._random.random()
+      delay = self.latency + self._random.random() * self.jitter
+      error_status = self._random.choice([500, 503])
+
+    if delay > 0:
+      sleep(delay)
+
+    if roll < self.throttle_rate:
+      return 'throttled', 429
+    if roll < self.throttle_rate + self.error_rate:
+      return 'error', error_status
+    if roll < self.throttle_rate + self.error_rate + self.truncate_rate:
+      return 'truncated', 200
+
+    return 'served', 200
+
+  def month(self, year, month):
+    '''
+    month(year, month) -> bytes
+
+    The response body for the year, month, None when it can't be served. The last months served
+    are kept in memory.
+    '''
+
+    with self._lock:
+      if (year, month) in self._months:
+        self._months.move_to_end((year, month))
+        return self._months[(year, month)]
+
+    body = None
+
+    if self.recorded is not None:
+      recorded_response = self.recorded.open(year, month)
+
+      if recorded_response is not None:
+        with recorded_response:
+          body = recorded_response.read()
+
+    if body is None and not self.recorded_only:
+      docs = list(generate_month(year, month, self.docs_per_month, seed=self.seed))
+      body = dumps({
+          'copyright': __COPYRIGHT__,
+          'response': {
+              'meta': {
+                  'hits': len(docs)
+              },
+              'docs': docs
+          }
+      }).encode('utf-8')
+
+    if body is not None:
+      with self._lock:
+        self._months[(year, month)] = body
+
+        while len(self._months) > __CACHED_MONTHS__:
+          self._months.popitem(last=False)
+
+    return body
+
+
+class __ArchiveRequestHandler__(BaseHTTPRequestHandler):
+  '''
+  Answers the archives API requests with the `ArchiveStandIn` of the server.
+  '''
+
+  def do_GET(self):
+    stand_in = self.server.stand_in
+
+    stand_in.count(requests=1)
+
+    match = __ARCHIVE_PATH_PATTERN__.match(self.path.split('?', 1)[0])
+
+    if match is None:
+      stand_in.count(not_found=1)
+      self.send_error(404, 'Not an archives API path')
+      return
+
+    outcome, status = stand_in.outcome()
+
+    if outcome == 'throttled':
+      stand_in.count(throttled=1)
+      self.send_response(status)
+      self.send_header('Retry-After', str(stand_in.retry_after))
+      self.send_header('Content-Length', '0')
+      self.end_headers()
+      return
+
+    if outcome == 'error':
+      stand_in.count(errors=1)
+      self.send_error(status, 'Injected error')
+      return
+
+    body = stand_in.month(int(match.group(1)), int(match.group(2)))
+
+    if body is None:
+      stand_in.count(not_found=1)
+      self.send_error(404, 'Month not recorded')
+      return
+
+    self.send_response(200)
+    self.send_header('Content-Type', __CONTENT_TYPE__)
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+
+    # a truncated response stops half way, like a connection dropped by the server
+    end = len(body) // 2 if outcome == 'truncated' else len(body)
+
+    chunk_size = __WRITE_CHUNK_SIZE__
+
+    if stand_in.bytes_per_second:
+      chunk_size = min(chunk_size, max(1, stand_in.bytes_per_second // 10))
+
+    for start in range(0, end, chunk_size):
+      chunk = body[start:min(start + chunk_size, end)]
+      self.wfile.write(chunk)
+      stand_in.count(bytes_sent=len(chunk))
+
+      if stand_in.bytes_per_second:
+        sleep(len(chunk) / float(stand_in.bytes_per_second))
+
+    if outcome == 'truncated':
+      stand_in.count(truncated=1)
+      self.close_connection = True
+    else:
+      stand_in.count(served=1)
+
+  def log_message(self, format, *args):
+    info('archives stand-in: ' + format % args)
+
+
+# Starting the stand-in server
+def serve(host='127.0.0.1', port=8000, background=True, **options):
+  '''
+  serve(host='127.0.0.1', port=8000, background=True, **options) -> ThreadingHTTPServer
+
+  Starts the stand-in archives API server.
+
+  Input(s):
+
+    :param: host `str` -- The interface to listen on -- defaults to 127.0.0.1
+
+    :param: port `int` -- The port to listen on, 0 for any free port -- defaults to 8000
+
+    :param: background `bool` -- Serve from a daemon thread and return at once, otherwise serve
+    until interrupted -- defaults to True
+
+    :param: options -- The `ArchiveStandIn` options
+
+  Output(s):
+
+    :return: server `ThreadingHTTPServer` -- The server, its `base_path` is the value to pass to
+    `nyt_queries.set_archives_api`, its `stand_in` holds the `stats()`. Stop it with
+    `server.shutdown()` and `server.server_close()`.
+  '''
+
+  server = ThreadingHTTPServer((host, port), __ArchiveRequestHandler__)
+  server.daemon_threads = True
+  server.stand_in = ArchiveStandIn(**options)
+  server.base_path = 'http://{host}:{port}/svc/'.format(host=host, port=server.server_address[1])
+
+  warning('Serving the NYT archives API stand-in at {base_path}'.format(
+      base_path=server.base_path))
+
+  if background:
+    Thread(target=server.serve_forever, daemon=True).start()
+  else:
+    try:
+      server.serve_forever()
+    except KeyboardInterrupt:
+      pass
+    finally:
+      server.server_close()
+      warning('Stand-in stats: {stats}'.format(stats=server.stand_in.stats()))
+
+  return server
+
+
+if __name__ == '__main__':
+  basicConfig(format='%(asctime)s %(message)s')
+
+  parser = ArgumentParser(description='Local stand-in for the NYT archives API')
+  parser.add_argument('--host', default='127.0.0.1')
+  parser.add_argument('-p', '--port', type=int, default=8000)
+  parser.add_argument('-d', '--docs-per-month', type=int, default=__DOCS_PER_MONTH__,
+                      help='articles of every synthetic month')
+  parser.add_argument('--seed', type=int, default=__DEFAULT_SEED__)
+  parser.add_argument('--recorded-dir', help='archives cache directory of recorded months')
+  parser.add_argument('--recorded-only', action='store_true',
+                      help='answer 404 for the months not recorded')
+  parser.add_argument('--latency', type=float, default=0.0, help='seconds before answering')
+  parser.add_argument('--jitter', type=float, default=0.0, help='random extra latency seconds')
+  parser.add_argument('--bytes-per-second', type=int, help='bandwidth of every response')
+  parser.add_argument('-rps', '--requests-per-second', type=float,
+                      help='rate limit, the requests above it get a 429')
+  parser.add_argument('--throttle-rate', type=float, default=0.0,
+                      help='share of the requests answered 429 at random')
+  parser.add_argument('--error-rate', type=float, default=0.0,
+                      help='share of the requests answered 500 or 503')
+  parser.add_argument('--truncate-rate', type=float, default=0.0,
+                      help='share of the responses cut off half way')
+  parser.add_argument('--retry-after', type=int, default=__RETRY_AFTER_SECONDS__,
+                      help='Retry-After seconds sent with the 429s')
+
+  args = parser.parse_args()
+
+  serve(host=args.host, port=args.port, background=False,
+        docs_per_month=args.docs_per_month, seed=args.seed, recorded_dir=args.recorded_dir,
+        recorded_only=args.recorded_only, latency=args.latency, jitter=args.jitter,
+        bytes_per_second=args.bytes_per_second, requests_per_second=args.requests_per_second,
+        throttle_rate=args.throttle_rate, error_rate=args.error_rate,
+        truncate_rate=args.truncate_rate, retry_after=args.retry_after)
@@ -128,35 +128,56 @@ come about in last 10 years.)
 # Python standard lib imports
 from argparse import ArgumentParser
 from pprint import pprint
+import sys
 
 # NYT Archiver queries import
 from nyt_queries import *
 from nyt_queries import __DATABASE_NAME__
 from nyt_queries import __COLLECTION_NAME__
-
-
-def execute_query(*, query_index):
+from nyt_indexes import ensure_indexes
+from nyt_indexes import check_indexes
+from nyt_benchmarks import benchmark_projections
+from nyt_benchmarks import benchmark_sketches
+from nyt_trends import keyword_series
+from nyt_export import export_archives
+from nyt_columns import build_column_snapshot
+from nyt_benchmarks import benchmark_columns
+from nyt_benchmarks import benchmark_parallel_aggregation
+
+
+def execute_query(*, query_index, ranked_search=False, projection='summary', keyword_periods=None,
+                  top_keywords=10, approximate=False, name_match='prefix'):
   '''
-  execute_query(*, query_index)
-
-  Executes the query for the given query index[1-15]
+  execute_query(*, query_index, ranked_search=False, projection='summary', keyword_periods=None,
+                top_keywords=10, approximate=False, name_match='prefix')
+
+  Executes the query for the given query index[1-15], with `ranked_search` the query#3 results are
+  ranked by the text index. The articles are returned with the `projection` profile, `summary`,
+  `byline` or `full`. The query#1 compares the top `top_keywords` of the `keyword_periods`,
+  defaulting to 2005-2007 and 2015-2017. With `approximate` the queries#2, 7 and 11 are answered
+  from the sketches, with error bounds. The query#4 matches the reporter names with `name_match`,
+  `exact`, `prefix` or `fuzzy`.
   '''
 
   if query_index == 1:
-    phase1_words, phase2_words = compare_news_keywords()
-    print('Phase 1 keywords and their counts:')
-    pprint(phase1_words)
-    print('Phase 2 keywords and their counts:')
-    pprint(phase2_words)
+    periods = ((2005, 2007), (2015, 2017)) if keyword_periods is None else keyword_periods
+    for period, words in zip(periods, compare_news_keywords(periods, top_keywords)):
+      print('{first}-{last} keywords and their counts:'.format(first=period[0], last=period[1]))
+      pprint(words)
+    print('Keyword ranks across the periods:')
+    for keyword in compare_keyword_periods(periods, top_keywords):
+      print('  {ranks} {deltas} {keyword}'.format(ranks=keyword['ranks'],
+                                                 deltas=keyword['rank_deltas'],
+                                                 keyword=keyword['_id']))
 
   elif query_index == 2:
-    news_keywords = most_popular_news_keywords()
+    news_keywords = most_popular_news_keywords(approximate=approximate)
     print('5 Most popular keywords are:')
     pprint(news_keywords)
 
   elif query_index == 3:
     user_entry = input('Input what you want to search within: ')
-    articles = search_in_articles(user_entry)
+    articles = search_in_articles(user_entry, ranked=ranked_search, projection=projection)
     print('Matching articles:')
     pprint(articles)
 
@@ -170,31 +191,36 @@ def execute_query(*, query_index):
         Nicholas - Cage
         ''').split(' ')
     articles = search_articles_reporter_name(
-        first_name=first_name, middle_name=middle_name, last_name=last_name)
+        first_name=first_name, middle_name=middle_name, last_name=last_name, stream=True,
+        projection=projection, match=name_match)
     print('Articles by the person:')
-    pprint(articles)
+    for article in articles:
+      pprint(article)
 
   elif query_index == 5:
     search_string = input(
         '''Input the organization or person's name to search: ''')
     flag_person = False if input('Is it a person? [Y/N]') == 'N' else True
-    articles = search_people_or_organization(search_string, flag_person)
+    articles = search_people_or_organization(search_string, flag_person, stream=True,
+                                             projection=projection)
     print('Matching articles: ')
-    pprint(articles)
+    for article in articles:
+      pprint(article)
 
   elif query_index == 6:
     page_number = int(input('Enter the page number to search for: '))
-    articles = xpage_articles(page_number)
+    articles = xpage_articles(page_number, stream=True, projection=projection)
     print('Articles on the page#{} are:'.format(page_number))
-    pprint(articles)
+    for article in articles:
+      pprint(article)
 
   elif query_index == 7:
     print('Most productive reporter: ')
-    pprint(most_productive_reporter())
+    pprint(most_productive_reporter(approximate=approximate))
 
   elif query_index == 8:
     print('Longest article:')
-    pprint(longest_article())
+    pprint(longest_article(projection=projection))
 
   elif query_index == 9:
     print('Number of original articles: ')
@@ -210,13 +236,14 @@ def execute_query(*, query_index):
         2005-09-11 2006-10-01
         ::
         ''').split(' ')
-    articles = articles_between(begin_time, end_time)
+    articles = articles_between(begin_time, end_time, stream=True, projection=projection)
     print('Matching articles are:')
-    pprint(articles)
+    for article in articles:
+      pprint(article)
 
   elif query_index == 11:
     print('Most frequent organization: ')
-    pprint(most_organization())
+    pprint(most_organization(approximate=approximate))
 
   elif query_index == 12:
     print('Section with most number of articles: ')
@@ -243,7 +270,7 @@ def execute_query(*, query_index):
         2005-09-11 2006-10-01
         ::
         ''').split(' ')
-    articles = front_page_articles(begin_time, end_time)
+    articles = front_page_articles(begin_time, end_time, projection=projection)
     print('Matching articles are:')
     pprint(articles)
 
@@ -263,9 +290,96 @@ if __name__ == '__main__':
   parser.add_argument('-db', '--database')
   parser.add_argument('-cl', '--collection')
   parser.add_argument('-f', '--force', action='store_true')
+  parser.add_argument('-r', '--rebuild', action='store_true',
+                      help='ingest every month again instead of resuming from the manifest')
+  parser.add_argument('-ps', '--pool-size', type=int,
+                      help='maximum number of pooled connections to mongodb')
+  parser.add_argument('-w', '--workers', type=int, default=4,
+                      help='number of months fetched and inserted in parallel')
+  parser.add_argument('-rps', '--requests-per-second', type=float, default=5,
+                      help='NYT archives API quota in requests per second')
+  parser.add_argument('-bs', '--batch-size', type=int,
+                      help='number of documents per insert')
+  parser.add_argument('-bb', '--batch-bytes', type=int,
+                      help='BSON bytes per insert')
+  parser.add_argument('-wp', '--write-profile', choices=['bulk', 'durable'], default='bulk',
+                      help='bulk (w=1, j=false, unordered) or durable (w=majority, j=true, ordered)')
+  parser.add_argument('-api', '--api-base-path',
+                      help='base path of the NYT archives API, eg: http://localhost:8000/svc/ for '
+                           'the local stand-in of nyt_archive_server.py')
+
+  parser.add_argument('-bf', '--backfill', action='store_true',
+                      help='add the derived fields to the articles ingested without them')
+  parser.add_argument('-ei', '--ensure-indexes', action='store_true',
+                      help='build the indexes needed by the queries')
+  parser.add_argument('-ci', '--check-indexes', action='store_true',
+                      help='run every query and fail if any of them scans the whole collection')
+  parser.add_argument('-rs', '--ranked-search', action='store_true',
+                      help='rank the query#3 search results using the text index')
+  parser.add_argument('-kp', '--keyword-periods', nargs='+', metavar='YYYY[-YYYY]',
+                      help='periods compared by the query#1, eg: 2005-2007 2015-2017')
+  parser.add_argument('-k', '--top-keywords', type=int, default=10,
+                      help='number of keywords per period of the query#1')
+  parser.add_argument('-pp', '--projection', choices=['summary', 'byline', 'full'],
+                      default='summary', help='fields of the articles printed by the queries')
+  parser.add_argument('-bp', '--benchmark-projections', action='store_true',
+                      help='measure the bytes and decode time of the queries per projection profile')
+  parser.add_argument('-kb', '--keyword-bursts', type=int, metavar='K',
+                      help='print the K keywords with the highest monthly burst (needs numpy)')
+  parser.add_argument('-ap', '--approximate', action='store_true',
+                      help='answer the queries#2, 7 and 11 from the sketches, with error bounds')
+  parser.add_argument('-nm', '--name-match', choices=['exact', 'prefix', 'fuzzy'], default='prefix',
+                      help='how the query#4 matches the reporter names')
+  parser.add_argument('-bsk', '--benchmark-sketches', action='store_true',
+                      help='compare the accuracy and latency of the sketches with the exact queries')
+  parser.add_argument('-dc', '--distinct-counts', nargs='*', metavar='YYYY-MM',
+                      help='estimate the distinct keywords, organizations, persons and reporters '
+                           'of all the months, of one month or of a range of months')
+  parser.add_argument('-mh', '--monthly-histogram', nargs='?', const='articles',
+                      choices=['articles', 'document_type', 'section'],
+                      help='print the articles of every month, optionally per document type or '
+                           'section')
+  parser.add_argument('-ex', '--export-dir',
+                      help='export the archives to Parquet or Arrow files partitioned by month '
+                           '(needs pyarrow)')
+  parser.add_argument('-exf', '--export-format', choices=['parquet', 'arrow'], default='parquet')
+  parser.add_argument('-exa', '--export-all', action='store_true',
+                      help='export every month again, not only the new or changed ones')
+  parser.add_argument('-cs', '--column-snapshot',
+                      help='write the memory mapped column snapshot to the directory (needs numpy)')
+  parser.add_argument('-bcs', '--benchmark-column-snapshot',
+                      help='time the queries of the column snapshot in the directory against '
+                           'mongodb')
+  parser.add_argument('-pa', '--parallel-aggregation', type=int, metavar='WORKERS',
+                      help='run the raw $group pipelines of the queries#7, 11, 12 and 13 as date '
+                           'partitions aggregated by that many threads')
+  parser.add_argument('-bpa', '--benchmark-parallel-aggregation', action='store_true',
+                      help='time the partitioned $group pipelines against the single pipeline')
+  parser.add_argument('-ec', '--entity-catalog', action='store_true',
+                      help='rebuild the catalog of persons, organizations, places and subjects')
+  parser.add_argument('-ac', '--autocomplete', metavar='PREFIX',
+                      help='print the most frequent entities named by the prefix')
+  parser.add_argument('-qc', '--query-cache', action='store_true',
+                      help='cache the query results until they expire or the dataset is ingested')
+  parser.add_argument('-qcd', '--query-cache-dir',
+                      help='directory of the on-disk tier of the query result cache')
+  parser.add_argument('-qct', '--query-cache-ttl', type=float, default=300.0,
+                      help='seconds a cached query result stays valid')
+  parser.add_argument('-cr', '--check-rollups', action='store_true',
+                      help='compare the rollup answers with the raw pipelines and fail on a mismatch')
+  parser.add_argument('-cache', '--cache-dir',
+                      help='directory caching the raw NYT archives API responses')
+  parser.add_argument('--replay', action='store_true',
+                      help='only replay the months from the cache, never call the API')
 
   args = parser.parse_args()
 
+  keyword_periods = None
+
+  if args.keyword_periods is not None:
+    keyword_periods = [tuple(int(year) for year in (period.split('-') * 2)[:2])
+                       for period in args.keyword_periods]
+
   database_name, collection_name, hostname, port, force_create = args.database, args.collection, \
       args.hostname, args.port, args.force
 
@@ -273,14 +387,136 @@ if __name__ == '__main__':
   set_db_collection_names(
       hostname=hostname, port=port, database_name=database_name, collection_name=collection_name)
 
+  if args.pool_size is not None:
+    set_client_options(max_pool_size=args.pool_size)
+
+  if args.api_base_path is not None:
+    set_archives_api(base_path=args.api_base_path)
+
+  if args.cache_dir is not None:
+    set_archives_cache(cache_dir=args.cache_dir, replay=args.replay)
+
+  if args.query_cache or args.query_cache_dir is not None:
+    set_query_cache(ttl=args.query_cache_ttl, cache_dir=args.query_cache_dir)
+
+  if args.parallel_aggregation is not None:
+    set_parallel_aggregation(workers=args.parallel_aggregation)
+
   client = get_client()
 
   if force_create or __DATABASE_NAME__ not in client.database_names():
     print('Need to create the dataset...')
     try:
-      create_archives_dataset()
+      report = create_archives_dataset(workers=args.workers,
+                                       requests_per_second=args.requests_per_second,
+                                       resume=not args.rebuild,
+                                       options=write_options(args.write_profile,
+                                                             batch_size=args.batch_size,
+                                                             batch_bytes=args.batch_bytes))
+      print('Inserted {documents} documents in {seconds:.2f}s ({docs_per_second:.1f} docs/sec, '
+            '{write_docs_per_second:.1f} docs/sec in bulk_write)'.format(**report))
+      for month_report in report['months']:
+        print('  {year}-{month:02d} {status:>7} {count:>6} documents {seconds:.2f}s '
+              '({batches} batches, slowest {max_batch_seconds:.3f}s, {errors} errors)'.format(
+                  **month_report))
+      if report['cache'] is not None:
+        print('Archives cache: {hits} hits, {misses} misses, {bytes_read} bytes replayed'.format(
+            **report['cache']))
     except Exception as e:
-      warning('Failed to create dataset, check mongodb logs', e)
+      warning('Failed to create dataset, check mongodb logs: {e}'.format(e=e))
+    else:
+      # building the indexes once the documents are in is faster than maintaining them per insert
+      ensure_indexes(client)
+
+  if args.backfill:
+    backfill_derived_fields()
+
+  if args.ensure_indexes:
+    ensure_indexes(client)
+
+  if args.check_indexes:
+    checks = check_indexes(client)
+    for check in checks:
+      print('{verdict:>8} {query} {seconds:.3f}s {plans}'.format(
+          verdict='COLLSCAN' if check['collscan'] else 'ok', **check))
+    if any(check['collscan'] for check in checks):
+      sys.exit(1)
+
+  if args.check_rollups:
+    checks = check_rollups()
+    for check in checks:
+      print('{verdict:>12} {query} rollups {rollup_seconds:.3f}s raw {raw_seconds:.3f}s'.format(
+          verdict='ok' if check['consistent'] else 'INCONSISTENT', **check))
+    for month in (checks[0]['unready_months'] if checks else list()):
+      print('{verdict:>12} {month} rollups'.format(verdict='INCOMPLETE', month=month))
+    if not all(check['consistent'] and not check['unready_months'] for check in checks):
+      sys.exit(1)
+
+  if args.benchmark_projections:
+    for result in benchmark_projections():
+      print('{profile:>8} {query:<32} {documents:>7} documents {bytes:>12} bytes '
+            '{seconds:.3f}s decode {decode_seconds:.3f}s'.format(**result))
+
+  if args.benchmark_sketches:
+    for result in benchmark_sketches():
+      print('{query:<28} recall {recall:.2f} max relative error {max_relative_error:.3f} '
+            'bounds {within_bounds!s:>5} exact {exact_seconds:.3f}s '
+            'approximate {approximate_seconds:.3f}s'.format(**result))
+
+  if args.distinct_counts is not None:
+    if len(args.distinct_counts) > 2:
+      parser.error('--distinct-counts takes at most a first and a last month')
+    months = [tuple(int(part) for part in month.split('-')) for month in args.distinct_counts]
+    start, end = (months + [None, None])[:2] if len(months) != 1 else (months[0], months[0])
+    for dimension in ('keyword', 'organization', 'person', 'reporter'):
+      distinct = distinct_count(dimension, start=start, end=end, client=client)
+      if distinct is not None:
+        print('{dimension:>12} {distinct:>9} distinct (+/- {percent:.1f}%) over {months} '
+              'months'.format(percent=100 * distinct['relative_error'], **distinct))
+
+  if args.monthly_histogram is not None:
+    split_by = None if args.monthly_histogram == 'articles' else args.monthly_histogram
+    for entry in monthly_article_histogram(split_by=split_by):
+      print('{year}-{month:02d} {count:>8} {counts}'.format(counts=entry.get('counts', ''),
+                                                            **entry))
+
+  if args.export_dir is not None:
+    report = export_archives(args.export_dir, export_format=args.export_format,
+                             workers=args.workers, incremental=not args.export_all, client=client)
+    print('Exported {rows} articles ({bytes} bytes) in {seconds:.2f}s, {skipped_count} months '
+          'already exported'.format(skipped_count=len(report['skipped']), **report))
+
+  if args.column_snapshot is not None:
+    build_column_snapshot(args.column_snapshot, client=client)
+
+  if args.benchmark_column_snapshot is not None:
+    for result in benchmark_columns(args.benchmark_column_snapshot):
+      print('{query:<32} mongodb {mongo_seconds:.4f}s columns {column_seconds:.4f}s '
+            'x{speedup:.0f} {verdict}'.format(
+                verdict='ok' if result['consistent'] else 'INCONSISTENT', **result))
+
+  if args.benchmark_parallel_aggregation:
+    for result in benchmark_parallel_aggregation():
+      print('{query:<32} {workers:>2} workers {partitions:>3} partitions single '
+            '{single_seconds:.3f}s partitioned {partitioned_seconds:.3f}s x{speedup:.2f} '
+            '({cores} cores) {verdict}'.format(
+                verdict='ok' if result['consistent'] else 'INCONSISTENT', **result))
+
+  if args.entity_catalog:
+    build_entity_catalog(client)
+
+  if args.autocomplete is not None:
+    for entity in autocomplete_entities(args.autocomplete, client=client):
+      print('{count:>8} {_id}'.format(**entity))
+
+  if args.keyword_bursts is not None:
+    series = keyword_series(client)
+    for burst in series.top_bursts(k=args.keyword_bursts):
+      print('{score:8.1f} {year}-{month:02d} {count:>6} articles (expected {expected:.1f}) '
+            '{keyword}'.format(**burst))
+    for emerging in series.top_emerging(k=args.keyword_bursts):
+      print('{score:8.2f} {count:>6} articles last month, {before} before {keyword}'.format(
+          **emerging))
 
   consent = 'N'
   consent = input('Query the dataset? [Y/N]')
@@ -328,9 +564,17 @@ if __name__ == '__main__':
       15. Find 10 most popular article in the given timeframe
       ''')
 
-    execute_query(query_index=int(query_index))
+    execute_query(query_index=int(query_index), ranked_search=args.ranked_search,
+                  projection=args.projection, keyword_periods=keyword_periods,
+                  top_keywords=args.top_keywords, approximate=args.approximate,
+                  name_match=args.name_match)
 
     consent = input('Query again? [Y/N]')
 
+  if query_cache_stats() is not None:
+    print('Query cache: {hits} hits ({disk_hits} from disk), {misses} misses, '
+          '{invalidations} invalidated by ingest'.format(**query_cache_stats()))
+
   print('Thanks for using NYT Archiver...')
   warning('Shutting down...')
+  close_client()
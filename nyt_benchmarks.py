@@ -0,0 +1,683 @@
+# nyt_benchmarks.py
+# -*- coding: utf-8 -*-
+
+
+'''
+Benchmarks of the NYT archiver queries.
+
+`benchmark_queries` loads deterministic synthetic corpora (see `nyt_synthetic`) of growing sizes
+into a scratch database and times the 15 queries on each of them, without and with the indexes of
+`nyt_indexes`. The report, also written as JSON to track regressions, holds the p50/p95 latency,
+the documents and index keys examined and the peak RSS of the client for every query.
+
+`benchmark_projections` runs the queries returning articles with every projection profile of
+`nyt_queries` and reports how many bytes of BSON each profile ships from the server and how long the
+driver takes to decode them.
+
+`benchmark_sketches` compares the approximate answers merged from the per-month sketches with the
+exact counts, for their accuracy and their latency.
+
+`benchmark_parallel_aggregation` times the raw `$group` queries run as one pipeline and as
+partitions aggregated concurrently, for a growing number of workers.
+
+`benchmark_columns` times the queries answered by the memory mapped column snapshot (see
+`nyt_columns`) against the same queries on MongoDB.
+
+Usage:
+
+  python nyt_benchmarks.py --sizes 10000 100000 1000000 --runs 5 --report benchmark.json
+'''
+
+# python standard library imports
+from argparse import ArgumentParser
+from datetime import datetime
+from json import dump
+from json import dumps
+from logging import basicConfig
+from logging import warning
+from math import ceil
+from os import cpu_count
+from os import sysconf
+from statistics import median
+from time import perf_counter
+
+
+# pymongo imports
+from bson import BSON
+from pymongo import WriteConcern
+
+
+# NYT Archiver imports
+import nyt_queries
+from nyt_queries import get_client
+from nyt_queries import set_db_collection_names
+from nyt_queries import normalize_document
+from nyt_queries import __batches__
+from nyt_queries import __count_rollups__
+from nyt_queries import __write_rollups__
+from nyt_queries import __write_sketches__
+from nyt_queries import __rollup_counts__
+from nyt_queries import heavy_hitters
+from nyt_queries import set_parallel_aggregation
+from nyt_queries import __result_counts__
+from nyt_queries import build_entity_catalog
+from nyt_queries import __mark_month__
+from nyt_queries import __bump_generation__
+from nyt_queries import __MONTH_DONE__
+from nyt_queries import __ROLLUPS_SUFFIX__
+from nyt_queries import __SKETCHES_SUFFIX__
+from nyt_queries import __ENTITIES_SUFFIX__
+from nyt_queries import __APPROXIMATE_QUERIES__
+from nyt_queries import __MANIFEST_SUFFIX__
+from nyt_queries import __GENERATION_SUFFIX__
+from nyt_queries import __ROLLUP_QUERIES__
+from nyt_queries import __PROJECTION_PROFILES__
+from nyt_indexes import QUERY_CHECKS
+from nyt_indexes import ensure_indexes
+from nyt_indexes import profiling
+from nyt_indexes import profiled_call
+from nyt_columns import ColumnSnapshot
+from nyt_synthetic import month_sizes
+from nyt_synthetic import generate_month
+from nyt_synthetic import __DEFAULT_SEED__
+
+
+# Constants
+__BENCHMARK_RUNS__ = 3
+__BENCHMARK_DATABASE__ = 'nyt_benchmark'
+__BENCHMARK_COLLECTION__ = 'archives_{size}'
+__BENCHMARK_SIZES__ = (10000, 100000, 1000000, 10000000)
+__LOAD_BATCH_SIZE__ = 1000
+__STATM_PATH__ = '/proc/self/statm'
+
+
+# The queries timed by `benchmark_queries`, (name, arguments, keyword arguments). The aggregate
+# queries answered from the rollups are timed on the raw pipelines too, and the ones answered from
+# the sketches in their approximate mode.
+BENCHMARK_QUERIES = list(QUERY_CHECKS) + [
+    (query_name, tuple(), {'use_rollups': False}) for query_name in __ROLLUP_QUERIES__] + [
+    (query_name, tuple(), {'approximate': True}) for query_name, _ in __APPROXIMATE_QUERIES__]
+
+
+# The queries returning articles with sample arguments, run by `benchmark_projections`
+PROJECTION_QUERIES = [
+    ('search_in_articles', ('of the need',)),
+    ('search_articles_reporter_name', ('Constance', 'L.', 'HAYS')),
+    ('search_people_or_organization', ('MATTEL', False)),
+    ('xpage_articles', (1,)),
+    ('longest_article', tuple()),
+    ('articles_between', ('2005-09-11', '2005-10-01')),
+    ('front_page_articles', ('2005-09-11', '2005-10-01'))
+]
+
+
+# Measuring the size and decode time of the query results
+def __measure__(query, arguments, profile):
+  '''
+  __measure__(query, arguments, profile) -> dict
+
+  Runs the query once. The returned articles are encoded back to BSON, that is what the server sent
+  for them, and decoded again to time the decoding done by the driver.
+  '''
+
+  started_at = perf_counter()
+  result = query(*arguments, projection=profile)
+  seconds = perf_counter() - started_at
+
+  documents = result if isinstance(result, list) else [result] if result is not None else list()
+  encoded = [BSON.encode(document) for document in documents]
+
+  started_at = perf_counter()
+  for raw_document in encoded:
+    raw_document.decode()
+  decode_seconds = perf_counter() - started_at
+
+  return {
+      'documents': len(documents),
+      'bytes': sum(len(raw_document) for raw_document in encoded),
+      'seconds': seconds,
+      'decode_seconds': decode_seconds
+  }
+
+
+# Comparing the projection profiles
+def benchmark_projections(queries=None, profiles=None, runs=__BENCHMARK_RUNS__):
+  '''
+  benchmark_projections(queries=None, profiles=None, runs=3) -> list[dict]
+
+  Runs every query with every projection profile and reports the median of the runs.
+
+  Input(s):
+
+    :param: queries `list[(str, tuple)]` -- The query functions of `nyt_queries` and their
+    arguments -- defaults to `PROJECTION_QUERIES`
+
+    :param: profiles `list[str]` -- The projection profiles compared -- defaults to all of them
+
+    :param: runs `int` -- The number of runs per query and profile -- defaults to 3
+
+  Output(s):
+
+    :return: results `list[dict]` -- One entry per query and profile with its `query`, `profile`,
+    the number of `documents`, the BSON `bytes` transferred, the `seconds` the query took and the
+    `decode_seconds` spent decoding the articles.
+  '''
+
+  queries = PROJECTION_QUERIES if queries is None else queries
+  profiles = sorted(__PROJECTION_PROFILES__) if profiles is None else profiles
+
+  results = list()
+
+  for query_name, arguments in queries:
+    # bypassing the query result cache
+    query = getattr(nyt_queries, query_name).__wrapped__
+
+    for profile in profiles:
+      measures = [__measure__(query, arguments, profile) for _ in range(runs)]
+
+      results.append({
+          'query': query_name,
+          'profile': profile,
+          'documents': measures[-1]['documents'],
+          'bytes': measures[-1]['bytes'],
+          'seconds': median(measure['seconds'] for measure in measures),
+          'decode_seconds': median(measure['decode_seconds'] for measure in measures)
+      })
+
+  return results
+
+
+# Comparing the sketches with the exact counts
+def benchmark_sketches(k=10, runs=__BENCHMARK_RUNS__, client=None):
+  '''
+  benchmark_sketches(k=10, runs=3, client=None) -> list[dict]
+
+  Compares the heavy hitters merged from the sketches with the exact counts of the rollups, and
+  times the queries having an approximate mode in both modes, on the configured dataset.
+
+  Input(s):
+
+    :param: k `int` -- The number of heavy hitters compared -- defaults to 10
+
+    :param: runs `int` -- The number of runs per query and mode -- defaults to 3
+
+    :param: client `MongoClient` -- The client to use -- defaults to the shared client
+
+  Output(s):
+
+    :return: results `list[dict]` -- One entry per dimension with its `query`, the `recall` of the
+    exact top k keys in the approximate top k, the `max_relative_error` of the approximate counts,
+    the `max_error` bound reported, `within_bounds` (every exact count between the reported bounds),
+    and the median `exact_seconds` (raw pipeline) and `approximate_seconds` of the query.
+  '''
+
+  client = get_client() if client is None else client
+
+  results = list()
+
+  for query_name, dimension in __APPROXIMATE_QUERIES__:
+    # bypassing the query result cache
+    query = getattr(nyt_queries, query_name).__wrapped__
+
+    exact_seconds = list()
+    approximate_seconds = list()
+
+    for _ in range(runs):
+      started_at = perf_counter()
+      query(use_rollups=False)
+      exact_seconds.append(perf_counter() - started_at)
+
+      started_at = perf_counter()
+      query(approximate=True)
+      approximate_seconds.append(perf_counter() - started_at)
+
+    exact = dict((dumps(count[nyt_queries.__ID__], sort_keys=True, default=str), count['count'])
+                 for count in __rollup_counts__(client, dimension))
+    exact_top = set(sorted(exact, key=lambda key: -exact[key])[:k])
+
+    approximate = dict((dumps(hitter[nyt_queries.__ID__], sort_keys=True, default=str), hitter)
+                       for hitter in heavy_hitters(dimension, k=k, client=client))
+
+    results.append({
+        'query': query_name,
+        'dimension': dimension,
+        'recall': len(exact_top & set(approximate)) / float(len(exact_top) or 1),
+        'max_relative_error': max([abs(hitter['count'] - exact.get(key, 0)) /
+                                   float(exact.get(key) or 1)
+                                   for key, hitter in approximate.items()] or [0.0]),
+        'max_error': max([hitter['error'] for hitter in approximate.values()] or [0]),
+        'within_bounds': all(hitter['lower'] <= exact.get(key, 0) <= hitter['count']
+                             for key, hitter in approximate.items()),
+        'exact_seconds': median(exact_seconds),
+        'approximate_seconds': median(approximate_seconds)
+    })
+
+  return results
+
+
+# The queries of the column snapshot, with their sample arguments and the MongoDB arguments
+__COLUMN_QUERIES__ = (('xpage_articles', (1,), ()),
+                      ('longest_article', (), ()),
+                      ('count_original_articles', (), (False,)),
+                      ('most_section', (), (False,)),
+                      ('list_articles_type_of_materials', (), (False,)),
+                      ('front_page_articles', ('2005-09-11', '2005-10-01'), ()))
+
+
+# the ids, or the counts, of a query result
+def __result_keys__(result):
+  '''
+  __result_keys__(result) -> list
+  '''
+
+  results = result if isinstance(result, list) else [result]
+
+  return sorted(str(item.get(nyt_queries.__ID__)) + ':' + str(
+      [value for key, value in sorted(item.items()) if key.endswith('count')])
+      for item in results if item is not None)
+
+
+# Comparing the column snapshot with MongoDB
+def benchmark_columns(snapshot_dir, runs=__BENCHMARK_RUNS__):
+  '''
+  benchmark_columns(snapshot_dir, runs=3) -> list[dict]
+
+  Times the queries of the column snapshot against the raw MongoDB queries (bypassing the query
+  cache and the rollups) on the configured dataset.
+
+  Input(s):
+
+    :param: snapshot_dir `str` -- The directory written by `nyt_columns.build_column_snapshot`
+
+    :param: runs `int` -- The number of runs per query and engine -- defaults to 3
+
+  Output(s):
+
+    :return: results `list[dict]` -- One entry per query with its `query` name, the median
+    `mongo_seconds` and `column_seconds`, the `speedup` and `consistent` (both found the same
+    articles, or the same counts)
+  '''
+
+  snapshot = ColumnSnapshot(snapshot_dir)
+
+  if snapshot.is_stale():
+    warning('The column snapshot is older than the dataset, the results may differ')
+
+  results = list()
+
+  for query_name, arguments, mongo_arguments in __COLUMN_QUERIES__:
+    mongo_query = getattr(nyt_queries, query_name).__wrapped__
+    column_query = getattr(snapshot, query_name)
+
+    mongo_seconds = list()
+    column_seconds = list()
+
+    for _ in range(runs):
+      started_at = perf_counter()
+      mongo_result = mongo_query(*(arguments + mongo_arguments))
+      mongo_seconds.append(perf_counter() - started_at)
+
+      started_at = perf_counter()
+      column_result = column_query(*arguments)
+      column_seconds.append(perf_counter() - started_at)
+
+    # Query#15 returns any 10 front page articles, only their number is comparable
+    if query_name == 'front_page_articles':
+      consistent = len(mongo_result) == len(column_result)
+    else:
+      consistent = __result_keys__(mongo_result) == __result_keys__(column_result)
+
+    results.append({
+        'query': query_name,
+        'mongo_seconds': median(mongo_seconds),
+        'column_seconds': median(column_seconds),
+        'speedup': median(mongo_seconds) / max(median(column_seconds), 1e-9),
+        'consistent': consistent
+    })
+
+  return results
+
+
+# The queries of the partitioned aggregation
+__PARALLEL_QUERIES__ = ('most_organization', 'most_productive_reporter', 'most_section',
+                        'list_articles_type_of_materials')
+
+
+# Timing the partitioned aggregation against the single pipeline
+def benchmark_parallel_aggregation(workers=(1, 2, 4, 8), partitions=None,
+                                   runs=__BENCHMARK_RUNS__):
+  '''
+  benchmark_parallel_aggregation(workers=(1, 2, 4, 8), partitions=None, runs=3) -> list[dict]
+
+  Times the raw `$group` pipelines of Query#7, 11, 12 and 13 (bypassing the query cache, the
+  rollups and the sketches) as one pipeline, then partitioned (see
+  `nyt_queries.set_parallel_aggregation`) with every number of workers, on the configured dataset.
+
+  Input(s):
+
+    :param: workers `tuple[int]` -- The numbers of workers measured -- defaults to 1, 2, 4 and 8
+
+    :param: partitions `int` -- The number of date ranges -- defaults to 4 per worker
+
+    :param: runs `int` -- The number of runs per query and setting -- defaults to 3
+
+  Output(s):
+
+    :return: results `list[dict]` -- One entry per query and number of workers with its `query`,
+    `workers`, `partitions`, the median `single_seconds` and `partitioned_seconds`, the `speedup`,
+    the `cores` of the client and `consistent` (both returned the same counts)
+  '''
+
+  results = list()
+
+  try:
+    for query_name in __PARALLEL_QUERIES__:
+      query = getattr(nyt_queries, query_name).__wrapped__
+
+      set_parallel_aggregation(enabled=False)
+
+      single_seconds = list()
+
+      for _ in range(runs):
+        started_at = perf_counter()
+        single_result = query(use_rollups=False)
+        single_seconds.append(perf_counter() - started_at)
+
+      for worker_count in workers:
+        set_parallel_aggregation(workers=worker_count, partitions=partitions)
+
+        partitioned_seconds = list()
+
+        for _ in range(runs):
+          started_at = perf_counter()
+          partitioned_result = query(use_rollups=False)
+          partitioned_seconds.append(perf_counter() - started_at)
+
+        results.append({
+            'query': query_name,
+            'workers': worker_count,
+            'partitions': nyt_queries.__PARALLEL_AGGREGATION__['partitions'],
+            'single_seconds': median(single_seconds),
+            'partitioned_seconds': median(partitioned_seconds),
+            'speedup': median(single_seconds) / max(median(partitioned_seconds), 1e-9),
+            'cores': cpu_count(),
+            'consistent': __result_counts__(single_result) == __result_counts__(partitioned_result)
+        })
+  finally:
+    set_parallel_aggregation(enabled=False)
+
+  return results
+
+
+# Loading a synthetic corpus
+def load_synthetic_corpus(size, seed=__DEFAULT_SEED__, client=None):
+  '''
+  load_synthetic_corpus(size, seed=185, client=None) -> dict
+
+  Loads `size` synthetic articles into the archives collection the way the ingest does: normalized,
+  with the rollups, the sketches and the manifest of every month, and the entity catalog.
+
+  Input(s):
+
+    :param: size `int` -- The number of articles
+
+    :param: seed `int` -- The seed of the corpus -- defaults to 185
+
+    :param: client `MongoClient` -- The client to use -- defaults to the shared client
+
+  Output(s):
+
+    :return: load_report `dict` -- The `documents` loaded, the `seconds` it took and the
+    `docs_per_second`
+  '''
+
+  client = get_client() if client is None else client
+
+  collection = client.get_database(nyt_queries.__DATABASE_NAME__).get_collection(
+      nyt_queries.__COLLECTION_NAME__, write_concern=WriteConcern(w=1, j=False))
+
+  started_at = perf_counter()
+
+  documents = 0
+
+  for year, month, count in month_sizes(size):
+    rollups = dict()
+
+    articles = (__count_rollups__(rollups, normalize_document(article))
+                for article in generate_month(year, month, count, seed=seed))
+
+    for batch, _ in __batches__(articles, __LOAD_BATCH_SIZE__):
+      collection.insert_many(batch, ordered=False)
+      documents += len(batch)
+
+    __write_rollups__(client, year, month, rollups)
+    __write_sketches__(client, year, month, rollups)
+    __mark_month__(client, year, month, __MONTH_DONE__, count=count, rollups=True, sketches=True,
+                   distinct=True, document_type_rollups=True, error=None)
+
+  __bump_generation__(client)
+  build_entity_catalog(client)
+
+  seconds = perf_counter() - started_at
+
+  warning('Loaded {documents} synthetic articles in {seconds:.2f}s'.format(
+      documents=documents, seconds=seconds))
+
+  return {
+      'documents': documents,
+      'seconds': seconds,
+      'docs_per_second': documents / seconds if seconds > 0 else 0.0
+  }
+
+
+# the nearest-rank percentile
+def __percentile__(values, percent):
+  '''
+  __percentile__(values, percent) -> float
+  '''
+
+  ordered = sorted(values)
+
+  return ordered[max(0, int(ceil(percent / 100.0 * len(ordered))) - 1)]
+
+
+# the current resident set size of the process
+def __rss_kb__():
+  '''
+  __rss_kb__() -> int
+
+  The current RSS of the benchmark process in KB, read from `/proc/self/statm`. None where procfs
+  is not available. Unlike `ru_maxrss`, the peak of the process lifetime, it goes down as well as
+  up, so the difference around a query is what that query holds.
+  '''
+
+  try:
+    with open(__STATM_PATH__, 'r') as statm:
+      resident_pages = int(statm.read().split()[1])
+  except (OSError, IndexError, ValueError):
+    return None
+
+  return resident_pages * sysconf('SC_PAGE_SIZE') // 1024
+
+
+# Dropping the collections of a benchmark corpus
+def __drop_corpus__(client):
+  '''
+  __drop_corpus__(client)
+  '''
+
+  db = client.get_database(nyt_queries.__DATABASE_NAME__)
+
+  for suffix in ('', __ROLLUPS_SUFFIX__, __SKETCHES_SUFFIX__, __ENTITIES_SUFFIX__,
+                 __MANIFEST_SUFFIX__, __GENERATION_SUFFIX__):
+    db.drop_collection(nyt_queries.__COLLECTION_NAME__ + suffix)
+
+
+# Timing the queries on one corpus
+def __time_queries__(client, queries, runs):
+  '''
+  __time_queries__(client, queries, runs) -> list[dict]
+
+  Runs every query once under the profiler, for the documents and keys it examines, then `runs`
+  times without it for the latencies. `rss_delta_kb` is the largest growth of the current RSS of
+  the process over a run, measured while the result is still held, see `__rss_kb__`.
+  '''
+
+  results = list()
+
+  with profiling(client) as profile:
+    examined = list()
+
+    for query_name, arguments, kwargs in queries:
+      # bypassing the query result cache
+      query = getattr(nyt_queries, query_name).__wrapped__
+      _, entries, _ = profiled_call(profile, query, *arguments, **kwargs)
+      examined.append((sum(entry.get('docsExamined', 0) for entry in entries),
+                       sum(entry.get('keysExamined', 0) for entry in entries)))
+
+  for (query_name, arguments, kwargs), (docs_examined, keys_examined) in zip(queries, examined):
+    query = getattr(nyt_queries, query_name).__wrapped__
+
+    latencies = list()
+    rss_deltas = list()
+
+    for _ in range(runs):
+      rss_before = __rss_kb__()
+      started_at = perf_counter()
+      result = query(*arguments, **kwargs)
+      latencies.append(perf_counter() - started_at)
+      rss_after = __rss_kb__()
+      del result
+
+      if rss_before is not None and rss_after is not None:
+        rss_deltas.append(rss_after - rss_before)
+
+    results.append({
+        'query': query_name if len(kwargs) == 0 else '{query}({kwargs})'.format(
+            query=query_name, kwargs=', '.join('{key}={value}'.format(key=key, value=value)
+                                               for key, value in sorted(kwargs.items()))),
+        'p50_ms': __percentile__(latencies, 50) * 1000.0,
+        'p95_ms': __percentile__(latencies, 95) * 1000.0,
+        'docs_examined': docs_examined,
+        'keys_examined': keys_examined,
+        'rss_delta_kb': max(rss_deltas) if len(rss_deltas) > 0 else None
+    })
+
+  return results
+
+
+# Benchmarking the queries over synthetic corpora
+def benchmark_queries(sizes=__BENCHMARK_SIZES__[:1], seed=__DEFAULT_SEED__, runs=5,
+                      queries=None, report_path=None, keep=False):
+  '''
+  benchmark_queries(sizes=(10000,), seed=185, runs=5, queries=None, report_path=None,
+                    keep=False) -> dict
+
+  For every size, loads the synthetic corpus into the `nyt_benchmark` database on the configured
+  mongod and times the queries on it, first without any index and then with `ensure_indexes`. The
+  database and collection the queries work with are restored afterwards.
+
+  Input(s):
+
+    :param: sizes `list[int]` -- The corpus sizes, eg: 10000 to 10000000 -- defaults to 10000
+
+    :param: seed `int` -- The seed of the corpora -- defaults to 185
+
+    :param: runs `int` -- The timed runs per query -- defaults to 5
+
+    :param: queries `list[(str, tuple, dict)]` -- The queries timed -- defaults to
+    `BENCHMARK_QUERIES`
+
+    :param: report_path `str` -- Where to write the JSON report -- defaults to None, not written
+
+    :param: keep `bool` -- Keep the corpora once benchmarked -- defaults to False
+
+  Output(s):
+
+    :return: report `dict` -- The `seed`, `runs`, `sizes`, the `loads` of the corpora and the
+    `results`: one entry per size, indexes and query with the `p50_ms` and `p95_ms` latencies,
+    `docs_examined`, `keys_examined` and the `rss_delta_kb`, the most the current RSS of the client
+    grew over a run of the query.
+  '''
+
+  queries = BENCHMARK_QUERIES if queries is None else queries
+
+  previous_names = (nyt_queries.__HOSTNAME__, nyt_queries.__PORT__,
+                    nyt_queries.__DATABASE_NAME__, nyt_queries.__COLLECTION_NAME__)
+
+  report = {
+      'generated_at': datetime.utcnow().isoformat() + 'Z',
+      'seed': seed,
+      'runs': runs,
+      'sizes': list(sizes),
+      'loads': list(),
+      'results': list()
+  }
+
+  try:
+    for size in sizes:
+      set_db_collection_names(hostname=previous_names[0], port=previous_names[1],
+                              database_name=__BENCHMARK_DATABASE__,
+                              collection_name=__BENCHMARK_COLLECTION__.format(size=size))
+
+      client = get_client()
+
+      __drop_corpus__(client)
+
+      load_report = load_synthetic_corpus(size, seed=seed, client=client)
+      load_report['size'] = size
+      report['loads'].append(load_report)
+
+      collection = client.get_database(nyt_queries.__DATABASE_NAME__)[
+          nyt_queries.__COLLECTION_NAME__]
+
+      for indexes in (False, True):
+        if indexes:
+          ensure_indexes(client, background=False)
+        else:
+          collection.drop_indexes()
+
+        for result in __time_queries__(client, queries, runs):
+          result.update({'size': size, 'indexes': indexes})
+          report['results'].append(result)
+
+        warning('Benchmarked {count} queries on {size} articles {indexes} indexes'.format(
+            count=len(queries), size=size, indexes='with' if indexes else 'without'))
+
+      if not keep:
+        __drop_corpus__(client)
+  finally:
+    set_db_collection_names(*previous_names)
+
+  if report_path is not None:
+    with open(report_path, 'w') as report_file:
+      dump(report, report_file, indent=2)
+
+  return report
+
+
+if __name__ == '__main__':
+  basicConfig(format='%(asctime)s %(message)s')
+
+  parser = ArgumentParser(description='Benchmarks the NYT archiver queries on synthetic corpora')
+  parser.add_argument('-host', '--hostname', default=nyt_queries.__HOSTNAME__)
+  parser.add_argument('-p', '--port', default=nyt_queries.__PORT__)
+  parser.add_argument('-s', '--sizes', type=int, nargs='+', default=list(__BENCHMARK_SIZES__[:1]),
+                      help='corpus sizes, eg: 10000 100000 1000000 10000000')
+  parser.add_argument('--seed', type=int, default=__DEFAULT_SEED__)
+  parser.add_argument('-r', '--runs', type=int, default=5, help='timed runs per query')
+  parser.add_argument('-o', '--report', default='benchmark.json', help='path of the JSON report')
+  parser.add_argument('--keep', action='store_true', help='keep the corpora in the database')
+
+  args = parser.parse_args()
+
+  set_db_collection_names(hostname=args.hostname, port=args.port,
+                          database_name=nyt_queries.__DATABASE_NAME__,
+                          collection_name=nyt_queries.__COLLECTION_NAME__)
+
+  benchmark_report = benchmark_queries(sizes=args.sizes, seed=args.seed, runs=args.runs,
+                                       report_path=args.report, keep=args.keep)
+
+  for result in benchmark_report['results']:
+    print('{size:>9} {indexes!s:>5} {query:<52} p50 {p50_ms:9.2f}ms p95 {p95_ms:9.2f}ms '
+          '{docs_examined:>9} docs {keys_examined:>9} keys'.format(**result))
@@ -0,0 +1,227 @@
+# nyt_cache.py
+# -*- coding: utf-8 -*-
+
+
+'''
+On-disk cache of the raw NYT archives API responses.
+
+Every month is stored gzip compressed as `<cache_dir>/<yyyy>/<mm>.json.gz`, exactly as it was sent
+by the API. The archives of past months never change, so rebuilding the dataset (new indexes, a
+schema change or a different collection) can replay the months from the local disk instead of
+calling the API again. The current month still grows, it is only cached once it has closed in New
+York time.
+'''
+
+# python standard library imports
+from datetime import datetime
+from datetime import timedelta
+from os import makedirs
+from os import remove
+from os import replace
+from os.path import dirname
+from os.path import exists
+from os.path import getsize
+from os.path import join
+from threading import Lock
+from tempfile import mkstemp
+import gzip
+
+
+# Constants
+__CACHE_FILE_FORMAT__ = '{month:02d}.json.gz'
+__CACHE_YEAR_FORMAT__ = '{year:04d}'
+__COMPRESS_LEVEL__ = 6
+__DRAIN_CHUNK_SIZE__ = 64 * 1024
+# the UTC offset of New York standard time, the latest a month of the archives API closes
+__NEW_YORK_CLOSE_DELAY__ = timedelta(hours=5)
+
+
+# Whether the archives of a month are final
+def __month_closed__(year, month, now=None):
+  '''
+  __month_closed__(year, month, now=None) -> bool
+
+  True once the month is over in New York time, the API keeps adding articles to the current month
+  until then. Daylight saving time is ignored, a month closes at most an hour later than it does.
+
+  Input(s):
+
+    :param: now `datetime` -- The current naive UTC time -- defaults to `datetime.utcnow()`
+  '''
+
+  now = datetime.utcnow() if now is None else now
+  next_year, next_month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+  return now >= datetime(next_year, next_month, 1) + __NEW_YORK_CLOSE_DELAY__
+
+
+# Writing a response to the cache while it is being read
+class __CachingReader__(object):
+  '''
+  __CachingReader__(stream, path, on_commit)
+
+  Wraps the binary API response and copies every chunk read through it into a gzip file next to
+  `path`. The file is moved into `path` on `close()` only if the response was read to the end
+  without errors, so an interrupted download never leaves a truncated month in the cache.
+  '''
+
+  def __init__(self, stream, path, on_commit):
+    self.stream = stream
+    self.path = path
+    self.on_commit = on_commit
+    self.complete = False
+    self.written = 0
+
+    descriptor, self.temp_path = mkstemp(dir=dirname(path), suffix='.part')
+    self.cache_file = gzip.GzipFile(fileobj=open(descriptor, 'wb'), mode='wb',
+                                    compresslevel=__COMPRESS_LEVEL__)
+
+  def read(self, size=-1):
+    chunk = self.stream.read(size)
+
+    if chunk:
+      self.cache_file.write(chunk)
+      self.written += len(chunk)
+    elif size != 0:
+      self.complete = True
+
+    return chunk
+
+  def close(self, commit=True):
+    '''
+    close(commit=True)
+
+    Closes the response. With `commit`, whatever the reader left unread (usually trailing
+    whitespace) is copied too and the month is moved into the cache. Without it, or if the
+    response couldn't be read to the end, the partial file is discarded.
+    '''
+
+    if self.cache_file is None:
+      return
+
+    try:
+      while commit and not self.complete:
+        self.read(__DRAIN_CHUNK_SIZE__)
+    finally:
+      self.stream.close()
+
+      raw_file = self.cache_file.fileobj
+      self.cache_file.close()
+      raw_file.close()
+      self.cache_file = None
+
+      if commit and self.complete:
+        replace(self.temp_path, self.path)
+        self.on_commit(self.written)
+      else:
+        remove(self.temp_path)
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close(commit=exc_type is None)
+    return False
+
+
+class ArchivesCache(object):
+  '''
+  ArchivesCache(cache_dir, replay=False)
+
+  The cache of raw archives API responses, keyed by year and month.
+
+  Input(s):
+
+    :param: cache_dir `str` -- The directory holding the cached months
+
+    :param: replay `bool` -- Offline mode, months missing from the cache raise a
+    `FileNotFoundError` instead of being downloaded -- defaults to False
+  '''
+
+  def __init__(self, cache_dir, replay=False):
+    self.cache_dir = cache_dir
+    self.replay = replay
+    self._lock = Lock()
+    self._stats = {'hits': 0, 'misses': 0, 'bytes_read': 0, 'bytes_written': 0}
+
+  def path(self, year, month):
+    '''
+    path(year, month) -> str
+
+    The path of the cached response for the year, month.
+    '''
+
+    return join(self.cache_dir,
+                __CACHE_YEAR_FORMAT__.format(year=year),
+                __CACHE_FILE_FORMAT__.format(month=month))
+
+  def __count__(self, **increments):
+    with self._lock:
+      for key, increment in increments.items():
+        self._stats[key] += increment
+
+  def open(self, year, month):
+    '''
+    open(year, month) -> file-like
+
+    Opens the cached response for the year, month.
+
+    Output(s):
+
+      :return: cached_response `GzipFile` -- The decompressed response, or None on a cache miss.
+      In replay mode a miss raises `FileNotFoundError`. A month not closed yet is a miss unless
+      replaying, it may have been cached before it grew.
+    '''
+
+    path = self.path(year, month)
+
+    if not exists(path) or (not self.replay and not __month_closed__(year, month)):
+      self.__count__(misses=1)
+
+      if self.replay:
+        raise FileNotFoundError('year:{year} month:{month} is not in the cache at {path}'.format(
+            year=year, month=month, path=path))
+
+      return None
+
+    self.__count__(hits=1, bytes_read=getsize(path))
+
+    return gzip.open(path, 'rb')
+
+  def record(self, year, month, stream):
+    '''
+    record(year, month, stream) -> file-like
+
+    Wraps the API response for the year, month so that it is saved in the cache as it is read. The
+    response of a month not closed yet (see `__month_closed__`) is returned as it is, uncached.
+
+    Output(s):
+
+      :return: response `file-like` -- Read and close it like the original response.
+    '''
+
+    if not __month_closed__(year, month):
+      return stream
+
+    path = self.path(year, month)
+
+    makedirs(dirname(path), exist_ok=True)
+
+    return __CachingReader__(stream, path,
+                             lambda written: self.__count__(bytes_written=written))
+
+  def stats(self):
+    '''
+    stats() -> dict
+
+    The cache metrics since the cache was created: `hits`, `misses`, `bytes_read` (compressed
+    bytes replayed from disk), `bytes_written` (raw bytes saved) and the `hit_ratio`.
+    '''
+
+    with self._lock:
+      stats = dict(self._stats)
+
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_ratio'] = stats['hits'] / lookups if lookups > 0 else 0.0
+
+    return stats
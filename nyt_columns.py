@@ -0,0 +1,497 @@
+# nyt_columns.py
+# -*- coding: utf-8 -*-
+
+
+'''
+Columnar snapshot of the low cardinality scalar fields of the archives, and the in-process engine
+answering the queries that only touch them without MongoDB.
+
+`build_column_snapshot` streams the archives collection once and writes every field as a NumPy
+column, one `.npy` file per column:
+
+  `pub_datetime` -- the milliseconds since the epoch, int64
+  `page`, `word_count` -- int32, -1 when missing
+  `section_name`, `type_of_material`, `source`, `document_type` -- dictionary encoded, the codes
+  in the smallest unsigned int type and the values in `dictionaries.json`
+  `_id` -- the ids as UTF-8, the bytes of every id between two `offsets`
+
+`ColumnSnapshot` opens the columns memory mapped, so opening a snapshot reads nothing and the
+resident memory only grows with the pages of the columns a query touches. Its queries mirror
+Query#6, 8, 9, 12, 13 and 15 of `nyt_queries` with vectorized masks and `bincount`, and return the
+snapshot fields of the matching articles instead of the documents, their `_id` fetches the rest
+from MongoDB when needed.
+
+NumPy is optional for the rest of the NYT archiver, it is only needed here.
+'''
+
+# python standard library imports
+from datetime import datetime
+from datetime import timedelta
+from json import dump
+from json import load
+from logging import warning
+from time import perf_counter
+import os
+import shutil
+
+try:
+  import numpy as np
+except ImportError:  # the column snapshot is the only other part of the archiver needing numpy
+  np = None
+
+
+# NYT Archiver imports
+import nyt_queries
+from nyt_queries import get_client
+from nyt_queries import dataset_generation
+from nyt_queries import __batches__
+from nyt_queries import __ID__
+from nyt_queries import __PUB_DATETIME__
+from nyt_queries import __PAGE__
+from nyt_queries import __WORD_COUNT__
+from nyt_queries import __SECTION_NAME__
+from nyt_queries import __TYPE_OF_MATERIAL__
+from nyt_queries import __SOURCE__
+from nyt_queries import __DOCUMENT_TYPE__
+from nyt_queries import __DATE_FORMAT__
+
+
+# Constants
+__SNAPSHOT_MANIFEST__ = 'snapshot.json'
+__DICTIONARIES__ = 'dictionaries.json'
+__COLUMN_FILE__ = '{column}.npy'
+__RAW_FILE__ = '{column}.raw'
+__ID_OFFSETS__ = '_id_offsets'
+__ID_BYTES__ = '_id_bytes'
+__BUILDING_SUFFIX__ = '.building'
+__SCAN_BATCH_SIZE__ = 10000
+__COPY_ROWS__ = 1 << 20
+__MISSING_INT__ = -1
+__MISSING_DATETIME__ = -(1 << 63)
+__EPOCH__ = datetime(1970, 1, 1)
+__MS__ = timedelta(milliseconds=1)
+__FRONT_PAGE_LIMIT__ = 10
+
+
+# The int columns, (column, dtype)
+__INT_COLUMNS__ = ((__PUB_DATETIME__, 'int64'), (__PAGE__, 'int32'), (__WORD_COUNT__, 'int32'))
+
+
+# The dictionary encoded columns
+__DICTIONARY_COLUMNS__ = (__SECTION_NAME__, __TYPE_OF_MATERIAL__, __SOURCE__, __DOCUMENT_TYPE__)
+
+
+# NumPy is an optional dependency
+def __require_numpy__():
+  '''
+  __require_numpy__()
+
+  Raises an ImportError explaining how to get NumPy when it is not installed.
+  '''
+
+  if np is None:
+    raise ImportError('The column snapshot needs NumPy, install it with `pip install numpy`')
+
+
+# an int column value
+def __as_int__(value):
+  '''
+  __as_int__(value) -> int
+
+  The int of the value, `__MISSING_INT__` when it isn't a number.
+  '''
+
+  if isinstance(value, bool) or value is None:
+    return __MISSING_INT__
+
+  try:
+    return int(value)
+  except (TypeError, ValueError):
+    return __MISSING_INT__
+
+
+# the milliseconds since the epoch of a date
+def __epoch_ms__(value):
+  '''
+  __epoch_ms__(value) -> int
+  '''
+
+  if not isinstance(value, datetime):
+    return __MISSING_DATETIME__
+
+  return (value.replace(tzinfo=None) - __EPOCH__) // __MS__
+
+
+# a dictionary encoded column value
+def __as_key__(value):
+  '''
+  __as_key__(value) -> str
+
+  The strings and None as they are, anything else as its string.
+  '''
+
+  return value if value is None or isinstance(value, str) else str(value)
+
+
+# Copying a raw column file into a `.npy` column
+def __finish_column__(directory, column, raw_dtype, dtype, rows):
+  '''
+  __finish_column__(directory, column, raw_dtype, dtype, rows)
+
+  Copies the raw values appended during the scan into the `.npy` column, converted to `dtype`, a
+  chunk at a time.
+  '''
+
+  raw_path = os.path.join(directory, __RAW_FILE__.format(column=column))
+
+  target = np.lib.format.open_memmap(os.path.join(directory, __COLUMN_FILE__.format(column=column)),
+                                     mode='w+', dtype=dtype, shape=(rows,))
+
+  if rows > 0:
+    source = np.memmap(raw_path, dtype=raw_dtype, mode='r', shape=(rows,))
+
+    for start in range(0, rows, __COPY_ROWS__):
+      target[start:start + __COPY_ROWS__] = source[start:start + __COPY_ROWS__]
+
+    del source
+
+  target.flush()
+  del target
+
+  os.remove(raw_path)
+
+  return
+
+
+# Building the column snapshot
+def build_column_snapshot(out_dir, batch_size=__SCAN_BATCH_SIZE__, client=None):
+  '''
+  build_column_snapshot(out_dir, batch_size=10000, client=None) -> dict
+
+  Writes the column snapshot of the archives collection (see the module documentation). The
+  collection is scanned once, a batch at a time, and the columns are appended to raw files, so the
+  memory used doesn't grow with the archives. The snapshot is built next to `out_dir` and replaces
+  it once complete.
+
+  Input(s):
+
+    :param: out_dir `str` -- The snapshot directory
+
+    :param: batch_size `int` -- The articles converted at a time -- defaults to 10000
+
+    :param: client `MongoClient` -- The client to use -- defaults to the shared client
+
+  Output(s):
+
+    :return: manifest `dict` -- The `rows`, the dataset `generation` the snapshot was taken from,
+    the `columns` and their dtypes, the `bytes` of the columns and the `seconds` it took
+  '''
+
+  __require_numpy__()
+
+  client = get_client() if client is None else client
+
+  collection = client.get_database(nyt_queries.__DATABASE_NAME__)[nyt_queries.__COLLECTION_NAME__]
+
+  started_at = perf_counter()
+
+  generation = dataset_generation(client)
+
+  directory = out_dir.rstrip(os.sep) + __BUILDING_SUFFIX__
+
+  shutil.rmtree(directory, ignore_errors=True)
+  os.makedirs(directory)
+
+  columns = [column for column, _ in __INT_COLUMNS__] + list(__DICTIONARY_COLUMNS__) + \
+      [__ID_OFFSETS__, __ID_BYTES__]
+
+  raw_files = dict((column, open(os.path.join(directory, __RAW_FILE__.format(column=column)), 'wb'))
+                   for column in columns)
+
+  dictionaries = dict((column, dict()) for column in __DICTIONARY_COLUMNS__)
+
+  rows = 0
+  id_bytes = 0
+
+  fields = dict((column, True) for column in columns if not column.startswith(__ID__))
+
+  try:
+    raw_files[__ID_OFFSETS__].write(np.zeros(1, dtype='int64').tobytes())
+
+    cursor = collection.find({}, fields, batch_size=batch_size)
+
+    for batch, _ in __batches__(cursor, batch_size):
+      raw_files[__PUB_DATETIME__].write(np.array(
+          [__epoch_ms__(document.get(__PUB_DATETIME__)) for document in batch],
+          dtype='int64').tobytes())
+
+      for column in (__PAGE__, __WORD_COUNT__):
+        raw_files[column].write(np.array([__as_int__(document.get(column)) for document in batch],
+                                         dtype='int32').tobytes())
+
+      for column, dictionary in dictionaries.items():
+        codes = [dictionary.setdefault(__as_key__(document.get(column)), len(dictionary))
+                 for document in batch]
+        raw_files[column].write(np.array(codes, dtype='int64').tobytes())
+
+      ids = [str(document[__ID__]).encode('utf-8') for document in batch]
+      lengths = np.fromiter((len(document_id) for document_id in ids), dtype='int64',
+                            count=len(ids))
+
+      raw_files[__ID_OFFSETS__].write((id_bytes + np.cumsum(lengths)).tobytes())
+      raw_files[__ID_BYTES__].write(b''.join(ids))
+
+      id_bytes += int(lengths.sum())
+      rows += len(batch)
+  finally:
+    for raw_file in raw_files.values():
+      raw_file.close()
+
+  dtypes = dict()
+
+  for column, dtype in __INT_COLUMNS__:
+    __finish_column__(directory, column, dtype, dtype, rows)
+    dtypes[column] = dtype
+
+  for column, dictionary in dictionaries.items():
+    dtype = np.min_scalar_type(max(len(dictionary) - 1, 0)).name
+    __finish_column__(directory, column, 'int64', dtype, rows)
+    dtypes[column] = dtype
+
+  __finish_column__(directory, __ID_OFFSETS__, 'int64', 'int64', rows + 1)
+  __finish_column__(directory, __ID_BYTES__, 'uint8', 'uint8', id_bytes)
+  dtypes[__ID_OFFSETS__], dtypes[__ID_BYTES__] = 'int64', 'uint8'
+
+  with open(os.path.join(directory, __DICTIONARIES__), 'w', encoding='utf-8') as dictionaries_file:
+    dump(dict((column, sorted(dictionary, key=dictionary.get))
+              for column, dictionary in dictionaries.items()), dictionaries_file)
+
+  manifest = {
+      'rows': rows,
+      'generation': generation,
+      'columns': dtypes,
+      'bytes': sum(os.path.getsize(os.path.join(directory, __COLUMN_FILE__.format(column=column)))
+                   for column in dtypes),
+      'built_at': datetime.utcnow().isoformat(),
+      'seconds': perf_counter() - started_at
+  }
+
+  with open(os.path.join(directory, __SNAPSHOT_MANIFEST__), 'w', encoding='utf-8') as manifest_file:
+    dump(manifest, manifest_file, indent=2, sort_keys=True)
+
+  shutil.rmtree(out_dir, ignore_errors=True)
+  os.replace(directory, out_dir)
+
+  warning('Built the column snapshot of {rows} articles, {bytes} bytes, in {seconds:.2f}s'.format(
+      **manifest))
+
+  return manifest
+
+
+class ColumnSnapshot(object):
+  '''
+  ColumnSnapshot(directory)
+
+  The memory mapped column snapshot written by `build_column_snapshot`, and the vectorized queries
+  over it. The columns are mapped on first use.
+
+  Input(s):
+
+    :param: directory `str` -- The snapshot directory
+  '''
+
+  def __init__(self, directory):
+    __require_numpy__()
+
+    self.directory = directory
+
+    with open(os.path.join(directory, __SNAPSHOT_MANIFEST__), 'r', encoding='utf-8') as manifest:
+      self.manifest = load(manifest)
+
+    with open(os.path.join(directory, __DICTIONARIES__), 'r', encoding='utf-8') as dictionaries:
+      self.dictionaries = load(dictionaries)
+
+    self.rows = self.manifest['rows']
+    self._columns = dict()
+
+  def column(self, column):
+    '''
+    column(column) -> ndarray
+
+    The memory mapped, read only column.
+    '''
+
+    if column not in self._columns:
+      self._columns[column] = np.load(
+          os.path.join(self.directory, __COLUMN_FILE__.format(column=column)), mmap_mode='r')
+
+    return self._columns[column]
+
+  def code(self, column, value):
+    '''
+    code(column, value) -> int
+
+    The code of the value in a dictionary encoded column, None when no article has it.
+    '''
+
+    dictionary = self.dictionaries[column]
+
+    return dictionary.index(value) if value in dictionary else None
+
+  def equals(self, column, value):
+    '''
+    equals(column, value) -> ndarray
+
+    The mask of the articles whose dictionary encoded column is the value.
+    '''
+
+    code = self.code(column, value)
+
+    if code is None:
+      return np.zeros(self.rows, dtype=bool)
+
+    return self.column(column) == code
+
+  def is_stale(self, client=None):
+    '''
+    is_stale(client=None) -> bool
+
+    Whether the archives were ingested or updated since the snapshot was built.
+    '''
+
+    return self.manifest['generation'] != dataset_generation(client)
+
+  def article_id(self, row):
+    '''
+    article_id(row) -> str
+    '''
+
+    offsets = self.column(__ID_OFFSETS__)
+
+    return bytes(self.column(__ID_BYTES__)[offsets[row]:offsets[row + 1]]).decode('utf-8')
+
+  def articles(self, rows):
+    '''
+    articles(rows) -> list[dict]
+
+    The snapshot fields of the articles at the rows, with their `_id`. Every column is gathered
+    once for all the rows.
+    '''
+
+    rows = np.asarray(rows, dtype='int64')
+
+    offsets = self.column(__ID_OFFSETS__)
+    starts, ends = offsets[rows].tolist(), offsets[rows + 1].tolist()
+    # slicing a memoryview of the mapped bytes skips the ndarray views
+    id_bytes = memoryview(self.column(__ID_BYTES__))
+
+    columns = {__ID__: [str(id_bytes[start:end], 'utf-8')
+                        for start, end in zip(starts, ends)]}
+
+    columns[__PUB_DATETIME__] = [__EPOCH__ + pub_datetime * __MS__
+                                 if pub_datetime != __MISSING_DATETIME__ else None
+                                 for pub_datetime in self.column(__PUB_DATETIME__)[rows].tolist()]
+
+    for column in (__PAGE__, __WORD_COUNT__):
+      columns[column] = [value if value != __MISSING_INT__ else None
+                         for value in self.column(column)[rows].tolist()]
+
+    for column in __DICTIONARY_COLUMNS__:
+      dictionary = self.dictionaries[column]
+      columns[column] = [dictionary[code] for code in self.column(column)[rows].tolist()]
+
+    return [dict(zip(columns, values)) for values in zip(*columns.values())]
+
+  def __value_counts__(self, column, mask=None):
+    '''
+    __value_counts__(column, mask=None) -> list[(object, int)]
+
+    The values of the dictionary encoded column with their number of articles, most frequent
+    first, counted by `bincount` over the (masked) codes.
+    '''
+
+    codes = self.column(column) if mask is None else self.column(column)[mask]
+
+    counts = np.bincount(codes, minlength=len(self.dictionaries[column]))
+
+    order = np.argsort(-counts, kind='stable')
+
+    return [(self.dictionaries[column][code], int(counts[code])) for code in order
+            if counts[code] > 0]
+
+  def xpage_articles(self, page_number=1):
+    '''
+    xpage_articles(page_number=1) -> list[dict]
+
+    Query#6: The articles printed on the page.
+    '''
+
+    mask = (self.column(__PAGE__) == int(page_number)) & \
+        self.equals(__DOCUMENT_TYPE__, 'article')
+
+    return self.articles(np.flatnonzero(mask))
+
+  def longest_article(self):
+    '''
+    longest_article() -> dict
+
+    Query#8: The article with the most words, None when there are no articles.
+    '''
+
+    word_counts = np.where(self.equals(__DOCUMENT_TYPE__, 'article'),
+                           self.column(__WORD_COUNT__), __MISSING_INT__ - 1)
+
+    if len(word_counts) == 0 or word_counts.max() < __MISSING_INT__:
+      return None
+
+    return self.articles([np.argmax(word_counts)])[0]
+
+  def count_original_articles(self):
+    '''
+    count_original_articles() -> list[dict]
+
+    Query#9: The number of articles from The New York Times, as `orig_count`.
+    '''
+
+    count = int(np.count_nonzero(self.equals(__SOURCE__, 'The New York Times')))
+
+    return [{__ID__: 'The New York Times', 'orig_count': count}] if count > 0 else list()
+
+  def most_section(self):
+    '''
+    most_section() -> dict
+
+    Query#12: The section with the most articles, as `section_count`.
+    '''
+
+    counts = self.__value_counts__(__SECTION_NAME__, self.equals(__DOCUMENT_TYPE__, 'article'))
+
+    return {__ID__: counts[0][0], 'section_count': counts[0][1]} if counts else None
+
+  def list_articles_type_of_materials(self):
+    '''
+    list_articles_type_of_materials() -> list[dict]
+
+    Query#13: Every type of material with its number of articles, as `count`.
+    '''
+
+    return [{__ID__: value, 'count': count}
+            for value, count in self.__value_counts__(__TYPE_OF_MATERIAL__)]
+
+  def front_page_articles(self, begin_time, end_time):
+    '''
+    front_page_articles(begin_time, end_time) -> list[dict]
+
+    Query#15: Up to 10 front page articles published between the dates, `yyyy-mm-dd`, the end
+    excluded.
+    '''
+
+    begin = __epoch_ms__(datetime.strptime(begin_time, __DATE_FORMAT__))
+    end = __epoch_ms__(datetime.strptime(end_time, __DATE_FORMAT__))
+
+    pub_datetimes = self.column(__PUB_DATETIME__)
+
+    mask = (pub_datetimes >= begin) & (pub_datetimes < end) & (self.column(__PAGE__) == 1) & \
+        self.equals(__DOCUMENT_TYPE__, 'article')
+
+    return self.articles(np.flatnonzero(mask)[:__FRONT_PAGE_LIMIT__])
@@ -0,0 +1,502 @@
+# nyt_export.py
+# -*- coding: utf-8 -*-
+
+
+'''
+Partitioned Parquet and Arrow IPC export of the archives, for the analytics that shouldn't run on
+the operational database.
+
+`export_archives` streams the archives collection, one publication month at a time through a server
+side cursor, into one file per month laid out the Hive way, readable as a single dataset by
+pyarrow, pandas, DuckDB or Spark:
+
+  <out_dir>/year=2005/month=1/part-0.parquet
+
+The scalar fields get typed columns (`pub_datetime` is a timestamp, `page` and `word_count` are
+ints), the keywords and the byline persons are list of struct columns. The months are written in
+parallel by a pool of workers, each holding at most one record batch of articles in memory. The
+`_export.json` manifest of the directory records, per month, the articles exported and the ingest
+manifest entries they came from, so that the next export only writes the months that are new or
+were ingested again or backfilled since.
+
+PyArrow is optional for the rest of the NYT archiver, it is only needed here.
+'''
+
+# python standard library imports
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import as_completed
+from datetime import datetime
+from json import dump
+from json import load
+from logging import warning
+from threading import Lock
+from time import perf_counter
+import os
+
+try:
+  import pyarrow as pa
+  import pyarrow.parquet as pq
+except ImportError:  # the export is the only part of the archiver needing pyarrow
+  pa = None
+  pq = None
+
+
+# NYT Archiver imports
+import nyt_queries
+from nyt_queries import get_client
+from nyt_queries import dataset_generation
+from nyt_queries import read_manifest
+from nyt_queries import __batches__
+from nyt_queries import __ID__
+from nyt_queries import __WEB_URL__
+from nyt_queries import __SNIPPET__
+from nyt_queries import __LEAD_PARAGRAPH__
+from nyt_queries import __ABSTRACT__
+from nyt_queries import __PRINT_PAGE__
+from nyt_queries import __SOURCE__
+from nyt_queries import __HEADLINE__
+from nyt_queries import __HEADLINE_MAIN__
+from nyt_queries import __KEYWORDS__
+from nyt_queries import __KEYWORDS_NAME__
+from nyt_queries import __KEYWORDS_VALUE__
+from nyt_queries import __PUB_DATE__
+from nyt_queries import __DOCUMENT_TYPE__
+from nyt_queries import __NEWS_DESK__
+from nyt_queries import __SECTION_NAME__
+from nyt_queries import __SUBSECTION_NAME__
+from nyt_queries import __BYLINE__
+from nyt_queries import __PERSON__
+from nyt_queries import __FIRSTNAME__
+from nyt_queries import __MIDDLENAME__
+from nyt_queries import __LASTNAME__
+from nyt_queries import __RANK__
+from nyt_queries import __ROLE__
+from nyt_queries import __ORGANIZATION__
+from nyt_queries import __ORIGINAL__
+from nyt_queries import __TYPE_OF_MATERIAL__
+from nyt_queries import __WORD_COUNT__
+from nyt_queries import __PUB_DATETIME__
+from nyt_queries import __PUB_YEAR__
+from nyt_queries import __PUB_MONTH__
+from nyt_queries import __PAGE__
+from nyt_queries import __GROUP__
+from nyt_queries import __SUM__
+from nyt_queries import __COUNT_FIELD__
+
+
+# Constants
+__PARQUET__ = 'parquet'
+__ARROW__ = 'arrow'
+__EXPORT_FORMATS__ = (__PARQUET__, __ARROW__)
+__EXPORT_MANIFEST__ = '_export.json'
+__PART_FILE__ = 'part-0.{extension}'
+__TEMPORARY_SUFFIX__ = '.tmp'
+__UNKNOWN_PARTITION__ = '__HIVE_DEFAULT_PARTITION__'
+__EXPORT_WORKERS__ = 4
+__RECORD_BATCH_SIZE__ = 5000
+__PARQUET_COMPRESSION__ = 'zstd'
+__IS_MAJOR__ = 'is_major'
+__BYLINE_ORIGINAL__ = 'byline_original'
+__PERSONS__ = 'persons'
+
+
+# The string columns copied as they are
+__STRING_COLUMNS__ = (__WEB_URL__, __SNIPPET__, __LEAD_PARAGRAPH__, __ABSTRACT__, __PRINT_PAGE__,
+                      __SOURCE__, __DOCUMENT_TYPE__, __NEWS_DESK__, __SECTION_NAME__,
+                      __SUBSECTION_NAME__, __TYPE_OF_MATERIAL__)
+
+
+# PyArrow is an optional dependency
+def __require_pyarrow__():
+  '''
+  __require_pyarrow__()
+
+  Raises an ImportError explaining how to get PyArrow when it is not installed.
+  '''
+
+  if pa is None:
+    raise ImportError('The export needs PyArrow, install it with `pip install pyarrow`')
+
+
+# The schema of the exported articles
+def archive_schema():
+  '''
+  archive_schema() -> pyarrow.Schema
+
+  The Arrow schema of the exported articles.
+  '''
+
+  __require_pyarrow__()
+
+  keyword = pa.struct([(__KEYWORDS_NAME__, pa.string()), (__KEYWORDS_VALUE__, pa.string()),
+                       (__RANK__, pa.int32()), (__IS_MAJOR__, pa.string())])
+
+  person = pa.struct([(__FIRSTNAME__, pa.string()), (__MIDDLENAME__, pa.string()),
+                      (__LASTNAME__, pa.string()), (__ROLE__, pa.string()),
+                      (__ORGANIZATION__, pa.string()), (__RANK__, pa.int32())])
+
+  return pa.schema(
+      [(__ID__, pa.string()),
+       (__PUB_DATETIME__, pa.timestamp('ms')),
+       (__PUB_YEAR__, pa.int16()),
+       (__PUB_MONTH__, pa.int8()),
+       (__PUB_DATE__, pa.string()),
+       (__HEADLINE__, pa.string())] +
+      [(column, pa.string()) for column in __STRING_COLUMNS__] +
+      [(__PAGE__, pa.int32()),
+       (__WORD_COUNT__, pa.int32()),
+       (__KEYWORDS__, pa.list_(keyword)),
+       (__PERSONS__, pa.list_(person)),
+       (__BYLINE_ORIGINAL__, pa.string())])
+
+
+# an int from the loosely typed API fields
+def __as_int__(value):
+  '''
+  __as_int__(value) -> int
+
+  The API returns some counts and ranks as strings, None when it isn't a number.
+  '''
+
+  if isinstance(value, bool) or value is None:
+    return None
+
+  try:
+    return int(value)
+  except (TypeError, ValueError):
+    return None
+
+
+# a string from the loosely typed API fields
+def __as_str__(value):
+  '''
+  __as_str__(value) -> str
+  '''
+
+  return None if value is None or isinstance(value, (dict, list)) else str(value)
+
+
+# The exported row of an article
+def __export_row__(document):
+  '''
+  __export_row__(document) -> dict
+
+  Flattens the (normalized) article into a row of `archive_schema`.
+  '''
+
+  headline = document.get(__HEADLINE__)
+  byline = document.get(__BYLINE__)
+  byline = byline if isinstance(byline, dict) else dict()
+
+  row = {
+      __ID__: str(document.get(__ID__)),
+      __PUB_DATETIME__: document.get(__PUB_DATETIME__),
+      __PUB_YEAR__: document.get(__PUB_YEAR__),
+      __PUB_MONTH__: document.get(__PUB_MONTH__),
+      __PUB_DATE__: __as_str__(document.get(__PUB_DATE__)),
+      __HEADLINE__: __as_str__(headline.get(__HEADLINE_MAIN__))
+      if isinstance(headline, dict) else __as_str__(headline),
+      __PAGE__: document.get(__PAGE__),
+      __WORD_COUNT__: __as_int__(document.get(__WORD_COUNT__)),
+      __KEYWORDS__: [{
+          __KEYWORDS_NAME__: __as_str__(keyword.get(__KEYWORDS_NAME__)),
+          __KEYWORDS_VALUE__: __as_str__(keyword.get(__KEYWORDS_VALUE__)),
+          __RANK__: __as_int__(keyword.get(__RANK__)),
+          __IS_MAJOR__: __as_str__(keyword.get(__IS_MAJOR__))
+      } for keyword in document.get(__KEYWORDS__) or list() if isinstance(keyword, dict)],
+      __PERSONS__: [{
+          __FIRSTNAME__: __as_str__(person.get(__FIRSTNAME__)),
+          __MIDDLENAME__: __as_str__(person.get(__MIDDLENAME__)),
+          __LASTNAME__: __as_str__(person.get(__LASTNAME__)),
+          __ROLE__: __as_str__(person.get(__ROLE__)),
+          __ORGANIZATION__: __as_str__(person.get(__ORGANIZATION__)),
+          __RANK__: __as_int__(person.get(__RANK__))
+      } for person in byline.get(__PERSON__) or list() if isinstance(person, dict)],
+      __BYLINE_ORIGINAL__: __as_str__(byline.get(__ORIGINAL__))
+  }
+
+  for column in __STRING_COLUMNS__:
+    row[column] = __as_str__(document.get(column))
+
+  return row
+
+
+# The articles of every publication month
+def __partition_counts__(collection):
+  '''
+  __partition_counts__(collection) -> dict
+
+  The number of articles per (pub_year, pub_month), served by the `pub_year_pub_month` index. The
+  articles without a publication date count for (None, None).
+  '''
+
+  return dict(((entry[__ID__].get('year'), entry[__ID__].get('month')), entry[__COUNT_FIELD__])
+              for entry in collection.aggregate([{
+                  __GROUP__: {
+                      __ID__: {
+                          'year': '${year}'.format(year=__PUB_YEAR__),
+                          'month': '${month}'.format(month=__PUB_MONTH__)
+                      },
+                      __COUNT_FIELD__: {
+                          __SUM__: 1
+                      }
+                  }
+              }], allowDiskUse=True))
+
+
+# The key of a partition in the export manifest
+def __partition_key__(year, month):
+  '''
+  __partition_key__(year, month) -> str
+  '''
+
+  if year is None or month is None:
+    return __UNKNOWN_PARTITION__
+
+  return '{year:04d}-{month:02d}'.format(year=year, month=month)
+
+
+# The file of a partition, relative to the export directory
+def __partition_path__(year, month, export_format):
+  '''
+  __partition_path__(year, month, export_format) -> str
+  '''
+
+  known = year is not None and month is not None
+
+  return os.path.join('year={year}'.format(year=year if known else __UNKNOWN_PARTITION__),
+                      'month={month}'.format(month=month if known else __UNKNOWN_PARTITION__),
+                      __PART_FILE__.format(extension=export_format))
+
+
+# What the articles of a publication month were ingested from
+def __partition_source__(ingest_manifest, year, month, generation):
+  '''
+  __partition_source__(ingest_manifest, year, month, generation) -> str
+
+  The `hash` and `updated_at` of the ingest manifest entries (see `nyt_queries.read_manifest`) the
+  articles of the publication month may come from: its archives API month and the neighbouring
+  ones, the publication dates are in UTC and the API months in New York time. Ingesting one of
+  them again or backfilling the month changes the source. The articles without a publication
+  date may come from any month, their source is the dataset `generation`.
+  '''
+
+  if year is None or month is None:
+    return 'generation:{generation}'.format(generation=generation)
+
+  sources = list()
+
+  for offset in (-1, 0, 1):
+    source_year, source_month = divmod(year * 12 + month - 1 + offset, 12)
+    entry = ingest_manifest.get((source_year, source_month + 1)) or dict()
+    updated_at = entry.get('updated_at')
+    sources.append('{hash}@{updated_at}'.format(
+        hash=entry.get('hash'),
+        updated_at=updated_at.isoformat() if updated_at is not None else None))
+
+  return ','.join(sources)
+
+
+# Reading the export manifest
+def read_export_manifest(out_dir):
+  '''
+  read_export_manifest(out_dir) -> dict
+
+  The manifest of an export directory, `format` and the `partitions` keyed on `YYYY-MM`, with their
+  `path`, `rows`, `source` (see `__partition_source__`) and `exported_at`. Empty for a directory
+  never exported to.
+  '''
+
+  try:
+    with open(os.path.join(out_dir, __EXPORT_MANIFEST__), 'r', encoding='utf-8') as manifest_file:
+      return load(manifest_file)
+  except FileNotFoundError:
+    return dict()
+
+
+# Writing the export manifest
+def __write_export_manifest__(out_dir, manifest):
+  '''
+  __write_export_manifest__(out_dir, manifest)
+
+  Replaces the manifest atomically, an interrupted export never leaves it half written.
+  '''
+
+  path = os.path.join(out_dir, __EXPORT_MANIFEST__)
+
+  with open(path + __TEMPORARY_SUFFIX__, 'w', encoding='utf-8') as manifest_file:
+    dump(manifest, manifest_file, indent=2, sort_keys=True)
+
+  os.replace(path + __TEMPORARY_SUFFIX__, path)
+
+  return
+
+
+# Exporting one publication month
+def __export_partition__(collection, out_dir, year, month, export_format, batch_size):
+  '''
+  __export_partition__(collection, out_dir, year, month, export_format, batch_size) -> dict
+
+  Streams the articles of the month through a server side cursor into its partition file, one
+  record batch of at most `batch_size` articles at a time. The file is written under a temporary
+  name and renamed once complete, so readers never see a partial partition.
+  '''
+
+  started_at = perf_counter()
+
+  schema = archive_schema()
+
+  relative_path = __partition_path__(year, month, export_format)
+  path = os.path.join(out_dir, relative_path)
+
+  os.makedirs(os.path.dirname(path), exist_ok=True)
+
+  cursor = collection.find({__PUB_YEAR__: year, __PUB_MONTH__: month}, batch_size=batch_size)
+
+  if export_format == __PARQUET__:
+    writer = pq.ParquetWriter(path + __TEMPORARY_SUFFIX__, schema,
+                              compression=__PARQUET_COMPRESSION__)
+  else:
+    writer = pa.ipc.new_file(path + __TEMPORARY_SUFFIX__, schema)
+
+  rows = 0
+
+  try:
+    for batch, _ in __batches__((__export_row__(document) for document in cursor), batch_size):
+      if export_format == __PARQUET__:
+        writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+      else:
+        writer.write_batch(pa.RecordBatch.from_pylist(batch, schema=schema))
+      rows += len(batch)
+  finally:
+    cursor.close()
+    writer.close()
+
+  os.replace(path + __TEMPORARY_SUFFIX__, path)
+
+  return {
+      'partition': __partition_key__(year, month),
+      'path': relative_path,
+      'rows': rows,
+      'bytes': os.path.getsize(path),
+      'seconds': perf_counter() - started_at
+  }
+
+
+# Exporting the archives
+def export_archives(out_dir, export_format=__PARQUET__, workers=__EXPORT_WORKERS__,
+                    batch_size=__RECORD_BATCH_SIZE__, incremental=True, client=None):
+  '''
+  export_archives(out_dir, export_format='parquet', workers=4, batch_size=5000, incremental=True,
+                  client=None) -> dict
+
+  Exports the archives collection to a directory of Parquet or Arrow IPC files partitioned by
+  publication year and month (see the module documentation).
+
+  Input(s):
+
+    :param: out_dir `str` -- The export directory, created when missing
+
+    :param: export_format `str` -- `parquet` (zstd compressed) or `arrow` (the Arrow IPC file
+    format, aka Feather v2) -- defaults to `parquet`
+
+    :param: workers `int` -- The number of months written in parallel -- defaults to 4
+
+    :param: batch_size `int` -- The articles per record batch (and per Parquet row group), bounds
+    the memory of every worker -- defaults to 5000
+
+    :param: incremental `bool` -- Only export the months that are not in the export manifest yet,
+    or whose number of articles or ingest manifest entries changed since -- defaults to True
+
+    :param: client `MongoClient` -- The client to use -- defaults to the shared client
+
+  Output(s):
+
+    :return: report `dict` -- The `partitions` written (`partition`, `path`, `rows`, `bytes`,
+    `seconds`), the `skipped` partitions, the `rows` and `bytes` written, the `seconds` it took and
+    the `rows_per_second`
+  '''
+
+  __require_pyarrow__()
+
+  if export_format not in __EXPORT_FORMATS__:
+    raise ValueError('Unknown export format {export_format}, use one of {formats}'.format(
+        export_format=export_format, formats=', '.join(__EXPORT_FORMATS__)))
+
+  client = get_client() if client is None else client
+
+  collection = client.get_database(nyt_queries.__DATABASE_NAME__)[nyt_queries.__COLLECTION_NAME__]
+
+  os.makedirs(out_dir, exist_ok=True)
+
+  manifest = read_export_manifest(out_dir)
+
+  if manifest.get('format') != export_format:
+    manifest = {'format': export_format, 'partitions': dict()}
+
+  generation = dataset_generation(client)
+  ingest_manifest = read_manifest(client)
+
+  pending = list()
+  skipped = list()
+  sources = dict()
+
+  for (year, month), count in sorted(__partition_counts__(collection).items(),
+                                     key=lambda item: (item[0][0] is None, item[0])):
+    partition_key = __partition_key__(year, month)
+    sources[partition_key] = __partition_source__(ingest_manifest, year, month, generation)
+    exported = manifest['partitions'].get(partition_key)
+
+    if incremental and exported is not None and exported['rows'] == count and \
+            exported.get('source') == sources[partition_key] and \
+            os.path.exists(os.path.join(out_dir, exported['path'])):
+      skipped.append(partition_key)
+    else:
+      pending.append((year, month))
+
+  warning('Exporting {pending} months to {out_dir}, {skipped} months already exported'.format(
+      pending=len(pending), out_dir=out_dir, skipped=len(skipped)))
+
+  manifest_lock = Lock()
+  partitions = list()
+
+  started_at = perf_counter()
+
+  with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+    futures = [executor.submit(__export_partition__, collection, out_dir, year, month,
+                               export_format, batch_size)
+               for year, month in pending]
+
+    for future in as_completed(futures):
+      partition = future.result()
+      partitions.append(partition)
+
+      # recorded as soon as written, an interrupted export resumes after the last month done
+      with manifest_lock:
+        manifest['partitions'][partition['partition']] = {
+            'path': partition['path'],
+            'rows': partition['rows'],
+            'source': sources[partition['partition']],
+            'exported_at': datetime.utcnow().isoformat()
+        }
+        __write_export_manifest__(out_dir, manifest)
+
+  seconds = perf_counter() - started_at
+
+  partitions.sort(key=lambda partition: partition['partition'])
+
+  rows = sum(partition['rows'] for partition in partitions)
+
+  report = {
+      'partitions': partitions,
+      'skipped': skipped,
+      'rows': rows,
+      'bytes': sum(partition['bytes'] for partition in partitions),
+      'seconds': seconds,
+      'rows_per_second': rows / seconds if seconds > 0 else 0.0
+  }
+
+  warning('Exported {rows} articles in {count} months to {out_dir} in {seconds:.2f}s'.format(
+      rows=rows, count=len(partitions), out_dir=out_dir, seconds=seconds))
+
+  return report
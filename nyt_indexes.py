@@ -0,0 +1,295 @@
+# nyt_indexes.py
+# -*- coding: utf-8 -*-
+
+
+'''
+Index management for the archives collection.
+
+`ARCHIVES_INDEXES` declares the indexes needed by the 15 queries of `nyt_queries`, `ensure_indexes`
+builds them and `check_indexes` runs every query function with the database profiler turned on and
+reports the queries whose plan still is a collection scan.
+'''
+
+# python standard library imports
+from contextlib import contextmanager
+from logging import warning
+from time import perf_counter
+
+
+# pymongo imports
+from pymongo import ASCENDING
+from pymongo import DESCENDING
+from pymongo import TEXT
+from pymongo import IndexModel
+
+
+# NYT Archiver imports
+import nyt_queries
+from nyt_queries import get_client
+from nyt_queries import __PUB_DATETIME__
+from nyt_queries import __PUB_YEAR__
+from nyt_queries import __PUB_MONTH__
+from nyt_queries import __PAGE__
+from nyt_queries import __DOCUMENT_TYPE__
+from nyt_queries import __WORD_COUNT__
+from nyt_queries import __BYLINE__
+from nyt_queries import __PERSON__
+from nyt_queries import __ROLE__
+from nyt_queries import __KEYWORDS__
+from nyt_queries import __KEYWORDS_NAME__
+from nyt_queries import __KEYWORDS_VALUE__
+from nyt_queries import __KEYWORD_VALUES__
+from nyt_queries import __REPORTER_NAMES__
+from nyt_queries import __NAME_FIRST__
+from nyt_queries import __NAME_LAST__
+from nyt_queries import __NAME_KEY__
+from nyt_queries import __TYPE_OF_MATERIAL__
+from nyt_queries import __SOURCE__
+from nyt_queries import __ID__
+from nyt_queries import __TEXT_WEIGHTS__
+
+
+# Constants
+__COLLSCAN__ = 'COLLSCAN'
+__PROFILE_COLLECTION__ = 'system.profile'
+__PROFILE_ALL__ = 2
+__PROFILE_STATUS__ = -1
+__TEXT_LANGUAGE__ = 'english'
+
+
+# The indexes of the archives collection, (name, keys), and the queries they serve
+ARCHIVES_INDEXES = [
+    # Query#10 -- articles_between, and the keyset order of the streamed queries
+    ('pub_datetime_id', [(__PUB_DATETIME__, ASCENDING), (__ID__, ASCENDING)]),
+    # Query#1 -- compare_news_keywords
+    ('pub_year_pub_month', [(__PUB_YEAR__, ASCENDING), (__PUB_MONTH__, ASCENDING)]),
+    # Query#6 -- xpage_articles, Query#15 -- front_page_articles,
+    # Query#12 -- most_section on the prefix
+    ('document_type_page_pub_datetime', [(__DOCUMENT_TYPE__, ASCENDING),
+                                         (__PAGE__, ASCENDING),
+                                         (__PUB_DATETIME__, ASCENDING)]),
+    # Query#14 -- monthly_article_histogram and highest_articles_month, covered by the index
+    ('document_type_pub_year_pub_month', [(__DOCUMENT_TYPE__, ASCENDING),
+                                          (__PUB_YEAR__, ASCENDING),
+                                          (__PUB_MONTH__, ASCENDING)]),
+    # Query#8 -- longest_article
+    ('document_type_word_count', [(__DOCUMENT_TYPE__, ASCENDING), (__WORD_COUNT__, DESCENDING)]),
+    # Query#4 -- search_articles_reporter_name, exact and prefix matches
+    ('reporter_names_last_first', [
+        ('{reporter_names}.{last}'.format(
+            reporter_names=__REPORTER_NAMES__, last=__NAME_LAST__), ASCENDING),
+        ('{reporter_names}.{first}'.format(
+            reporter_names=__REPORTER_NAMES__, first=__NAME_FIRST__), ASCENDING)]),
+    # Query#4 -- search_articles_reporter_name, fuzzy matches
+    ('reporter_names_name', [
+        ('{reporter_names}.{name}'.format(
+            reporter_names=__REPORTER_NAMES__, name=__NAME_KEY__), ASCENDING)]),
+    # Query#7 -- most_productive_reporter
+    ('byline_person_role', [
+        ('{byline}.{person}.{role}'.format(
+            byline=__BYLINE__, person=__PERSON__, role=__ROLE__), ASCENDING)]),
+    # Query#5 -- search_people_or_organization and entity_articles
+    ('keywords_name_value', [
+        ('{keywords}.{name}'.format(keywords=__KEYWORDS__, name=__KEYWORDS_NAME__), ASCENDING),
+        ('{keywords}.{value}'.format(keywords=__KEYWORDS__, value=__KEYWORDS_VALUE__), ASCENDING)]),
+    # Query#11 -- most_organization
+    ('keyword_values_organizations', [
+        ('{keyword_values}.organizations'.format(keyword_values=__KEYWORD_VALUES__), ASCENDING)]),
+    # Query#2 -- most_popular_news_keywords
+    ('type_of_material', [(__TYPE_OF_MATERIAL__, ASCENDING)]),
+    # Query#9 -- count_original_articles
+    ('source', [(__SOURCE__, ASCENDING)])
+]
+
+
+# The text index of the ranked search, Query#3 -- search_in_articles(ranked=True). A collection has
+# at most one text index, its field weights come from `nyt_queries.__TEXT_WEIGHTS__`
+TEXT_INDEX = ('text_search', [(field, TEXT) for field in sorted(__TEXT_WEIGHTS__)])
+
+
+# The query functions with sample (arguments, keyword arguments), run by `check_indexes`
+QUERY_CHECKS = [
+    ('compare_news_keywords', tuple(), dict()),
+    ('compare_keyword_periods', ((2005, 2006, 2007, 2015, 2016, 2017),), dict()),
+    ('most_popular_news_keywords', tuple(), dict()),
+    ('search_in_articles', ('of the need',), dict()),
+    ('search_in_articles', ('of the need', True), dict()),
+    ('search_articles_reporter_name', ('Constance', 'L.', 'HAYS'), dict()),
+    ('search_articles_reporter_name', ('Constanse', '', 'Hayes'), {'match': 'fuzzy'}),
+    ('search_people_or_organization', ('MATTEL', False), dict()),
+    ('entity_articles', ('organizations:MATTEL INC',), dict()),
+    ('xpage_articles', (1,), dict()),
+    ('most_productive_reporter', tuple(), dict()),
+    ('longest_article', tuple(), dict()),
+    ('count_original_articles', tuple(), dict()),
+    ('articles_between', ('2005-09-11', '2005-10-01'), dict()),
+    ('most_organization', tuple(), dict()),
+    ('most_section', tuple(), dict()),
+    ('list_articles_type_of_materials', tuple(), dict()),
+    ('highest_articles_month', tuple(), dict()),
+    ('monthly_article_histogram', ('section',), dict()),
+    ('front_page_articles', ('2005-09-11', '2005-10-01'), dict())
+]
+
+
+# The query functions whose raw pipeline reads every article, for them a collection scan costs less
+# than walking a whole index and fetching every document it points to. Their rollups answer them
+# without reading the archives collection at all.
+FULL_SCAN_QUERIES = ('list_articles_type_of_materials',)
+
+
+# Building the indexes
+def ensure_indexes(client=None, background=True):
+  '''
+  ensure_indexes(client=None, background=True) -> list[str]
+
+  Creates the indexes declared in `ARCHIVES_INDEXES` and the weighted `TEXT_INDEX` on the archives
+  collection. Existing indexes are left as they are, so it is safe to call after every ingest.
+
+  Input(s):
+
+    :param: client `MongoClient` -- The client to use -- defaults to a new client
+
+    :param: background `bool` -- Build the indexes in the background, without blocking the other
+    operations on the database -- defaults to True
+
+  Output(s):
+
+    :return: index_names `list[str]` -- The names of the indexes
+  '''
+
+  client = get_client() if client is None else client
+
+  collection = client.get_database(nyt_queries.__DATABASE_NAME__)[nyt_queries.__COLLECTION_NAME__]
+
+  started_at = perf_counter()
+
+  text_name, text_keys = TEXT_INDEX
+
+  index_names = collection.create_indexes(
+      [IndexModel(keys, name=name, background=background) for name, keys in ARCHIVES_INDEXES] +
+      [IndexModel(text_keys, name=text_name, background=background, weights=__TEXT_WEIGHTS__,
+                  default_language=__TEXT_LANGUAGE__)])
+
+  warning('Ensured {count} indexes on {collection} in {seconds:.2f}s'.format(
+      count=len(index_names),
+      collection=nyt_queries.__COLLECTION_NAME__,
+      seconds=perf_counter() - started_at))
+
+  return index_names
+
+
+# the plans used by a profiled operation
+def __is_collscan__(profile_entry):
+  '''
+  __is_collscan__(profile_entry) -> bool
+
+  Tells whether the profiled operation scanned the whole collection.
+  '''
+
+  return __COLLSCAN__ in profile_entry.get('planSummary', '')
+
+
+# Profiling the operations sent to the archives collection
+@contextmanager
+def profiling(client=None):
+  '''
+  profiling(client=None) -> context manager of Collection
+
+  Turns the database profiler on for every operation and yields the `system.profile` collection.
+  The profiling level of the database is restored on exit.
+  '''
+
+  client = get_client() if client is None else client
+
+  db = client.get_database(nyt_queries.__DATABASE_NAME__)
+
+  previous_level = db.command('profile', __PROFILE_STATUS__)['was']
+
+  db.command('profile', __PROFILE_ALL__)
+
+  try:
+    yield db[__PROFILE_COLLECTION__]
+  finally:
+    db.command('profile', previous_level)
+
+
+# Running a query function under the profiler
+def profiled_call(profile, query, *arguments, **kwargs):
+  '''
+  profiled_call(profile, query, *arguments, **kwargs) -> (object, list[dict], float)
+
+  Calls the query function and reads back from the `profile` collection (see `profiling`) the
+  operations it sent to the database, the archives collection and the rollups alike.
+
+  Output(s):
+
+    :return: result `object` -- What the query function returned
+
+    :return: entries `list[dict]` -- The profiler entries of its operations, with their
+    `planSummary`, `docsExamined` and `keysExamined`
+
+    :return: seconds `float` -- The time the call took
+  '''
+
+  last_entry = list(profile.find().sort('$natural', DESCENDING).limit(1))
+  since = last_entry[0]['ts'] if len(last_entry) > 0 else None
+
+  started_at = perf_counter()
+  result = query(*arguments, **kwargs)
+  seconds = perf_counter() - started_at
+
+  entries = list(profile.find({'ns': {'$ne': profile.full_name},
+                               'op': {'$in': ['query', 'command', 'getmore']},
+                               'ts': {'$gt': since} if since is not None else {'$exists': True}}))
+
+  return result, entries, seconds
+
+
+# Checking that the query functions are served by indexes
+def check_indexes(client=None):
+  '''
+  check_indexes(client=None) -> list[dict]
+
+  Runs every query function of `QUERY_CHECKS` with the database profiler turned on and reads back
+  the plan of every operation it sent to the archives collection, i.e the `planSummary` the
+  `explain()` of these operations reports. The profiling level of the database is restored
+  afterwards.
+
+  Input(s):
+
+    :param: client `MongoClient` -- The client to use -- defaults to a new client
+
+  Output(s):
+
+    :return: checks `list[dict]` -- One entry per query function with its `query` name, the
+    `plans` of its operations, `collscan` set when any of them scanned the whole collection (never
+    for the `FULL_SCAN_QUERIES`), and the `seconds` it took.
+  '''
+
+  namespace = '{db}.{collection}'.format(db=nyt_queries.__DATABASE_NAME__,
+                                         collection=nyt_queries.__COLLECTION_NAME__)
+
+  checks = list()
+
+  with profiling(client) as profile:
+    for query_name, arguments, kwargs in QUERY_CHECKS:
+      # bypassing the query result cache, a cached result sends no operation to profile
+      _, entries, seconds = profiled_call(
+          profile, getattr(nyt_queries, query_name).__wrapped__, *arguments, **kwargs)
+
+      entries = [entry for entry in entries if entry.get('ns') == namespace]
+
+      checks.append({
+          'query': query_name,
+          'plans': [entry.get('planSummary') for entry in entries],
+          'collscan': query_name not in FULL_SCAN_QUERIES and
+                      any(__is_collscan__(entry) for entry in entries),
+          'seconds': seconds
+      })
+
+  for check in checks:
+    if check['collscan']:
+      warning('{query} still scans the whole collection: {plans}'.format(**check))
+
+  return checks
@@ -12,12 +12,33 @@ for the usecases.
 '''
 
 # python standard library imports
+from collections import OrderedDict
 from datetime import datetime
+from datetime import timezone
 from json import dumps
 from json import loads
+from json import JSONDecoder
+from json import JSONDecodeError
+from codecs import getincrementaldecoder
+from hashlib import sha256
 from urllib.request import urlopen
+from urllib.error import HTTPError
 from logging import basicConfig
 from logging import warning
+from logging import info
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import as_completed
+from itertools import islice
+from functools import wraps
+from inspect import signature
+from threading import Lock
+from threading import RLock
+from unicodedata import combining
+from unicodedata import normalize as unicode_normalize
+import os
+from time import monotonic
+from time import perf_counter
+from time import sleep
 import re
 
 
@@ -25,6 +46,20 @@ import re
 from pymongo import MongoClient
 from pymongo import ASCENDING
 from pymongo import DESCENDING
+from pymongo import InsertOne
+from pymongo import ReplaceOne
+from pymongo import UpdateOne
+from pymongo import WriteConcern
+from pymongo.errors import BulkWriteError
+from bson import BSON
+from bson.son import SON
+
+
+# NYT Archiver imports
+from nyt_cache import ArchivesCache
+from nyt_query_cache import QueryCache
+from nyt_sketches import HeavyHitters
+from nyt_sketches import HyperLogLog
 
 
 # setting up logger
@@ -38,6 +73,15 @@ PHASE_2_START_YEAR = 2014
 PHASE_2_END_YEAR = 2017
 
 
+# Query#1 -- the periods compared and the number of keywords per period
+__KEYWORD_PERIODS__ = ((PHASE_1_START_YEAR, PHASE_1_END_YEAR), (2015, PHASE_2_END_YEAR))
+__TOP_KEYWORDS__ = 10
+__PERIOD_FIELD_FORMAT__ = 'period_{index}'
+__COUNTS_FIELD__ = 'counts'
+__RANKS_FIELD__ = 'ranks'
+__RANK_DELTAS_FIELD__ = 'rank_deltas'
+
+
 # Constants
 __HOSTNAME__ = 'localhost'
 __PORT__ = '27017'
@@ -49,6 +93,132 @@ __ARCHIVES_META_HITS_KEY__ = 'hits'
 __RESPONSE__ = 'response'
 
 
+# Archives API quota and ingest settings
+__API_REQUESTS_PER_SECOND__ = 5
+__API_MAX_RETRIES__ = 3
+__API_RETRY_BACKOFF__ = 1.0
+__INGEST_WORKERS__ = 4
+__HTTP_TOO_MANY_REQUESTS__ = 429
+__RETRY_AFTER_HEADER__ = 'Retry-After'
+__STREAM_CHUNK_SIZE__ = 64 * 1024
+__STREAM_MAX_VALUE_SIZE__ = 64 * 1024 * 1024
+__NUMBER_CHARACTERS__ = frozenset('0123456789.eE+-')
+__INSERT_BATCH_SIZE__ = 500
+__FIND_BATCH_SIZE__ = 500
+__INSERT_BATCH_BYTES__ = 8 * 1024 * 1024
+
+
+# Write profiles for the ingest
+# `bulk` is for the initial loads, unacknowledged by the journal and unordered so a bad document
+# doesn't abort its batch. `durable` is for the incremental loads.
+__BULK_WRITE_PROFILE__ = 'bulk'
+__DURABLE_WRITE_PROFILE__ = 'durable'
+__WRITE_PROFILES__ = {
+    __BULK_WRITE_PROFILE__: {
+        'w': 1,
+        'j': False,
+        'ordered': False,
+        'batch_size': 1000,
+        'batch_bytes': __INSERT_BATCH_BYTES__
+    },
+    __DURABLE_WRITE_PROFILE__: {
+        'w': 'majority',
+        'j': True,
+        'ordered': True,
+        'batch_size': __INSERT_BATCH_SIZE__,
+        'batch_bytes': __INSERT_BATCH_BYTES__
+    }
+}
+
+
+# Ingest manifest, tracks the status of every month of the dataset
+__MANIFEST_SUFFIX__ = '_manifest'
+__MONTH_RUNNING__ = 'running'
+__MONTH_DONE__ = 'done'
+__MONTH_FAILED__ = 'failed'
+__MONTH_SKIPPED__ = 'skipped'
+
+
+# Rollup collection, per-month counts maintained at ingest for the aggregate queries
+__ROLLUPS_SUFFIX__ = '_rollups'
+__ROLLUP_DIMENSION__ = 'dimension'
+__ROLLUP_INGEST__ = 'ingest'
+__ROLLUP_YEAR__ = 'year'
+__ROLLUP_MONTH__ = 'month'
+__ROLLUP_KEY__ = 'key'
+__ROLLUP_COUNT__ = 'count'
+__KEYWORD_ROLLUP__ = 'keyword'
+__NEWS_KEYWORD_ROLLUP__ = 'news_keyword'
+__ORGANIZATION_ROLLUP__ = 'organization'
+__REPORTER_ROLLUP__ = 'reporter'
+__SECTION_ROLLUP__ = 'section'
+__TYPE_OF_MATERIAL_ROLLUP__ = 'type_of_material'
+__SOURCE_ROLLUP__ = 'source'
+__ARTICLE_MONTH_ROLLUP__ = 'article_month'
+__PERSON_ROLLUP__ = 'person'
+__DOCUMENT_TYPE_ROLLUP__ = 'document_type'
+
+
+# Sketch collection, mergeable per-month sketches written at ingest for the approximate queries
+__SKETCHES_SUFFIX__ = '_sketches'
+__SKETCH_DIMENSIONS__ = (__NEWS_KEYWORD_ROLLUP__, __ORGANIZATION_ROLLUP__, __REPORTER_ROLLUP__)
+__HEAVY_HITTERS__ = 'heavy_hitters'
+__HEAVY_HITTER_KEYS__ = 'heavy_hitter_keys'
+__DISTINCT_DIMENSIONS__ = (__KEYWORD_ROLLUP__, __ORGANIZATION_ROLLUP__, __PERSON_ROLLUP__,
+                           __REPORTER_ROLLUP__)
+__HYPERLOGLOG__ = 'hyperloglog'
+__APPROXIMATE_QUERIES__ = (('most_popular_news_keywords', __NEWS_KEYWORD_ROLLUP__),
+                           ('most_productive_reporter', __REPORTER_ROLLUP__),
+                           ('most_organization', __ORGANIZATION_ROLLUP__))
+
+
+# Entity catalog, the keyword values of the named entities with their frequency, for the
+# autocomplete and Query#5
+__ENTITIES_SUFFIX__ = '_entities'
+__ENTITY_KINDS__ = ('persons', 'organizations', 'glocations', 'subject')
+__ENTITY_KIND__ = 'kind'
+__ENTITY_VALUE__ = 'value'
+__ENTITY_FOLDED__ = 'folded'
+__ENTITY_TOKENS__ = 'tokens'
+__ENTITY_COUNT__ = 'count'
+__ENTITY_GENERATION__ = 'generation'
+__CATALOG_ID__ = '_catalog'
+__AUTOCOMPLETE_LIMIT__ = 10
+
+
+# On-disk cache of the raw API responses, disabled until `set_archives_cache` is called
+__ARCHIVES_CACHE__ = None
+
+
+# Result cache of the queries, invalidated by the dataset generation the ingest bumps
+__QUERY_CACHE__ = None
+__GENERATION_TTL__ = 1.0
+__CACHED_GENERATION__ = {'generation': None, 'checked_at': 0.0, 'forgotten': 0}
+__CACHED_GENERATION_LOCK__ = Lock()
+__GENERATION_SUFFIX__ = '_generation'
+__GENERATION_ID__ = 'generation'
+
+
+# Parallel partitioned aggregation of the raw `$group` pipelines, disabled until
+# `set_parallel_aggregation` is called
+__PARALLEL_AGGREGATION__ = None
+__AGGREGATION_PARTITIONS_PER_WORKER__ = 4
+
+
+# Connection pool settings of the shared `MongoClient`
+__MAX_POOL_SIZE__ = 100
+__CONNECT_TIMEOUT_MS__ = 20000
+__SERVER_SELECTION_TIMEOUT_MS__ = 30000
+__SOCKET_TIMEOUT_MS__ = None
+
+
+# The process-wide `MongoClient`, created by the first `get_client` call
+__CLIENT__ = None
+__CLIENT_PID__ = None
+__CLIENT_LOCK__ = RLock()
+__CLIENT_STATS__ = {'get_client_calls': 0, 'clients_created': 0, 'connect_seconds': 0.0}
+
+
 # Database(mongo) name
 __DATABASE_NAME__ = 'nyt_archives'
 __COLLECTION_NAME__ = 'archives'
@@ -62,10 +232,15 @@ __AND__ = '$and'
 __REGEX__ = '$regex'
 __LT__ = '$lt'
 __GT__ = '$gt'
+__NE__ = '$ne'
 __EQ__ = '$eq'
 __GROUP__ = '$group'
 __SUM__ = '$sum'
 __ID_OP__ = '_id'
+__SET__ = '$set'
+__INC__ = '$inc'
+__IN__ = '$in'
+__EXISTS__ = '$exists'
 __MATCH__ = '$match'
 __UNWIND__ = '$unwind'
 __SORT__ = '$sort'
@@ -75,6 +250,12 @@ __GTEQ__ = '$gte'
 __COUNT_OP__ = '$count'
 __COUNT_FIELD__ = 'count'
 __LIMIT__ = '$limit'
+__FACET__ = '$facet'
+__COND__ = '$cond'
+__TEXT__ = '$text'
+__SEARCH__ = '$search'
+__META__ = '$meta'
+__TEXT_SCORE__ = 'textScore'
 
 
 # Article fields
@@ -111,6 +292,69 @@ __WORD_COUNT__ = 'word_count'
 __SLIDESHOW_CREDITS__ = 'slideshow_credits'
 
 
+# Derived article fields, added at ingest by `normalize_document`
+__PUB_DATETIME__ = 'pub_datetime'
+__PUB_YEAR__ = 'pub_year'
+__PUB_MONTH__ = 'pub_month'
+__PAGE__ = 'page'
+__KEYWORD_VALUES__ = 'keyword_values'
+__REPORTER_NAMES__ = 'reporter_names'
+
+
+# The case folded byline names of `reporter_names`
+__NAME_FIRST__ = 'first'
+__NAME_MIDDLE__ = 'middle'
+__NAME_LAST__ = 'last'
+__NAME_KEY__ = 'name'
+__NAME_DROPPED_PATTERN__ = re.compile(r"[.,'\u2019]")
+__NAME_SEPARATOR_PATTERN__ = re.compile(r'[\W_]+')
+
+
+# The name matches of `search_articles_reporter_name`
+__EXACT_MATCH__ = 'exact'
+__PREFIX_MATCH__ = 'prefix'
+__FUZZY_MATCH__ = 'fuzzy'
+__NAME_MATCHES__ = (__EXACT_MATCH__, __PREFIX_MATCH__, __FUZZY_MATCH__)
+__FUZZY_DISTANCE__ = 1
+__FUZZY_MIN_LENGTH__ = 4
+__REPORTER_NAMES_CACHE__ = dict()
+__REPORTER_NAMES_LOCK__ = Lock()
+
+
+# The `pub_date` formats used by the NYT archives API over the years
+__PUB_DATE_FORMATS__ = ('%Y-%m-%dT%H:%M:%SZ', '%Y-%m-%dT%H:%M:%S%z', '%Y-%m-%d')
+__DATE_FORMAT__ = '%Y-%m-%d'
+__PAGE_PATTERN__ = re.compile(r'\d+')
+
+
+# Ranked search, the weights of the text index fields -- a match in the headline counts ten times
+# a match in the lead paragraph
+__SCORE__ = 'score'
+__SEARCH_LIMIT__ = 20
+__TEXT_WEIGHTS__ = {
+    '{headline}.{main}'.format(headline=__HEADLINE__, main=__HEADLINE_MAIN__): 10,
+    __ABSTRACT__: 5,
+    __SNIPPET__: 3,
+    __LEAD_PARAGRAPH__: 1
+}
+
+
+# Projection profiles of the queries returning articles. `summary` is enough to list the articles,
+# `byline` adds the reporters and `full` returns the whole documents, with the lead paragraph,
+# abstract, snippet, multimedia and keywords
+__SUMMARY_PROFILE__ = 'summary'
+__BYLINE_PROFILE__ = 'byline'
+__FULL_PROFILE__ = 'full'
+__SUMMARY_FIELDS__ = ['{headline}.{main}'.format(headline=__HEADLINE__, main=__HEADLINE_MAIN__),
+                      __WEB_URL__, __PUB_DATE__, __PUB_DATETIME__, __DOCUMENT_TYPE__,
+                      __TYPE_OF_MATERIAL__, __SECTION_NAME__, __PAGE__, __WORD_COUNT__]
+__PROJECTION_PROFILES__ = {
+    __SUMMARY_PROFILE__: dict((field, True) for field in __SUMMARY_FIELDS__),
+    __BYLINE_PROFILE__: dict((field, True) for field in __SUMMARY_FIELDS__ + [__BYLINE__]),
+    __FULL_PROFILE__: None
+}
+
+
 # set database and collection names for the script from run-time
 # just for offerring more flexibility
 def set_db_collection_names(
@@ -133,423 +377,2826 @@ def set_db_collection_names(
     __COLLECTION_NAME__ = collection_name
     __HOSTNAME__ = hostname
     __PORT__ = port
+    # the shared client may be connected to the previous host, whose generation is not this one's
+    close_client()
+    __forget_generation__()
     warning('Updated database name:{db} and collection name: {collec} and {host}:{port}'.format(
         db=__DATABASE_NAME__, collec=__COLLECTION_NAME__, host=__HOSTNAME__, port=__PORT__))
 
   return
 
 
-# Connection to MongoDB
-def get_client():
+# set the NYT archives API base path and key from run-time
+# lets the ingest run against a local stand-in server instead of api.nytimes.com
+def set_archives_api(base_path=None, api_key=None):
   '''
-  get_client() -> MongoClient
+  set_archives_api(base_path=None, api_key=None)
+
+  Sets the base path and the API key used by `invoke_archives_api`.
+
+  Input(s):
 
-  Connects to the MongoDB instance and returns the `MongoClient`.
+    :param: base_path `str` -- The base path of the archives API, must end with a `/`,
+    eg: `http://localhost:8000/svc/` -- defaults to None (unchanged)
+
+    :param: api_key `str` -- The API key sent with every request -- defaults to None (unchanged)
 
   Output(s):
 
-    :return: client `MongoClient` -- The mongo DB client
+    None
   '''
 
-  warning('Connecting to mongodb://{hostname}:{port}'.format(hostname=__HOSTNAME__,
-                                                             port=__PORT__))
+  global __NYT_API_BASE_PATH__, __API_KEY__
 
-  client = MongoClient('mongodb://{hostname}:{port}'.format(hostname=__HOSTNAME__,
-                                                            port=__PORT__))
+  if base_path is not None:
+    __NYT_API_BASE_PATH__ = base_path if base_path.endswith('/') else base_path + '/'
 
-  warning('Connection established...')
+  if api_key is not None:
+    __API_KEY__ = api_key
 
-  return client
+  warning('Using NYT archives API at {base_path}'.format(base_path=__NYT_API_BASE_PATH__))
 
+  return
 
-# Creation of archives dataset
-# NYT Arcives API for fetching data from NYT
-def invoke_archives_api(year=2000, month=4):
-  '''
-  invoke_archives_api(year = 2000, month = 4) -> (list, int)
 
-  Invokes the NYT archives API and generates the dataset like the one in `nyt_archives.json`.
+# set the on-disk cache of the raw NYT archives API responses from run-time
+def set_archives_cache(cache_dir=None, replay=False):
+  '''
+  set_archives_cache(cache_dir=None, replay=False)
 
-  Takes year and month as the arguments.
+  Enables the on-disk cache of the raw archives API responses used by `invoke_archives_api` and
+  the dataset creation. The months found in the cache are read from the local disk, the others are
+  downloaded and saved into the cache.
 
   Input(s):
 
-    :param: year `int` -- Default value = 2000 - The year of the archives
+    :param: cache_dir `str` -- The cache directory, None disables the cache -- defaults to None
 
-    :param: month `int` -- Default value = 4 - The month of the archives
+    :param: replay `bool` -- Offline mode, only replay the months from the cache and fail the
+    months missing from it -- defaults to False
 
   Output(s):
 
-    :return: archives `list` -- A list of documents under the `docs` key of the JSON.
-    This is the first phase of data wrangling. `docs` is the key for the actual documents we need
-    for the application.
-
-    :return: archives_count `int` -- The count of hits for the particular year-month combination.
-    This is obtained from the `hits` field of the `meta` field of the response JSON.
+    None
   '''
 
-  url_string = '{base_url}archive/v1/{year}/{month}.json?api-key={api_key}'.format(
-      base_url=__NYT_API_BASE_PATH__,
-      year=year,
-      month=month,
-      api_key=__API_KEY__)
+  global __ARCHIVES_CACHE__
 
-  json_string = None
+  __ARCHIVES_CACHE__ = ArchivesCache(cache_dir, replay=replay) if cache_dir is not None else None
 
-  with urlopen(url_string) as archive_response:
-    json_string = str(archive_response.read(), encoding='utf-8')
+  if __ARCHIVES_CACHE__ is not None:
+    warning('Caching the NYT archives API responses in {cache_dir}{mode}'.format(
+        cache_dir=cache_dir, mode=' (replay only)' if replay else ''))
 
-  json_string = loads(json_string)
+  return
 
-  return (json_string[__RESPONSE__][__ARCHIVES_DOC_KEY__],
-          json_string[__RESPONSE__][__ARCHIVES_META_KEY__][__ARCHIVES_META_HITS_KEY__])
 
+# Cache metrics
+def archives_cache_stats():
+  '''
+  archives_cache_stats() -> dict
 
-# modularizing insertion of data into the mongo cluster
-def __insert_documents__(client, year, month):
+  The metrics of the archives API response cache, see `ArchivesCache.stats`.
+
+  Output(s):
+
+    :return: stats `dict` -- The cache metrics, or None if the cache is disabled
   '''
-  __insert_documents__(client, year, month)
 
-  Inserts the documents for the year, month into the mongo cluster.
-  Uses the `insert_many` query style for bulk insert of documents into mongo.
+  return __ARCHIVES_CACHE__.stats() if __ARCHIVES_CACHE__ is not None else None
+
+
+# Enable the query result cache
+def set_query_cache(max_entries=256, ttl=300.0, cache_dir=None, enabled=True,
+                    generation_ttl=__GENERATION_TTL__):
+  '''
+  set_query_cache(max_entries=256, ttl=300.0, cache_dir=None, enabled=True, generation_ttl=1.0)
+
+  Enables the result cache of the query functions, see `QueryCache`. A cached result is returned
+  for the same function and arguments until its time to live runs out or the dataset is ingested
+  again. Streamed results are never cached.
+
+  Every cached call needs the dataset generation, one round trip to the cluster. It is read at most
+  once per `generation_ttl` seconds, so an ingest by another process is seen up to that late; the
+  ingests of this process are seen right away.
 
   Input(s):
 
-    :param: client `MongoClient` -- The client instance that will establish connection
-    to the Mongo cluster.
+    :param: max_entries `int` -- The number of results kept in memory -- defaults to 256
 
-    :param: year `int` -- The year for fetching data from NYT service.
+    :param: ttl `float` -- The seconds a result stays valid, None until the next ingest -- defaults
+    to 300
 
-    :param: month `int` -- The month for fetching data from NYT service.
+    :param: cache_dir `str` -- The directory of the on-disk tier, shared by the processes using the
+    same directory -- defaults to None, memory only
 
-  Internally invokes the ``invoke_archives_api(year=year, month=month)``.
+    :param: enabled `bool` -- False disables the cache -- defaults to True
 
-  Uses the global __DATABASE_NAME__ and __COLLECTION_NAME__ defined on the script level.
+    :param: generation_ttl `float` -- The seconds the dataset generation is reused, 0 reads it on
+    every call -- defaults to 1
 
   Output(s):
+
     None
   '''
 
-  archives, archives_count = invoke_archives_api(year=year, month=month)
-
-  db = client.get_database(__DATABASE_NAME__)
+  global __QUERY_CACHE__, __GENERATION_TTL__
 
-  db[__COLLECTION_NAME__].insert_many(archives)
+  __QUERY_CACHE__ = QueryCache(max_entries=max_entries, ttl=ttl,
+                               cache_dir=cache_dir) if enabled else None
+  __GENERATION_TTL__ = generation_ttl
+  __forget_generation__()
 
-  warning('''Created and inserted {archvies_count} archives for year: {year} month:{month} \
-        into {collection_name} collection.'''.format(archvies_count=archives_count,
-                                                     year=year,
-                                                     month=month,
-                                                     collection_name=__COLLECTION_NAME__))
   return
 
 
-# Create archives dataset
-def create_archives_dataset():
+# Query cache metrics
+def query_cache_stats():
   '''
-  create_archives_dataset()
+  query_cache_stats() -> dict
 
-  Creates the archives dataset on the mongo cluster.
+  The metrics of the query result cache, see `QueryCache.stats`.
+
+  Output(s):
+
+    :return: stats `dict` -- The cache metrics, or None if the cache is disabled
+  '''
+
+  return __QUERY_CACHE__.stats() if __QUERY_CACHE__ is not None else None
+
+
+# Enable the parallel partitioned aggregation
+def set_parallel_aggregation(workers=None, partitions=None, enabled=True):
+  '''
+  set_parallel_aggregation(workers=None, partitions=None, enabled=True)
+
+  Runs the raw `$group` pipelines of Query#7, 11, 12 and 13 (when they aren't answered from the
+  rollups or the sketches) as `partitions` publication date ranges aggregated concurrently by
+  `workers` threads, each on its own connection. The partial group counts are merged client-side,
+  then sorted and limited, see `__partitioned_aggregate__`.
 
   Input(s):
 
-    None
+    :param: workers `int` -- The number of partitions aggregated at a time -- defaults to the number
+    of cores
+
+    :param: partitions `int` -- The number of date ranges -- defaults to 4 per worker
+
+    :param: enabled `bool` -- False goes back to the single pipeline -- defaults to True
 
   Output(s):
 
     None
   '''
 
-  client = get_client()
-
-  months = [x for x in range(1, 13)]
+  global __PARALLEL_AGGREGATION__
 
-  # insert data for FIRST PHASE - 2005 - 2007 (Includes data from years
-  # 2005, 2006 and 2007)
-  for year in range(PHASE_1_START_YEAR, PHASE_1_END_YEAR + 1):
-    for month in months:
-      try:
-        __insert_documents__(client, year, month)
-      except Exception as e:
-        warning(
-            'Failed inserting data for year:{year}, month:{month}'.format(
-                year=year, month=month), e)
-
-  warning('Completed data insertion for Phase 1: 2005 - 2007')
-
-  # insert data for SECOND PHASE - 2015 - 2017 ( Includes data from years
-  # 2015, 2016 and few years of 2017)
-  for year in range(PHASE_2_START_YEAR, PHASE_2_END_YEAR + 1):
-    for month in months:
-      try:
-        __insert_documents__(client, year, month)
-      except Exception as e:
-        warning(
-            'Failed inserting data for year:{year}, month:{month}'.format(
-                year=year, month=month), e)
+  workers = max(1, workers or os.cpu_count() or 1)
 
-  warning('Completed data insertion for Phase 1: 2015 - 2017')
+  __PARALLEL_AGGREGATION__ = {
+      'workers': workers,
+      'partitions': max(1, partitions or workers * __AGGREGATION_PARTITIONS_PER_WORKER__)
+  } if enabled else None
 
   return
 
 
-# Query#3. Search for articles based on user entry.
-# Querying mongodb
-def search_in_articles(user_entry):
+# set the connection pool settings from run-time
+def set_client_options(max_pool_size=None, connect_timeout_ms=None,
+                       server_selection_timeout_ms=None, socket_timeout_ms=None):
   '''
-  search_in_articles(user_entry) -> list[dict]
-
-  Query#3 - Search for articles based on user entry.
+  set_client_options(max_pool_size=None, connect_timeout_ms=None,
+                     server_selection_timeout_ms=None, socket_timeout_ms=None)
 
-  Searches the articles on the `snippet`, `lead_paragraph` and `abstract` fields for the patterns
-  sought by the user. This function returns the cursor object that can then be iterated to get all
-  the matching articles.
+  Sets the connection pool size and the timeouts of the shared `MongoClient`. The current client,
+  if any, is closed so that the next `get_client` call picks up the new settings.
 
   Input(s):
 
-    :param: user_entry `str` -- The string or pattern the user is looking for.
-
-  Output(s):
+    :param: max_pool_size `int` -- The maximum number of connections per server
 
-    :return: articles `list[dict]` -- The list of article documents
-  '''
+    :param: connect_timeout_ms `int` -- The timeout for opening a connection
 
-  client = get_client()
+    :param: server_selection_timeout_ms `int` -- The timeout for finding a usable server
 
-  db = client.get_database(__DATABASE_NAME__)
+    :param: socket_timeout_ms `int` -- The timeout for a response on an open connection
 
-  '''
-  Sample mongo shell query:
+    None values leave the setting unchanged.
 
-  db.archives.find({
-      $and: [{
-          "document_type": "article"
-      }, {
+  Output(s):
 
-          $or: [{
-              "lead_paragraph": {
-                  $regex: /.*of the need.*/i
-              }
-          }, {
-              "snippet": {
-                  $regex: /.*of the need.*/i
-              }
-          }, {
-              "abstract": {
-                  $regex: /.*of the need.*/i
-              }
-          }]
-      }]
-  })
+    None
   '''
 
-  query = {
-      __AND__: [
-          {
-              __DOCUMENT_TYPE__: "article"
-          },
-          {
-              __OR__: [
-                  {
-                      __LEAD_PARAGRAPH__: {
-                          __REGEX__: re.compile('.*{pattern}.*'.format(
-                              pattern='.*'.join(user_entry.split(' '))),
-                              re.IGNORECASE)
-                      }
-                  },
-                  {
-                      __SNIPPET__: {
-                          __REGEX__: re.compile('.*{pattern}.*'.format(
-                              pattern='.*'.join(user_entry.split(' '))),
-                              re.IGNORECASE)
-                      }
-                  },
-                  {
-                      __ABSTRACT__: {
-                          __REGEX__: re.compile('.*{pattern}.*'.format(
-                              pattern='.*'.join(user_entry.split(' '))),
-                              re.IGNORECASE)
-                      }
-                  }
-              ]
-          }
-      ]
-  }
+  global __MAX_POOL_SIZE__, __CONNECT_TIMEOUT_MS__, __SERVER_SELECTION_TIMEOUT_MS__, \
+      __SOCKET_TIMEOUT_MS__
 
-  cursor = db[__COLLECTION_NAME__].find(query)
+  with __CLIENT_LOCK__:
+    if max_pool_size is not None:
+      __MAX_POOL_SIZE__ = max_pool_size
+    if connect_timeout_ms is not None:
+      __CONNECT_TIMEOUT_MS__ = connect_timeout_ms
+    if server_selection_timeout_ms is not None:
+      __SERVER_SELECTION_TIMEOUT_MS__ = server_selection_timeout_ms
+    if socket_timeout_ms is not None:
+      __SOCKET_TIMEOUT_MS__ = socket_timeout_ms
 
-  articles = list(cursor) if cursor is not None else list()
+    close_client()
 
-  return articles
+  return
 
 
-# Query#4. Find articles by reporter name.
-def search_articles_reporter_name(first_name='', middle_name='', last_name=''):
+# Connection to MongoDB
+def get_client():
   '''
-  search_articles_reporter_name(first_name, middle_name, last_name) -> list[dict]
-
-  Query#4. Find articles by reporter name.
+  get_client() -> MongoClient
 
-  Searches the articles for the given name of reporter and then returns the cursor object which can
-  be iterated upon to get the matching list of articles.
+  Returns the process-wide `MongoClient`, connecting to the MongoDB instance on the first call.
 
-  The status being looked for is ```reported```. Other statuses are ignored.
+  The client holds a pool of connections and is thread-safe, so every query function and ingest
+  worker shares it instead of paying for a new client, server discovery and connection setup on
+  each call. A forked child process never reuses the client of its parent, it lazily creates its
+  own.
 
-  Input(s):
+  Output(s):
 
-    :param: first_name `str` -- The first name of the reporter. -- defaults to ''
+    :return: client `MongoClient` -- The mongo DB client
+  '''
 
-    :param: middle_name `str` -- The middle name of the reporter.  -- defaults to ''
+  global __CLIENT__, __CLIENT_PID__
 
-    :param last_name `str` -- The last name of the reporter.  -- defaults to ''
+  with __CLIENT_LOCK__:
+    __CLIENT_STATS__['get_client_calls'] += 1
 
-  Output(s):
+    if __CLIENT__ is not None and __CLIENT_PID__ == os.getpid():
+      return __CLIENT__
 
-    :return: articles `list[dict]` -- The list of article documents
-  '''
+    warning('Connecting to mongodb://{hostname}:{port}'.format(hostname=__HOSTNAME__,
+                                                               port=__PORT__))
 
-  client = get_client()
+    started_at = perf_counter()
 
-  db = client.get_database(__DATABASE_NAME__)
+    __CLIENT__ = MongoClient('mongodb://{hostname}:{port}'.format(hostname=__HOSTNAME__,
+                                                                  port=__PORT__),
+                             maxPoolSize=__MAX_POOL_SIZE__,
+                             connectTimeoutMS=__CONNECT_TIMEOUT_MS__,
+                             serverSelectionTimeoutMS=__SERVER_SELECTION_TIMEOUT_MS__,
+                             socketTimeoutMS=__SOCKET_TIMEOUT_MS__)
+    __CLIENT_PID__ = os.getpid()
 
-  '''
-  Sample mongo shell query:
+    __CLIENT_STATS__['clients_created'] += 1
+    __CLIENT_STATS__['connect_seconds'] += perf_counter() - started_at
 
-  db.archives.find({
-        $and: [
-          {
-            'byline.person.firstname': 'Constance'
-          },
-          {
-            'byline.person.middlename': 'L.'
-          },
-          {
-            'byline.person.lastname': 'HAYS'
-          },
-          {
-            'byline.person.role': 'reported'
-          },
-          {
-            'document_type': 'article'
-          }
-        ]
-  })
-  '''
+    warning('Connection established...')
 
-  query = {
-      __AND__: [
-          {
-              '{byline}.{person}.{first_name}'.format(
-                  byline=__BYLINE__,
-                  person=__PERSON__,
-                  first_name=__FIRSTNAME__): {
-                  __REGEX__: re.compile('.*{firstname}.*'.format(firstname=first_name),
-                                        re.IGNORECASE)
-              }
-          },
-          {
-              '{byline}.{person}.{middle_name}'.format(
-                  byline=__BYLINE__,
-                  person=__PERSON__,
-                  middle_name=__MIDDLENAME__): {
-                  __REGEX__: re.compile('.*{middlename}.*'.format(middlename=middle_name),
-                                        re.IGNORECASE)
-              }
-          },
-          {
-              '{byline}.{person}.{last_name}'.format(
-                  byline=__BYLINE__,
-                  person=__PERSON__,
-                  last_name=__LASTNAME__): {
-                  __REGEX__: re.compile('.*{lastname}.*'.format(lastname=last_name),
-                                        re.IGNORECASE)
-              }
-          },
-          {
-              '{byline}.{person}.{role}'.format(
-                  byline=__BYLINE__,
-                  person=__PERSON__,
-                  role=__ROLE__): 'reported'
-          },
-          {
-              __DOCUMENT_TYPE__: 'article'
-          }
-      ]
-  }
+    return __CLIENT__
 
-  cursor = db[__COLLECTION_NAME__].find(query)
 
-  articles = list(cursor) if cursor is not None else list()
+# Closing the shared client
+def close_client():
+  '''
+  close_client()
 
-  return articles
+  Closes the process-wide `MongoClient` and its connection pool. The next `get_client` call
+  connects again.
 
+  Output(s):
 
-# Query#13. List all the types of material with article count
-def list_articles_type_of_materials():
+    None
   '''
 
-  list_articles_type_of_materials() -> list[dict]
+  global __CLIENT__, __CLIENT_PID__
 
-  Query#13. List all the types of material with article count.
+  with __CLIENT_LOCK__:
+    # the sockets of a client inherited through fork belong to the parent, leave them alone
+    if __CLIENT__ is not None and __CLIENT_PID__ == os.getpid():
+      __CLIENT__.close()
 
-  This function will list all the articles according to the `type_of_material` field and their
-  associated counts.
+    __CLIENT__ = None
+    __CLIENT_PID__ = None
 
-  Input(s):
+  return
 
-    None
 
-  Output(s):
+# Connection metrics
+def client_stats():
+  '''
+  client_stats() -> dict
 
-    :return: articles `list[dict]` -- The list of articles
+  The metrics of the shared `MongoClient`: `get_client_calls`, `clients_created`, the
+  `connect_seconds` spent creating clients and the average `connect_seconds_per_call`, i.e the
+  connection overhead paid per query.
 
-  Note: Internally uses the mongo's pipeline aggregation query instead of map-reduce query.
+  Output(s):
+
+    :return: stats `dict` -- The connection metrics
   '''
 
-  client = get_client()
+  with __CLIENT_LOCK__:
+    stats = dict(__CLIENT_STATS__)
 
-  db = client.get_database(__DATABASE_NAME__)
+  stats['connect_seconds_per_call'] = (stats['connect_seconds'] / stats['get_client_calls']
+                                       if stats['get_client_calls'] > 0 else 0.0)
 
-  # a grouping query, followed by pipeline aggregation
-  # unlike the `find` queries, pymongo expects a `list` as argument
-  # for `aggregate` queries.
+  return stats
 
+
+# a forked child must not touch the connection pool inherited from its parent
+def __forget_client__():
   '''
-  Sample Mongo shell query:
+  __forget_client__()
 
-  db.archives.aggregate({
-    $group: {
-      '_id': '$type_of_material',
-      'count': {
-        $sum: 1
-      }
-    }
-  })
+  Drops the reference to the client inherited from the parent process after a fork.
   '''
 
-  pipeline_query = [
-      {
-          __GROUP__: {
-              __ID_OP__: '${type}'.format(type=__TYPE_OF_MATERIAL__),
-              'count': {
-                  __SUM__: 1
-              }
-          }
-      }
-  ]
+  global __CLIENT__, __CLIENT_PID__, __CLIENT_LOCK__
 
-  cursor = db[__COLLECTION_NAME__].aggregate(pipeline_query, allowDiskUse=True)
+  __CLIENT_LOCK__ = RLock()
+  __CLIENT__ = None
+  __CLIENT_PID__ = None
 
-  articles = list(cursor) if cursor is not None else list()
 
-  return articles
+if hasattr(os, 'register_at_fork'):
+  os.register_at_fork(after_in_child=__forget_client__)
 
 
-# Query#7. Find the most productive reporter (reporter)
-def most_productive_reporter():
+# Rate limiting for the NYT archives API
+class TokenBucket(object):
   '''
+  TokenBucket(rate, capacity=None)
 
-  most_productive_reporter() -> dict
+  A thread-safe token bucket that keeps the calls to the NYT archives API within the
+  per-second quota. Tokens are refilled continuously at `rate` tokens per second up to
+  `capacity`, and every API call consumes one token.
+
+  Input(s):
+
+    :param: rate `float` -- The number of tokens added per second, i.e the requests per second.
+
+    :param: capacity `int` -- The maximum burst size -- defaults to `max(1, rate)`
+  '''
+
+  def __init__(self, rate, capacity=None):
+    self.rate = float(rate)
+    self.capacity = float(capacity if capacity is not None else max(1, rate))
+    self._tokens = self.capacity
+    self._updated_at = monotonic()
+    self._lock = Lock()
+
+  def acquire(self):
+    '''
+    acquire() -> float
+
+    Blocks until a token is available and consumes it.
+
+    Output(s):
+
+      :return: waited `float` -- The number of seconds spent waiting for the token.
+    '''
+
+    waited = 0.0
+
+    while True:
+      with self._lock:
+        now = monotonic()
+        self._tokens = min(self.capacity,
+                           self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+        if self._tokens >= 1:
+          self._tokens -= 1
+          return waited
+
+        delay = (1 - self._tokens) / self.rate
+
+      sleep(delay)
+      waited += delay
+
+  def try_acquire(self):
+    '''
+    try_acquire() -> bool
+
+    Consumes a token if one is available, without waiting.
+
+    Output(s):
+
+      :return: acquired `bool` -- False when the bucket is empty
+    '''
+
+    with self._lock:
+      now = monotonic()
+      self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+      self._updated_at = now
+
+      if self._tokens >= 1:
+        self._tokens -= 1
+        return True
+
+      return False
+
+
+# Creation of archives dataset
+# The URL of the NYT archives API for the year, month
+def __archives_url__(year, month):
+  '''
+  __archives_url__(year, month) -> str
+
+  Builds the NYT archives API URL for the year, month.
+  '''
+
+  return '{base_url}archive/v1/{year}/{month}.json?api-key={api_key}'.format(
+      base_url=__NYT_API_BASE_PATH__,
+      year=year,
+      month=month,
+      api_key=__API_KEY__)
+
+
+# Incremental parsing of the NYT archives API response
+def iter_archive_documents(stream, meta=None, chunk_size=__STREAM_CHUNK_SIZE__):
+  '''
+  iter_archive_documents(stream, meta=None, chunk_size) -> generator[dict]
+
+  Incrementally parses the archives API response read from `stream` and yields the documents under
+  `response.docs` one at a time, as the bytes arrive.
+
+  Only the document being decoded and at most one `chunk_size` read are held in memory, instead of
+  the raw bytes, the decoded string and the parsed JSON of the whole month. A value cut short by
+  the end of the buffer is decoded again once the buffer has doubled, a malformed one fails right
+  away and a value larger than __STREAM_MAX_VALUE_SIZE__ characters fails the response.
+
+  Input(s):
+
+    :param: stream `file-like` -- A binary stream with a `read(size)` method, eg: the response
+    returned by `urlopen`
+
+    :param: meta `dict` -- Filled in with the `response.meta` object when it is parsed. The NYT API
+    may send `meta` after `docs`, so it is complete only once the generator is exhausted.
+    -- defaults to None
+
+    :param: chunk_size `int` -- The number of bytes read from the stream at a time -- defaults to
+    __STREAM_CHUNK_SIZE__
+
+  Output(s):
+
+    :return: documents `generator[dict]` -- The documents of the month
+  '''
+
+  decoder = JSONDecoder()
+  text_decoder = getincrementaldecoder('utf-8')()
+
+  # `buffer[position:]` is the unparsed part of the response read so far
+  state = {'buffer': '', 'position': 0, 'eof': False}
+
+  def fill(size=chunk_size):
+    if state['eof']:
+      return False
+
+    chunk = stream.read(size)
+
+    if not chunk:
+      state['eof'] = True
+      state['buffer'] += text_decoder.decode(b'', final=True)
+      return False
+
+    # drop the consumed part of the buffer before growing it
+    state['buffer'] = state['buffer'][state['position']:] + text_decoder.decode(chunk)
+    state['position'] = 0
+
+    return True
+
+  def peek():
+    while True:
+      buffer, position = state['buffer'], state['position']
+
+      while position < len(buffer) and buffer[position] in ' \t\n\r':
+        position += 1
+
+      state['position'] = position
+
+      if position < len(buffer):
+        return buffer[position]
+
+      if not fill():
+        raise ValueError('Unexpected end of the archives API response')
+
+  def expect(characters):
+    character = peek()
+
+    if character not in characters:
+      raise ValueError(
+          'Expected one of {expected!r} in the archives API response, found {found!r}'.format(
+              expected=characters, found=character))
+
+    state['position'] += 1
+
+    return character
+
+  def truncated(error):
+    # a string, an escape or a literal (at most `-Infinity`) running into the end of the buffer
+    return error.msg.startswith('Unterminated string') or error.pos >= len(error.doc) - 9
+
+  def grow():
+    # doubling the unparsed part keeps the decoding retries linear in the size of the value
+    pending = len(state['buffer']) - state['position']
+
+    if pending > __STREAM_MAX_VALUE_SIZE__:
+      raise ValueError('A value of the archives API response exceeds {size} characters'.format(
+          size=__STREAM_MAX_VALUE_SIZE__))
+
+    grown = False
+
+    while fill(max(chunk_size, pending)):
+      grown = True
+
+      if len(state['buffer']) - state['position'] >= 2 * pending:
+        break
+
+    return grown
+
+  def value():
+    peek()
+
+    while True:
+      try:
+        parsed, end = decoder.raw_decode(state['buffer'], state['position'])
+      except JSONDecodeError as e:
+        if truncated(e) and grow():
+          continue
+        raise
+
+      # numbers and literals are not self delimiting, make sure the value was not cut short: a
+      # number is only complete once a character that can't continue it follows
+      if end == len(state['buffer']) or (
+          isinstance(parsed, (int, float)) and not isinstance(parsed, bool) and
+          all(character in __NUMBER_CHARACTERS__ for character in state['buffer'][end:])):
+        if fill():
+          continue
+
+      state['position'] = end
+
+      return parsed
+
+  def members():
+    expect('{')
+
+    if peek() == '}':
+      state['position'] += 1
+      return
+
+    while True:
+      key = value()
+      expect(':')
+      yield key
+
+      if expect(',}') == '}':
+        return
+
+  for key in members():
+    if key != __RESPONSE__:
+      value()
+      continue
+
+    for response_key in members():
+      if response_key == __ARCHIVES_DOC_KEY__:
+        expect('[')
+
+        if peek() == ']':
+          state['position'] += 1
+          continue
+
+        while True:
+          yield value()
+
+          if expect(',]') == ']':
+            break
+
+      elif response_key == __ARCHIVES_META_KEY__ and meta is not None:
+        meta.update(value())
+
+      else:
+        value()
+
+
+# NYT Arcives API for fetching data from NYT
+def invoke_archives_api(year=2000, month=4):
+  '''
+  invoke_archives_api(year = 2000, month = 4) -> (list, int)
+
+  Invokes the NYT archives API and generates the dataset like the one in `nyt_archives.json`.
+
+  Takes year and month as the arguments.
+
+  Input(s):
+
+    :param: year `int` -- Default value = 2000 - The year of the archives
+
+    :param: month `int` -- Default value = 4 - The month of the archives
+
+  Output(s):
+
+    :return: archives `list` -- A list of documents under the `docs` key of the JSON.
+    This is the first phase of data wrangling. `docs` is the key for the actual documents we need
+    for the application.
+
+    :return: archives_count `int` -- The count of hits for the particular year-month combination.
+    This is obtained from the `hits` field of the `meta` field of the response JSON.
+
+  Note: Use `iter_archive_documents` directly to avoid holding the whole month in memory.
+  '''
+
+  meta = dict()
+
+  archive_response, _ = __open_archives__(year, month, retries=0)
+
+  with archive_response:
+    archives = list(iter_archive_documents(archive_response, meta=meta))
+
+  return (archives, meta.get(__ARCHIVES_META_HITS_KEY__, len(archives)))
+
+
+# retrying the NYT archives API calls with backoff
+def __open_archives__(year, month, limiter=None, retries=__API_MAX_RETRIES__,
+                      backoff=__API_RETRY_BACKOFF__):
+  '''
+  __open_archives__(year, month, limiter=None, retries, backoff) -> (HTTPResponse, int)
+
+  Opens the NYT archives API response for the year, month and retries the call with exponential
+  backoff when it fails. A `429 Too Many Requests` response honours the `Retry-After` header sent
+  back by the API.
+
+  When the archives cache is enabled, a cached month is opened from the local disk without calling
+  the API, and a downloaded month is saved into the cache as it is read.
+
+  Input(s):
+
+    :param: year `int` -- The year of the archives
+
+    :param: month `int` -- The month of the archives
+
+    :param: limiter `TokenBucket` -- The rate limiter shared by all the workers -- defaults to None
+
+    :param: retries `int` -- The number of retries after the first failed attempt
+
+    :param: backoff `float` -- The seconds to wait before the first retry, doubled for every retry
+
+  Output(s):
+
+    :return: archive_response `HTTPResponse` -- The open response, to be read by the caller
+
+    :return: attempts `int` -- The number of API calls made, 0 for a cached month
+  '''
+
+  cache = __ARCHIVES_CACHE__
+
+  if cache is not None:
+    cached_response = cache.open(year, month)
+
+    if cached_response is not None:
+      return cached_response, 0
+
+  attempt = 0
+
+  while True:
+    attempt += 1
+
+    if limiter is not None:
+      limiter.acquire()
+
+    try:
+      archive_response = urlopen(__archives_url__(year, month))
+
+      if cache is not None:
+        archive_response = cache.record(year, month, archive_response)
+
+      return archive_response, attempt
+    except Exception as e:
+      if attempt > retries:
+        raise
+
+      delay = __retry_delay__(e, attempt, backoff)
+
+      warning('Retrying year:{year} month:{month} in {delay:.2f}s after attempt#{attempt} failed: {e}'.format(
+          year=year, month=month, delay=delay, attempt=attempt, e=e))
+
+      sleep(delay)
+
+
+# The wait before retrying a failed API call
+def __retry_delay__(error, attempt, backoff):
+  '''
+  __retry_delay__(error, attempt, backoff) -> float
+
+  The exponential backoff after the failed attempt, at least the `Retry-After` seconds of a
+  `429 Too Many Requests` response.
+  '''
+
+  delay = backoff * (2 ** (attempt - 1))
+
+  if isinstance(error, HTTPError) and error.code == __HTTP_TOO_MANY_REQUESTS__:
+    retry_after = error.headers.get(__RETRY_AFTER_HEADER__) if error.headers is not None else None
+    if retry_after is not None and retry_after.isdigit():
+      delay = max(delay, float(retry_after))
+
+  return delay
+
+
+# grouping the streamed documents for the bulk inserts
+def __batches__(iterable, batch_size, batch_bytes=None, size_of=None):
+  '''
+  __batches__(iterable, batch_size, batch_bytes=None, size_of=None) -> generator[(list, int)]
+
+  Groups the items of the iterable into lists of at most `batch_size` items, and of at most
+  `batch_bytes` bytes as measured by `size_of`. An item larger than `batch_bytes` gets a batch of
+  its own.
+
+  Output(s):
+
+    :return: batches `generator[(list, int)]` -- The batches and their size in bytes (0 when
+    `batch_bytes` isn't given)
+  '''
+
+  batch = list()
+  size = 0
+
+  for item in iterable:
+    item_size = size_of(item) if batch_bytes is not None else 0
+
+    if len(batch) > 0 and batch_bytes is not None and size + item_size > batch_bytes:
+      yield batch, size
+      batch, size = list(), 0
+
+    batch.append(item)
+    size += item_size
+
+    if len(batch) >= batch_size:
+      yield batch, size
+      batch, size = list(), 0
+
+  if len(batch) > 0:
+    yield batch, size
+
+
+# The BSON size of a document
+def __bson_size__(document):
+  '''
+  __bson_size__(document) -> int
+
+  The size in bytes of the document once encoded to BSON.
+  '''
+
+  return len(BSON.encode(document))
+
+
+# hashing the raw API response while it is being parsed
+class __DigestReader__(object):
+  '''
+  __DigestReader__(stream)
+
+  Wraps a binary stream and computes the sha256 of everything read through it.
+  '''
+
+  def __init__(self, stream):
+    self.stream = stream
+    self.digest = sha256()
+
+  def read(self, size=-1):
+    chunk = self.stream.read(size)
+    self.digest.update(chunk)
+    return chunk
+
+
+# upserts keyed on the article `_id`
+def __upsert_requests__(documents):
+  '''
+  __upsert_requests__(documents) -> list
+
+  Builds the `bulk_write` requests replacing every document by its `_id`, so writing the same
+  month twice doesn't duplicate the articles. Documents without an `_id` are inserted.
+  '''
+
+  return [ReplaceOne({__ID__: document[__ID__]}, document, upsert=True)
+          if __ID__ in document else InsertOne(document)
+          for document in documents]
+
+
+# parsing the `pub_date` strings
+def parse_pub_date(pub_date):
+  '''
+  parse_pub_date(pub_date) -> datetime
+
+  Parses the `pub_date` string of an article, eg: `2000-04-01T00:00:00Z` or
+  `2015-01-01T00:00:00+0000`, into a naive UTC datetime (the way pymongo stores BSON dates).
+
+  Input(s):
+
+    :param: pub_date `str` -- The publication date string
+
+  Output(s):
+
+    :return: pub_datetime `datetime` -- The publication date, or None if it can't be parsed
+  '''
+
+  if not isinstance(pub_date, str):
+    return None
+
+  for date_format in __PUB_DATE_FORMATS__:
+    try:
+      parsed = datetime.strptime(pub_date, date_format)
+    except ValueError:
+      continue
+
+    if parsed.tzinfo is not None:
+      parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+
+    return parsed
+
+  return None
+
+
+# Case folding a byline name
+def __fold_name__(name):
+  '''
+  __fold_name__(name) -> str
+
+  The case folded form of a byline name or a keyword value, lower case, without accents, periods,
+  commas and apostrophes, the other separators collapsed to single spaces, eg: `O'Brien` ->
+  `obrien`, `L.` -> `l`, `Jean-Paul` -> `jean paul`. None and blank names fold to `''`.
+  '''
+
+  if not name:
+    return ''
+
+  name = ''.join(character for character in unicode_normalize('NFKD', str(name))
+                 if not combining(character))
+  name = __NAME_DROPPED_PATTERN__.sub('', name.casefold())
+
+  return __NAME_SEPARATOR_PATTERN__.sub(' ', name).strip()
+
+
+# The case folded names of the byline persons
+def __reporter_names__(document):
+  '''
+  __reporter_names__(document) -> list[dict]
+
+  The `first`, `middle`, `last` and full `name` of every person of the byline, case folded (see
+  `__fold_name__`), with their `role`.
+  '''
+
+  byline = document.get(__BYLINE__)
+  persons = (byline.get(__PERSON__) if isinstance(byline, dict) else None) or list()
+
+  reporter_names = list()
+
+  for person in persons:
+    if not isinstance(person, dict):
+      continue
+
+    first, middle, last = (__fold_name__(person.get(part))
+                           for part in (__FIRSTNAME__, __MIDDLENAME__, __LASTNAME__))
+
+    reporter_names.append({
+        __NAME_FIRST__: first,
+        __NAME_MIDDLE__: middle,
+        __NAME_LAST__: last,
+        __NAME_KEY__: ' '.join(part for part in (first, middle, last) if part),
+        __ROLE__: person.get(__ROLE__)
+    })
+
+  return reporter_names
+
+
+# The typed fields derived from the article
+def __derived_fields__(document):
+  '''
+  __derived_fields__(document) -> dict
+
+  Computes the typed fields derived from the raw article:
+
+    `pub_datetime` -- the `pub_date` as a BSON date
+    `pub_year`, `pub_month` -- `int`s taken from `pub_datetime`
+    `page` -- the `print_page` as an `int`, eg: `A1` -> 1, None when there is no page
+    `keyword_values` -- the keyword values grouped by keyword name, eg:
+    `{"subject": ["DOLLS", "TOYS"], "organizations": ["MATTEL INC"]}`
+    `reporter_names` -- the case folded names of the byline persons, eg:
+    `[{"first": "constance", "middle": "l", "last": "hays", "name": "constance l hays",
+    "role": "reported"}]`
+  '''
+
+  pub_datetime = parse_pub_date(document.get(__PUB_DATE__))
+
+  print_page = document.get(__PRINT_PAGE__)
+  page = __PAGE_PATTERN__.search(str(print_page)) if print_page is not None else None
+
+  keyword_values = dict()
+
+  for keyword in document.get(__KEYWORDS__) or list():
+    name, value = keyword.get(__KEYWORDS_NAME__), keyword.get(__KEYWORDS_VALUE__)
+
+    if name and value:
+      keyword_values.setdefault(name, list()).append(value)
+
+  return {
+      __PUB_DATETIME__: pub_datetime,
+      __PUB_YEAR__: pub_datetime.year if pub_datetime is not None else None,
+      __PUB_MONTH__: pub_datetime.month if pub_datetime is not None else None,
+      __PAGE__: int(page.group()) if page is not None else None,
+      __KEYWORD_VALUES__: keyword_values,
+      __REPORTER_NAMES__: __reporter_names__(document)
+  }
+
+
+# The normalization stage of the ingest
+def normalize_document(document):
+  '''
+  normalize_document(document) -> dict
+
+  Adds the typed derived fields to the article, so that the date, page, keyword and reporter name
+  queries can be served by indexes instead of regexes and string comparisons. The raw fields are
+  left untouched.
+
+  Input(s):
+
+    :param: document `dict` -- The article as returned by the NYT archives API
+
+  Output(s):
+
+    :return: document `dict` -- The same article with `pub_datetime`, `pub_year`, `pub_month`,
+    `page`, `keyword_values` and `reporter_names` set
+  '''
+
+  document.update(__derived_fields__(document))
+
+  return document
+
+
+# The write options for the ingest
+def write_options(profile=__BULK_WRITE_PROFILE__, **overrides):
+  '''
+  write_options(profile='bulk', **overrides) -> dict
+
+  Builds the write options used when inserting the archives.
+
+  Input(s):
+
+    :param: profile `str` -- `bulk` (w=1, j=False, unordered) for the initial loads or `durable`
+    (w=majority, j=True, ordered) for the incremental loads -- defaults to `bulk`
+
+    :param: overrides -- Any of `w`, `j`, `ordered`, `batch_size` (documents per `bulk_write`) and
+    `batch_bytes` (BSON bytes per `bulk_write`, None for no limit). None values are ignored.
+
+  Output(s):
+
+    :return: options `dict` -- The write options
+  '''
+
+  if profile not in __WRITE_PROFILES__:
+    raise ValueError('Unknown write profile {profile}, use one of {profiles}'.format(
+        profile=profile, profiles=', '.join(sorted(__WRITE_PROFILES__))))
+
+  options = dict(__WRITE_PROFILES__[profile])
+
+  for key, value in overrides.items():
+    if key not in options:
+      raise ValueError('Unknown write option {key}'.format(key=key))
+    if value is not None:
+      options[key] = value
+
+  return options
+
+
+# writing one batch, timed
+def __write_batch__(collection, batch, batch_bytes, ordered):
+  '''
+  __write_batch__(collection, batch, batch_bytes, ordered) -> dict
+
+  Upserts the batch with `bulk_write`. In unordered mode the server carries on after a bad
+  document, the failed writes are counted and logged instead of failing the month.
+
+  Output(s):
+
+    :return: batch_report `dict` -- `count`, `bytes`, `errors` and `seconds` of the batch, and the
+    `failed` set of the positions in the batch of the documents that weren't written
+  '''
+
+  started_at = perf_counter()
+  failed = set()
+
+  try:
+    collection.bulk_write(__upsert_requests__(batch), ordered=ordered)
+  except BulkWriteError as e:
+    if ordered:
+      raise
+
+    write_errors = e.details.get('writeErrors', list())
+    failed = set(write_error['index'] for write_error in write_errors)
+    warning('{errors} of {count} documents failed to be written: {first}'.format(
+        errors=len(write_errors), count=len(batch), first=(write_errors or [None])[0]))
+
+  errors = len(failed)
+
+  seconds = perf_counter() - started_at
+
+  info('Wrote a batch of {count} documents ({size} bytes) in {seconds:.3f}s'.format(
+      count=len(batch), size=batch_bytes, seconds=seconds))
+
+  return {'count': len(batch) - errors, 'bytes': batch_bytes, 'errors': errors, 'seconds': seconds,
+          'failed': failed}
+
+
+# modularizing insertion of data into the mongo cluster
+def __insert_documents__(client, year, month, limiter=None, retries=__API_MAX_RETRIES__,
+                         options=None, backoff=__API_RETRY_BACKOFF__):
+  '''
+  __insert_documents__(client, year, month, limiter=None, retries, options=None, backoff) -> dict
+
+  Inserts the documents for the year, month into the mongo cluster.
+  The documents are streamed out of the API response and upserted on their `_id` with
+  `bulk_write` in batches bounded by count and by BSON bytes, so the memory used is bounded by the
+  batch size instead of the size of the month and re-running a month never duplicates its articles.
+
+  The whole month, the API call, the parsing of the response and the upserts, is retried with
+  exponential backoff when it fails, eg: on a response cut off while it is streamed. The upserts
+  make replaying the month idempotent, and every attempt counts its rollups from scratch. A failed
+  ordered `bulk_write` is not retried, replaying the same documents would fail the same way.
+
+  Input(s):
+
+    :param: client `MongoClient` -- The client instance that will establish connection
+    to the Mongo cluster.
+
+    :param: year `int` -- The year for fetching data from NYT service.
+
+    :param: month `int` -- The month for fetching data from NYT service.
+
+    :param: limiter `TokenBucket` -- The rate limiter for the API calls -- defaults to None
+
+    :param: retries `int` -- The number of retries of the month -- defaults to
+    __API_MAX_RETRIES__
+
+    :param: options `dict` -- The write concern, ordering and batch sizes, see `write_options`
+    -- defaults to the `bulk` profile
+
+    :param: backoff `float` -- The seconds to wait before the first retry, doubled for every retry
+    -- defaults to __API_RETRY_BACKOFF__
+
+  Internally opens the API response with ``__open_archives__``, parses it with
+  ``iter_archive_documents`` and adds the derived fields with ``normalize_document``.
+
+  Uses the global __DATABASE_NAME__ and __COLLECTION_NAME__ defined on the script level.
+
+  Output(s):
+
+    :return: insert_report `dict` -- `count` (documents written), `errors` (documents that failed),
+    `hash` (sha256 hex digest of the raw API response), `batches`, `write_seconds`,
+    `max_batch_seconds` and the `rollups` counted for the month over the documents written (see
+    `__count_rollups__`).
+  '''
+
+  options = write_options() if options is None else options
+
+  collection = client.get_database(__DATABASE_NAME__).get_collection(
+      __COLLECTION_NAME__, write_concern=WriteConcern(w=options['w'], j=options['j']))
+
+  attempt = 0
+
+  while True:
+    attempt += 1
+
+    try:
+      return __insert_month__(collection, year, month, limiter, options)
+    except BulkWriteError:
+      raise
+    except Exception as e:
+      if attempt > retries:
+        raise
+
+      delay = __retry_delay__(e, attempt, backoff)
+
+      warning('Retrying year:{year} month:{month} in {delay:.2f}s after attempt#{attempt} failed: '
+              '{e}'.format(year=year, month=month, delay=delay, attempt=attempt, e=e))
+
+      sleep(delay)
+
+
+# One attempt at inserting the documents of a month
+def __insert_month__(collection, year, month, limiter, options):
+  '''
+  __insert_month__(collection, year, month, limiter, options) -> dict
+
+  Makes a single API call for the year, month and upserts its documents, see
+  `__insert_documents__`.
+  '''
+
+  meta = dict()
+  batch_reports = list()
+  rollups = dict()
+
+  archive_response, _ = __open_archives__(year, month, limiter=limiter, retries=0)
+
+  with archive_response:
+    reader = __DigestReader__(archive_response)
+    documents = (normalize_document(document)
+                 for document in iter_archive_documents(reader, meta=meta))
+    for batch, batch_bytes in __batches__(documents,
+                                          options['batch_size'],
+                                          batch_bytes=options['batch_bytes'],
+                                          size_of=__bson_size__):
+      batch_report = __write_batch__(collection, batch, batch_bytes, options['ordered'])
+      batch_reports.append(batch_report)
+
+      # only the documents that made it into the collection are counted into the rollups
+      for position, document in enumerate(batch):
+        if position not in batch_report['failed']:
+          __count_rollups__(rollups, document)
+
+  inserted_count = sum(batch_report['count'] for batch_report in batch_reports)
+
+  warning('''Created and inserted {archvies_count} archives for year: {year} month:{month} \
+        into {collection_name} collection.'''.format(
+      archvies_count=meta.get(__ARCHIVES_META_HITS_KEY__, inserted_count),
+      year=year,
+      month=month,
+      collection_name=__COLLECTION_NAME__))
+  return {
+      'count': inserted_count,
+      'errors': sum(batch_report['errors'] for batch_report in batch_reports),
+      'hash': reader.digest.hexdigest(),
+      'batches': len(batch_reports),
+      'write_seconds': sum(batch_report['seconds'] for batch_report in batch_reports),
+      'max_batch_seconds': max([batch_report['seconds'] for batch_report in batch_reports] or [0.0]),
+      'rollups': rollups
+  }
+
+
+# The manifest collection of the archives collection
+def __manifest__(client):
+  '''
+  __manifest__(client) -> Collection
+
+  The manifest collection, `<collection>_manifest`, kept next to the archives collection. It has
+  one document per month, keyed on `yyyy-mm`, with the `status`, document `count`, content `hash`
+  and the `error` of the last ingest of that month.
+  '''
+
+  return client.get_database(__DATABASE_NAME__)[__COLLECTION_NAME__ + __MANIFEST_SUFFIX__]
+
+
+def __month_key__(year, month):
+  '''
+  __month_key__(year, month) -> str
+
+  The manifest key for the year, month, eg: `2005-01`.
+  '''
+
+  return '{year:04d}-{month:02d}'.format(year=year, month=month)
+
+
+# Recording the progress of a month in the manifest
+def __mark_month__(client, year, month, status, **fields):
+  '''
+  __mark_month__(client, year, month, status, **fields)
+
+  Upserts the manifest entry for the year, month with the status and the extra fields.
+  '''
+
+  fields.update({'year': year, 'month': month, 'status': status, 'updated_at': datetime.utcnow()})
+
+  __manifest__(client).update_one({__ID__: __month_key__(year, month)},
+                                  {__SET__: fields},
+                                  upsert=True)
+
+  return
+
+
+# Reading the manifest
+def read_manifest(client=None):
+  '''
+  read_manifest(client=None) -> dict
+
+  Reads the ingest manifest of the archives collection.
+
+  Input(s):
+
+    :param: client `MongoClient` -- The client to use -- defaults to a new client
+
+  Output(s):
+
+    :return: manifest `dict` -- The manifest entries keyed on (year, month)
+  '''
+
+  client = get_client() if client is None else client
+
+  return {(entry['year'], entry['month']): entry for entry in __manifest__(client).find()}
+
+
+# Whether every ingested month carries a manifest flag
+def __months_ready__(client, flag):
+  '''
+  __months_ready__(client, flag) -> bool
+
+  True once some month was ingested and every month ingested has the manifest `flag` set, eg:
+  `rollups` or `sketches`. Datasets ingested before the flag existed, or without a manifest, don't.
+  '''
+
+  manifest = __manifest__(client)
+
+  return manifest.find_one({'status': __MONTH_DONE__}) is not None and \
+      manifest.find_one({'status': __MONTH_DONE__, flag: {'$ne': True}}) is None
+
+
+# The dataset generation, bumped by every ingest
+def dataset_generation(client=None):
+  '''
+  dataset_generation(client=None) -> int
+
+  The generation of the archives dataset, a counter bumped every time months are ingested or the
+  articles are updated. The query result cache drops the results of the older generations.
+
+  Input(s):
+
+    :param: client `MongoClient` -- The client to use -- defaults to the shared client
+
+  Output(s):
+
+    :return: generation `int` -- The current generation, 0 for a dataset never ingested
+  '''
+
+  client = get_client() if client is None else client
+
+  generation = client.get_database(__DATABASE_NAME__)[
+      __COLLECTION_NAME__ + __GENERATION_SUFFIX__].find_one({__ID__: __GENERATION_ID__})
+
+  return generation[__GENERATION_ID__] if generation is not None else 0
+
+
+# Bumping the dataset generation
+def __bump_generation__(client):
+  '''
+  __bump_generation__(client)
+  '''
+
+  client.get_database(__DATABASE_NAME__)[__COLLECTION_NAME__ + __GENERATION_SUFFIX__].update_one(
+      {__ID__: __GENERATION_ID__}, {__INC__: {__GENERATION_ID__: 1}}, upsert=True)
+
+  __forget_generation__()
+
+  return
+
+
+# Forgetting the dataset generation read by the query cache
+def __forget_generation__():
+  '''
+  __forget_generation__()
+  '''
+
+  with __CACHED_GENERATION_LOCK__:
+    __CACHED_GENERATION__['generation'] = None
+    __CACHED_GENERATION__['forgotten'] += 1
+
+  return
+
+
+# The dataset generation, read at most once per __GENERATION_TTL__ seconds
+def __cached_generation__():
+  '''
+  __cached_generation__() -> int
+
+  The dataset generation the query cache checks its results against, see `set_query_cache`.
+
+  The generation is read without holding the lock, so that the cached queries don't queue up
+  behind one round trip, and published under it unless it was forgotten (see
+  `__forget_generation__`) while it was being read.
+  '''
+
+  now = monotonic()
+
+  with __CACHED_GENERATION_LOCK__:
+    generation = __CACHED_GENERATION__['generation']
+    forgotten = __CACHED_GENERATION__['forgotten']
+
+    if generation is not None and now - __CACHED_GENERATION__['checked_at'] < __GENERATION_TTL__:
+      return generation
+
+  generation = dataset_generation()
+
+  with __CACHED_GENERATION_LOCK__:
+    if __CACHED_GENERATION__['forgotten'] == forgotten:
+      __CACHED_GENERATION__.update(generation=generation, checked_at=now)
+
+  return generation
+
+
+# The rollup collection of the archives collection
+def __rollups__(client):
+  '''
+  __rollups__(client) -> Collection
+
+  The rollup collection, `<collection>_rollups`, kept next to the archives collection. It holds
+  the article counts per `dimension`, publication `year`, `month` and `key`, eg:
+
+    {"dimension": "section", "year": 2005, "month": 1, "key": "Business", "count": 412,
+     "ingest": "2005-01"}
+
+  `ingest` is the archives API month the counts come from, the rollups of a month are replaced as a
+  whole every time that month is ingested, so they never count an article twice.
+  '''
+
+  return client.get_database(__DATABASE_NAME__)[__COLLECTION_NAME__ + __ROLLUPS_SUFFIX__]
+
+
+# The rollup keys of an article
+def __rollup_keys__(document):
+  '''
+  __rollup_keys__(document) -> generator[(str, object)]
+
+  Yields the (dimension, key) pairs the article counts for, mirroring the raw aggregate pipelines:
+
+    `keyword` -- every keyword (Query#1)
+    `news_keyword` -- every keyword of the `News` articles (Query#2)
+    `reporter` -- every byline person of the articles with a `reported` byline (Query#7)
+    `organization` -- every `organizations` keyword value (Query#11)
+    `person` -- every `persons` keyword value
+    `section` -- the section name of the articles (Query#12)
+    `type_of_material` -- the type of material (Query#13)
+    `source` -- the source (Query#9)
+    `article_month` -- the publication year and month of the articles (Query#14)
+    `document_type` -- the document type of every document (Query#14 by document type)
+  '''
+
+  keywords = document.get(__KEYWORDS__) or list()
+
+  for keyword in keywords:
+    yield __KEYWORD_ROLLUP__, keyword
+
+  if document.get(__TYPE_OF_MATERIAL__) == 'News':
+    for keyword in keywords:
+      yield __NEWS_KEYWORD_ROLLUP__, keyword
+
+  byline = document.get(__BYLINE__)
+  persons = (byline.get(__PERSON__) if isinstance(byline, dict) else None) or list()
+
+  if any(person.get(__ROLE__) == 'reported' for person in persons) and \
+          any(isinstance(person.get(__FIRSTNAME__), str) and len(person.get(__FIRSTNAME__)) > 0
+              for person in persons):
+    for person in persons:
+      yield __REPORTER_ROLLUP__, person
+
+  keyword_values = document.get(__KEYWORD_VALUES__) or dict()
+
+  for organization in keyword_values.get('organizations', list()):
+    yield __ORGANIZATION_ROLLUP__, organization
+
+  for person in keyword_values.get('persons', list()):
+    yield __PERSON_ROLLUP__, person
+
+  if document.get(__DOCUMENT_TYPE__) == 'article':
+    yield __SECTION_ROLLUP__, document.get(__SECTION_NAME__)
+    yield __ARTICLE_MONTH_ROLLUP__, {'year': document.get(__PUB_YEAR__),
+                                     'month': document.get(__PUB_MONTH__)}
+
+  yield __TYPE_OF_MATERIAL_ROLLUP__, document.get(__TYPE_OF_MATERIAL__)
+  yield __SOURCE_ROLLUP__, document.get(__SOURCE__)
+  yield __DOCUMENT_TYPE_ROLLUP__, document.get(__DOCUMENT_TYPE__)
+
+
+# Counting the rollups of the month being ingested
+def __count_rollups__(rollups, document):
+  '''
+  __count_rollups__(rollups, document) -> dict
+
+  Adds the rollup keys of the (normalized) article to the `rollups` counts, keyed on
+  (dimension, pub_year, pub_month, key as JSON), and returns the article.
+  '''
+
+  for dimension, key in __rollup_keys__(document):
+    rollup_id = (dimension, document.get(__PUB_YEAR__), document.get(__PUB_MONTH__),
+                 dumps(key, sort_keys=True, default=str))
+
+    entry = rollups.get(rollup_id)
+
+    if entry is None:
+      rollups[rollup_id] = [key, 1]
+    else:
+      entry[1] += 1
+
+  return document
+
+
+# Writing the rollups of an ingested month
+def __write_rollups__(client, year, month, rollups):
+  '''
+  __write_rollups__(client, year, month, rollups)
+
+  Replaces the rollups of the ingested year, month with the ones counted by `__count_rollups__`.
+  '''
+
+  collection = __rollups__(client)
+
+  ingest = __month_key__(year, month)
+
+  collection.create_index([(__ROLLUP_INGEST__, ASCENDING)])
+  collection.create_index([(__ROLLUP_DIMENSION__, ASCENDING), (__ROLLUP_YEAR__, ASCENDING),
+                           (__ROLLUP_KEY__, ASCENDING)])
+
+  collection.delete_many({__ROLLUP_INGEST__: ingest})
+
+  rollup_documents = ({
+      __ROLLUP_DIMENSION__: dimension,
+      __ROLLUP_YEAR__: pub_year,
+      __ROLLUP_MONTH__: pub_month,
+      __ROLLUP_KEY__: key,
+      __ROLLUP_COUNT__: count,
+      __ROLLUP_INGEST__: ingest
+  } for (dimension, pub_year, pub_month, _), (key, count) in rollups.items())
+
+  for batch, _ in __batches__(rollup_documents, __INSERT_BATCH_SIZE__):
+    collection.insert_many(batch, ordered=False)
+
+  return
+
+
+# The sketch collection of the archives collection
+def __sketches__(client):
+  '''
+  __sketches__(client) -> Collection
+
+  The sketch collection, `<collection>_sketches`, kept next to the archives collection. It holds
+  one document per `dimension` and ingested month, with the `HeavyHitters` and the `HyperLogLog`
+  sketches of the month:
+
+    {"_id": "organization:2005-01", "dimension": "organization", "ingest": "2005-01",
+     "heavy_hitters": {"count_min": {...}, "space_saving": {...}},
+     "hyperloglog": {"precision": 12, "registers": <4096 bytes>}}
+
+  The sketches of a month are replaced as a whole every time that month is ingested.
+  '''
+
+  return client.get_database(__DATABASE_NAME__)[__COLLECTION_NAME__ + __SKETCHES_SUFFIX__]
+
+
+# Writing the sketches of the month being ingested
+def __write_sketches__(client, year, month, rollups):
+  '''
+  __write_sketches__(client, year, month, rollups)
+
+  Builds the sketches of the ingested year, month from the exact counts of its rollups (see
+  `__count_rollups__`) and replaces the ones of a previous ingest. They are as complete as the
+  rollups, so the month is marked sketch-ready only when it is marked rollup-ready.
+
+  The sketches count the keys as sorted JSON, like the rollups, and keep the keys of the heavy
+  hitter candidates as the articles have them, so that the answers match the exact ones.
+  '''
+
+  ingest = __month_key__(year, month)
+
+  counts = dict((dimension, dict())
+                for dimension in set(__SKETCH_DIMENSIONS__) | set(__DISTINCT_DIMENSIONS__))
+  keys = dict()
+
+  for (dimension, _, _, encoded_key), (key, count) in rollups.items():
+    if dimension in counts:
+      counts[dimension][encoded_key] = counts[dimension].get(encoded_key, 0) + count
+      keys[encoded_key] = key
+
+  collection = __sketches__(client)
+
+  collection.create_index([(__ROLLUP_DIMENSION__, ASCENDING), (__ROLLUP_INGEST__, ASCENDING)])
+
+  for dimension, dimension_counts in counts.items():
+    sketches = {__ROLLUP_DIMENSION__: dimension, __ROLLUP_INGEST__: ingest}
+
+    if dimension in __SKETCH_DIMENSIONS__:
+      heavy_hitters = HeavyHitters.from_counts(dimension_counts)
+      sketches[__HEAVY_HITTERS__] = heavy_hitters.to_document()
+      sketches[__HEAVY_HITTER_KEYS__] = [[encoded_key, keys[encoded_key]]
+                                         for encoded_key in heavy_hitters.space_saving.counters]
+
+    if dimension in __DISTINCT_DIMENSIONS__:
+      distinct = HyperLogLog()
+
+      for encoded_key in dimension_counts:
+        distinct.add(encoded_key)
+
+      sketches[__HYPERLOGLOG__] = distinct.to_document()
+
+    collection.replace_one({__ID__: '{dimension}:{ingest}'.format(dimension=dimension,
+                                                                   ingest=ingest)},
+                           sketches, upsert=True)
+
+  return
+
+
+# Whether the sketches cover the whole dataset
+def __sketches_ready__(client, flag='sketches'):
+  '''
+  __sketches_ready__(client, flag='sketches') -> bool
+
+  The sketches can answer the approximate queries once every ingested month has written them. The
+  manifest `flag` is `sketches` for the heavy hitters and `distinct` for the HyperLogLogs.
+  '''
+
+  return __months_ready__(client, flag)
+
+
+# the sketches of a dimension over a range of ingested months
+def __sketch_query__(dimension, start=None, end=None):
+  '''
+  __sketch_query__(dimension, start=None, end=None) -> dict
+  '''
+
+  query = {__ROLLUP_DIMENSION__: dimension}
+
+  if start is not None or end is not None:
+    query[__ROLLUP_INGEST__] = dict()
+
+    if start is not None:
+      query[__ROLLUP_INGEST__][__GTEQ__] = __month_key__(*start)
+    if end is not None:
+      query[__ROLLUP_INGEST__][__LTEQ__] = __month_key__(*end)
+
+  return query
+
+
+# the heavy hitters of a range of ingested months
+def heavy_hitters(dimension, k=10, start=None, end=None, client=None):
+  '''
+  heavy_hitters(dimension, k=10, start=None, end=None, client=None) -> list[dict]
+
+  Approximates the k most frequent keys of the dimension over a range of ingested months by merging
+  the per month sketches written at ingest, without reading the archives or the rollups.
+
+  Input(s):
+
+    :param: dimension `str` -- `news_keyword`, `organization` or `reporter`
+
+    :param: k `int` -- The number of keys -- defaults to 10
+
+    :param: start `(int, int)` -- The first (year, month) ingested -- defaults to the first one
+
+    :param: end `(int, int)` -- The last (year, month) ingested -- defaults to the last one
+
+    :param: client `MongoClient` -- The client to use -- defaults to the shared client
+
+  Output(s):
+
+    :return: heavy_hitters `list[dict]` -- `_id` (the key), `count` (an upper bound of its count),
+    `lower` (a lower bound) and `error` (`count - lower`), most frequent first. `error_bound` is the
+    most the Count-Min sketch over-estimates a count by, with a probability of `confidence`.
+  '''
+
+  if dimension not in __SKETCH_DIMENSIONS__:
+    raise ValueError('No sketches for {dimension}, use one of {dimensions}'.format(
+        dimension=dimension, dimensions=', '.join(__SKETCH_DIMENSIONS__)))
+
+  client = get_client() if client is None else client
+
+  query = __sketch_query__(dimension, start, end)
+
+  merged = None
+  keys = dict()
+
+  for document in __sketches__(client).find(query, {__HEAVY_HITTERS__: True,
+                                                    __HEAVY_HITTER_KEYS__: True}):
+    sketch = HeavyHitters.from_document(document[__HEAVY_HITTERS__])
+    merged = sketch if merged is None else merged.merge(sketch)
+    keys.update(document.get(__HEAVY_HITTER_KEYS__, list()))
+
+  if merged is None:
+    return list()
+
+  error_bound = merged.count_min.error_bound()
+  confidence = merged.count_min.confidence()
+
+  return [{
+      # sketches written without their keys only have the sorted JSON of the key
+      __ID__: keys[heavy_hitter['key']] if heavy_hitter['key'] in keys else
+      loads(heavy_hitter['key']),
+      __COUNT_FIELD__: heavy_hitter['count'],
+      'lower': heavy_hitter['lower'],
+      'error': heavy_hitter['error'],
+      'error_bound': error_bound,
+      'confidence': confidence
+  } for heavy_hitter in merged.top(k)]
+
+
+# the approximate answer of a top k query, None when the sketches are missing
+def __approximate_top__(client, dimension, count_field, k):
+  '''
+  __approximate_top__(client, dimension, count_field, k) -> list[dict]
+
+  The heavy hitters with the count under the name used by the exact query, None when the sketches
+  don't cover the dataset.
+  '''
+
+  if not __sketches_ready__(client):
+    warning('The sketches do not cover the dataset, answering exactly')
+    return None
+
+  answers = heavy_hitters(dimension, k=k, client=client)
+
+  for answer in answers:
+    answer[count_field] = answer.pop(__COUNT_FIELD__)
+
+  return answers
+
+
+# the distinct keys of a range of ingested months
+def distinct_count(dimension, start=None, end=None, client=None):
+  '''
+  distinct_count(dimension, start=None, end=None, client=None) -> dict
+
+  Estimates how many distinct keys of the dimension were active over a range of ingested months,
+  eg: the distinct reporters of 2016, by merging the per month HyperLogLog registers written at
+  ingest. The answer costs one small fixed-size merge per month of the range, whatever the number
+  of articles or keys, and its relative standard error is 1.6% (4096 registers).
+
+  Input(s):
+
+    :param: dimension `str` -- `keyword`, `organization`, `person` or `reporter`
+
+    :param: start `(int, int)` -- The first (year, month) ingested -- defaults to the first one
+
+    :param: end `(int, int)` -- The last (year, month) ingested -- defaults to the last one
+
+    :param: client `MongoClient` -- The client to use -- defaults to the shared client
+
+  Output(s):
+
+    :return: distinct `dict` -- The `dimension`, the `distinct` keys estimated, the
+    `relative_error` (standard error) of the estimate and the number of `months` merged. None when
+    some ingested months have no HyperLogLog, ingest them again to add it.
+  '''
+
+  if dimension not in __DISTINCT_DIMENSIONS__:
+    raise ValueError('No distinct counts for {dimension}, use one of {dimensions}'.format(
+        dimension=dimension, dimensions=', '.join(__DISTINCT_DIMENSIONS__)))
+
+  client = get_client() if client is None else client
+
+  if not __sketches_ready__(client, flag='distinct'):
+    warning('The HyperLogLogs do not cover the dataset, ingest it again to add them')
+    return None
+
+  query = __sketch_query__(dimension, start, end)
+
+  merged = HyperLogLog()
+  months = 0
+
+  for document in __sketches__(client).find(query, {__HYPERLOGLOG__: True}):
+    merged = merged.merge(HyperLogLog.from_document(document[__HYPERLOGLOG__]))
+    months += 1
+
+  return {
+      'dimension': dimension,
+      'distinct': merged.count(),
+      'relative_error': merged.relative_error(),
+      'months': months
+  }
+
+
+# Whether the rollups cover the whole dataset
+def __rollups_ready__(client, flag='rollups'):
+  '''
+  __rollups_ready__(client, flag='rollups') -> bool
+
+  The rollups can answer the aggregate queries once every ingested month has written its rollups.
+  Datasets ingested before the rollups existed, or without a manifest, use the raw pipelines. The
+  manifest `flag` is `rollups` for the original dimensions and `document_type_rollups` for the
+  `document_type` dimension, added later.
+  '''
+
+  return __months_ready__(client, flag)
+
+
+# Reading the rollups
+def __rollup_counts__(client, dimension, count_field=__ROLLUP_COUNT__, years=None, key=None,
+                      limit=None):
+  '''
+  __rollup_counts__(client, dimension, count_field, years=None, key=None, limit=None) -> list[dict]
+
+  Sums the rollup counts of the dimension per key, most frequent key first.
+
+  Input(s):
+
+    :param: dimension `str` -- The rollup dimension
+
+    :param: count_field `str` -- The name of the count in the results, to match the raw pipelines
+
+    :param: years `(int, int)` -- The first and last publication years counted -- defaults to all
+
+    :param: key `object` -- Only count this key -- defaults to all the keys
+
+    :param: limit `int` -- The number of keys returned -- defaults to all the keys
+
+  Output(s):
+
+    :return: counts `list[dict]` -- `{"_id": key, count_field: count}` documents
+  '''
+
+  match = {__ROLLUP_DIMENSION__: dimension}
+
+  if years is not None:
+    match[__ROLLUP_YEAR__] = {__GTEQ__: years[0], __LTEQ__: years[1]}
+
+  if key is not None:
+    match[__ROLLUP_KEY__] = key
+
+  pipeline = [
+      {
+          __MATCH__: match
+      },
+      {
+          __GROUP__: {
+              __ID_OP__: '${key}'.format(key=__ROLLUP_KEY__),
+              count_field: {
+                  __SUM__: '${count}'.format(count=__ROLLUP_COUNT__)
+              }
+          }
+      },
+      {
+          __SORT__: {
+              count_field: -1
+          }
+      }
+  ]
+
+  if limit is not None:
+    pipeline.append({__LIMIT__: limit})
+
+  return list(__rollups__(client).aggregate(pipeline, allowDiskUse=True))
+
+
+# The queries answered from the rollups
+__ROLLUP_QUERIES__ = ('compare_news_keywords', 'most_popular_news_keywords',
+                      'most_productive_reporter', 'count_original_articles', 'most_organization',
+                      'most_section', 'list_articles_type_of_materials', 'highest_articles_month',
+                      'monthly_article_histogram')
+
+
+# the counts in a query result, ignoring the order of the keys with the same count
+def __result_counts__(result):
+  '''
+  __result_counts__(result) -> list[int]
+
+  The sorted counts found in the result of an aggregate query.
+  '''
+
+  if isinstance(result, bool) or result is None or isinstance(result, str):
+    return list()
+
+  if isinstance(result, int):
+    return [result]
+
+  if isinstance(result, dict):
+    return sorted(value for key, value in result.items()
+                  if key != __ID__ and isinstance(value, int) and not isinstance(value, bool))
+
+  return sorted(count for item in result for count in __result_counts__(item))
+
+
+# Comparing the rollups with the raw pipelines
+def check_rollups():
+  '''
+  check_rollups() -> list[dict]
+
+  Runs every aggregate query answered from the rollups twice, once on the rollups and once with the
+  raw pipeline over the archives collection, and compares the counts they return. Keys with equal
+  counts may come back in a different order, so the counts are compared and not the keys.
+
+  Output(s):
+
+    :return: checks `list[dict]` -- One entry per query with its `query` name, `consistent`, the
+    `rollup_seconds` and `raw_seconds` it took, `rollups_ready` (False means both runs used the
+    raw pipeline) and the `unready_months` ingested without complete rollups, eg: the months with
+    failed writes.
+  '''
+
+  client = get_client()
+  rollups_ready = __rollups_ready__(client)
+  unready_months = sorted(entry[__ID__] for entry in __manifest__(client).find(
+      {'status': __MONTH_DONE__, 'rollups': {'$ne': True}}, {__ID__: True}))
+
+  if unready_months:
+    warning('The rollups of {months} are incomplete, the aggregate queries use the raw '
+            'pipelines'.format(months=', '.join(unready_months)))
+
+  checks = list()
+
+  for query_name in __ROLLUP_QUERIES__:
+    query = globals()[query_name].__wrapped__
+
+    started_at = perf_counter()
+    rollup_result = query(use_rollups=True)
+    rollup_seconds = perf_counter() - started_at
+
+    started_at = perf_counter()
+    raw_result = query(use_rollups=False)
+    raw_seconds = perf_counter() - started_at
+
+    checks.append({
+        'query': query_name,
+        'consistent': __result_counts__(rollup_result) == __result_counts__(raw_result),
+        'rollup_seconds': rollup_seconds,
+        'raw_seconds': raw_seconds,
+        'rollups_ready': rollups_ready,
+        'unready_months': unready_months
+    })
+
+    if not checks[-1]['consistent']:
+      warning('The rollups of {query} are inconsistent with the raw pipeline'.format(
+          query=query_name))
+
+  return checks
+
+
+# The (year, month) pairs making up the archives dataset
+def archive_months():
+  '''
+  archive_months() -> list[(int, int)]
+
+  Lists the (year, month) pairs for the FIRST PHASE (2005 - 2007) and the SECOND PHASE
+  (2015 - 2017) of the archives dataset.
+
+  Output(s):
+
+    :return: months `list[(int, int)]` -- The (year, month) pairs in chronological order
+  '''
+
+  months = list()
+
+  for start_year, end_year in ((PHASE_1_START_YEAR, PHASE_1_END_YEAR),
+                               (PHASE_2_START_YEAR, PHASE_2_END_YEAR)):
+    for year in range(start_year, end_year + 1):
+      for month in range(1, 13):
+        months.append((year, month))
+
+  return months
+
+
+# ingesting a single month, timed
+def __ingest_month__(client, year, month, limiter, retries, options):
+  '''
+  __ingest_month__(client, year, month, limiter, retries, options) -> dict
+
+  Inserts the documents for the year, month, replaces the rollups and the sketches of the month,
+  records the outcome in the manifest and reports how it went.
+
+  Output(s):
+
+    :return: report `dict` -- `year`, `month`, `status` (`done` or `failed`), `count`, `errors`,
+    `batches`, `write_seconds`, `max_batch_seconds` and `seconds` for the month.
+  '''
+
+  started_at = perf_counter()
+  report = {'year': year, 'month': month, 'status': __MONTH_DONE__, 'count': 0, 'errors': 0,
+            'batches': 0, 'write_seconds': 0.0, 'max_batch_seconds': 0.0}
+
+  __mark_month__(client, year, month, __MONTH_RUNNING__)
+
+  try:
+    insert_report = __insert_documents__(client, year, month, limiter=limiter,
+                                         retries=retries, options=options)
+    content_hash = insert_report.pop('hash')
+    rollups = insert_report.pop('rollups')
+    __write_rollups__(client, year, month, rollups)
+    __write_sketches__(client, year, month, rollups)
+    report.update(insert_report)
+    # a failed upsert may leave an older copy of the article behind, that the rollups don't count,
+    # and the sketches are built from the same counts
+    rollups_ready = report['errors'] == 0
+    __mark_month__(client, year, month, __MONTH_DONE__, count=report['count'], hash=content_hash,
+                   errors=report['errors'], rollups=rollups_ready, sketches=rollups_ready,
+                   distinct=rollups_ready, document_type_rollups=rollups_ready, error=None)
+  except Exception as e:
+    report['status'] = __MONTH_FAILED__
+    warning(
+        'Failed inserting data for year:{year}, month:{month}: {e}'.format(
+            year=year, month=month, e=e))
+    __mark_month__(client, year, month, __MONTH_FAILED__, error=str(e))
+  finally:
+    # even a failed month may have written some articles
+    __bump_generation__(client)
+
+  report['seconds'] = perf_counter() - started_at
+
+  return report
+
+
+# Create archives dataset
+def create_archives_dataset(workers=__INGEST_WORKERS__,
+                            requests_per_second=__API_REQUESTS_PER_SECOND__,
+                            retries=__API_MAX_RETRIES__,
+                            months=None,
+                            batch_size=None,
+                            resume=True,
+                            options=None):
+  '''
+  create_archives_dataset(workers, requests_per_second, retries, months=None, batch_size=None,
+                          resume=True, options=None) -> dict
+
+  Creates the archives dataset on the mongo cluster.
+
+  The build is resumable and idempotent. Every month is tracked in the manifest collection (see
+  `read_manifest`), months already `done` are skipped when `resume` is set, and failed or
+  interrupted months are fetched again. Documents are upserted on their `_id`, so re-ingesting a
+  month never duplicates its articles. The entity catalog (see `build_entity_catalog`) is rebuilt
+  once the months are ingested.
+
+  The months are fetched and inserted concurrently by a pool of `workers` threads sharing one
+  `MongoClient`. All the API calls go through a `TokenBucket` so that the ingest stays within the
+  per-second quota of the NYT archives API, and every month, from the API call to the last
+  upsert, is retried with backoff on its own.
+
+  Input(s):
+
+    :param: workers `int` -- The number of months ingested in parallel -- defaults to
+    __INGEST_WORKERS__, use 1 for the sequential ingest
+
+    :param: requests_per_second `float` -- The API quota -- defaults to __API_REQUESTS_PER_SECOND__
+
+    :param: retries `int` -- The number of retries per month -- defaults to __API_MAX_RETRIES__
+
+    :param: months `list[(int, int)]` -- The (year, month) pairs to ingest -- defaults to
+    `archive_months()`
+
+    :param: batch_size `int` -- The number of documents per insert, overrides the one of
+    `options` -- defaults to None
+
+    :param: resume `bool` -- Skip the months the manifest marks as `done` -- defaults to True
+
+    :param: options `dict` -- The write concern, ordering and batch sizes, see `write_options`
+    -- defaults to the `bulk` profile
+
+  Output(s):
+
+    :return: report `dict` -- `months` (the per month reports in chronological order),
+    `documents`, `failed`, `seconds` and `docs_per_second` for the whole ingest. Months skipped
+    on resume are reported with the `skipped` status. `cache` holds the archives cache metrics
+    when the cache is enabled. `write_seconds` and `write_docs_per_second` measure the time spent
+    in `bulk_write` only.
+  '''
+
+  client = get_client()
+
+  options = write_options() if options is None else dict(options)
+
+  if batch_size is not None:
+    options['batch_size'] = batch_size
+
+  months = archive_months() if months is None else months
+
+  month_reports = list()
+
+  if resume:
+    manifest = read_manifest(client)
+    pending_months = list()
+
+    for year, month in months:
+      entry = manifest.get((year, month))
+
+      if entry is not None and entry['status'] == __MONTH_DONE__:
+        month_reports.append({'year': year, 'month': month, 'status': __MONTH_SKIPPED__,
+                              'count': 0, 'errors': 0, 'batches': 0, 'write_seconds': 0.0,
+                              'max_batch_seconds': 0.0, 'seconds': 0.0})
+      else:
+        pending_months.append((year, month))
+
+    warning('Resuming the dataset build: {skipped} months done, {pending} months to ingest'.format(
+        skipped=len(months) - len(pending_months), pending=len(pending_months)))
+
+    months = pending_months
+
+  limiter = TokenBucket(requests_per_second)
+
+  started_at = perf_counter()
+
+  with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+    futures = [executor.submit(__ingest_month__, client, year, month, limiter, retries,
+                               options)
+               for year, month in months]
+
+    for future in as_completed(futures):
+      month_report = future.result()
+      month_reports.append(month_report)
+      warning('year:{year} month:{month} {status} -- {count} documents in {seconds:.2f}s'.format(
+          **month_report))
+
+  seconds = perf_counter() - started_at
+
+  month_reports.sort(key=lambda month_report: (month_report['year'], month_report['month']))
+
+  documents = sum(month_report['count'] for month_report in month_reports)
+  write_seconds = sum(month_report['write_seconds'] for month_report in month_reports)
+
+  report = {
+      'months': month_reports,
+      'documents': documents,
+      'failed': [(month_report['year'], month_report['month'])
+                 for month_report in month_reports if month_report['status'] == __MONTH_FAILED__],
+      'seconds': seconds,
+      'docs_per_second': documents / seconds if seconds > 0 else 0.0,
+      'write_seconds': write_seconds,
+      'write_docs_per_second': documents / write_seconds if write_seconds > 0 else 0.0,
+      'cache': archives_cache_stats()
+  }
+
+  if any(month_report['status'] != __MONTH_SKIPPED__ for month_report in month_reports):
+    build_entity_catalog(client)
+
+  warning('Completed data insertion: {documents} documents in {seconds:.2f}s ({rate:.1f} docs/sec), '
+          '{failed} months failed'.format(documents=documents,
+                                          seconds=seconds,
+                                          rate=report['docs_per_second'],
+                                          failed=len(report['failed'])))
+
+  return report
+
+
+# Adding the derived fields to the articles inserted before the normalization stage
+def backfill_derived_fields(batch_size=__INSERT_BATCH_SIZE__):
+  '''
+  backfill_derived_fields(batch_size) -> int
+
+  Adds the derived fields (see `normalize_document`) to the articles of the archives collection
+  that don't have them yet.
+
+  Input(s):
+
+    :param: batch_size `int` -- The number of updates per `bulk_write` -- defaults to
+    __INSERT_BATCH_SIZE__
+
+  Output(s):
+
+    :return: updated_count `int` -- The number of articles updated
+  '''
+
+  client = get_client()
+
+  collection = client.get_database(__DATABASE_NAME__)[__COLLECTION_NAME__]
+
+  cursor = collection.find({__OR__: [{__PUB_YEAR__: {__EXISTS__: False}},
+                                     {__REPORTER_NAMES__: {__EXISTS__: False}}]},
+                           [__PUB_DATE__, __PRINT_PAGE__, __KEYWORDS__, __BYLINE__])
+
+  updated_count = 0
+  updated_months = set()
+
+  for batch, _ in __batches__(cursor, batch_size):
+    derived = [(document[__ID__], __derived_fields__(document)) for document in batch]
+    collection.bulk_write([UpdateOne({__ID__: document_id}, {__SET__: fields})
+                           for document_id, fields in derived], ordered=False)
+    updated_months.update((fields.get(__PUB_YEAR__), fields.get(__PUB_MONTH__))
+                          for _, fields in derived)
+    updated_count += len(batch)
+
+  # the months whose articles changed, for the incremental export (see `nyt_export`)
+  for year, month in updated_months:
+    if year is not None and month is not None:
+      __manifest__(client).update_one({__ID__: __month_key__(year, month)},
+                                      {__SET__: {'updated_at': datetime.utcnow()}})
+
+  if updated_count > 0:
+    __bump_generation__(client)
+
+  warning('Added the derived fields to {count} articles'.format(count=updated_count))
+
+  return updated_count
+
+
+# The publication date ranges of the partitioned aggregation
+def __date_partitions__(collection, partitions):
+  '''
+  __date_partitions__(collection, partitions) -> list[dict]
+
+  Splits the articles into `partitions` `pub_datetime` ranges of equal length, read from the ends
+  of the `pub_datetime` index, and a last partition for the articles without a publication date.
+  Every article falls in exactly one partition.
+  '''
+
+  dated = {__PUB_DATETIME__: {__NE__: None}}
+
+  first = list(collection.find(dated, {__PUB_DATETIME__: True}).sort(
+      __PUB_DATETIME__, ASCENDING).limit(1))
+  last = list(collection.find(dated, {__PUB_DATETIME__: True}).sort(
+      __PUB_DATETIME__, DESCENDING).limit(1))
+
+  matches = list()
+
+  if first and last:
+    start, end = first[0][__PUB_DATETIME__], last[0][__PUB_DATETIME__]
+    step = (end - start) / partitions
+
+    bounds = [start + step * index for index in range(partitions)] + [end]
+
+    for index in range(partitions):
+      upper = {__LTEQ__: bounds[index + 1]} if index == partitions - 1 else \
+          {__LT__: bounds[index + 1]}
+      upper[__GTEQ__] = bounds[index]
+
+      # the ranges left empty by rounding are skipped
+      if bounds[index] < bounds[index + 1] or index == partitions - 1:
+        matches.append({__PUB_DATETIME__: upper})
+
+  matches.append({__PUB_DATETIME__: None})
+
+  return matches
+
+
+# Aggregating the partitions of a `$group` pipeline in parallel
+def __partitioned_aggregate__(collection, pipeline, workers, partitions):
+  '''
+  __partitioned_aggregate__(collection, pipeline, workers, partitions) -> list[dict]
+
+  Runs the pipeline up to its `$group` once per publication date range (see
+  `__date_partitions__`) on a pool of `workers` threads, adds up the partial `$sum`s of every
+  group key, then applies the `$sort` and `$limit` stages following the `$group` client-side.
+
+  The `$sort` stages before the `$group` only feed it from an index and are dropped, the
+  accumulators of the `$group` have to be `$sum`s.
+  '''
+
+  group_index = next(index for index, stage in enumerate(pipeline) if __GROUP__ in stage)
+  group = pipeline[group_index][__GROUP__]
+  count_fields = [field for field in group if field != __ID_OP__]
+
+  if any(list(group[field]) != [__SUM__] for field in count_fields):
+    raise ValueError('Only the $sum accumulators can be merged across partitions')
+
+  partial_pipeline = [stage for stage in pipeline[:group_index] if __SORT__ not in stage] + \
+      [pipeline[group_index]]
+
+  def aggregate_partition(match):
+    return list(collection.aggregate([{__MATCH__: match}] + partial_pipeline,
+                                     allowDiskUse=True))
+
+  merged = dict()
+
+  with ThreadPoolExecutor(max_workers=workers) as executor:
+    futures = [executor.submit(aggregate_partition, match)
+               for match in __date_partitions__(collection, partitions)]
+
+    for future in as_completed(futures):
+      for partial in future.result():
+        encoded_key = dumps(partial[__ID_OP__], sort_keys=True, default=str)
+        entry = merged.get(encoded_key)
+
+        if entry is None:
+          merged[encoded_key] = partial
+        else:
+          for field in count_fields:
+            entry[field] += partial[field]
+
+  results = list(merged.values())
+
+  for stage in pipeline[group_index + 1:]:
+    if __SORT__ in stage:
+      for field, direction in reversed(list(stage[__SORT__].items())):
+        results.sort(key=lambda result: result.get(field), reverse=direction == DESCENDING)
+    elif __LIMIT__ in stage:
+      results = results[:stage[__LIMIT__]]
+    else:
+      raise ValueError('Only $sort and $limit can follow a partitioned $group')
+
+  return results
+
+
+# Running a raw `$group` pipeline
+def __aggregate_groups__(collection, pipeline):
+  '''
+  __aggregate_groups__(collection, pipeline) -> list[dict]|CommandCursor
+
+  The single pipeline, or the merged partitions when `set_parallel_aggregation` is enabled.
+  '''
+
+  parallel = __PARALLEL_AGGREGATION__
+
+  if parallel is None:
+    return collection.aggregate(pipeline, allowDiskUse=True)
+
+  return __partitioned_aggregate__(collection, pipeline, parallel['workers'],
+                                   parallel['partitions'])
+
+
+# Caching the results of a query function
+def __cached_query__(query):
+  '''
+  __cached_query__(query) -> function
+
+  Wraps the query function so that its results go through the query result cache when it is
+  enabled (see `set_query_cache`). The uncached function stays available as `__wrapped__`.
+  '''
+
+  query_signature = signature(query)
+
+  @wraps(query)
+  def cached_query(*args, **kwargs):
+    query_cache = __QUERY_CACHE__
+
+    # `stream` may be passed by position as well as by keyword
+    if query_cache is None or query_signature.bind(*args, **kwargs).arguments.get('stream'):
+      return query(*args, **kwargs)
+
+    return query_cache.call(query, args, kwargs, __cached_generation__(),
+                            namespace=(__HOSTNAME__, __PORT__, __DATABASE_NAME__,
+                                       __COLLECTION_NAME__))
+
+  return cached_query
+
+
+# The order of the streamed articles, the keyset of the pagination
+__KEYSET_SORT__ = [(__PUB_DATETIME__, ASCENDING), (__ID__, ASCENDING)]
+
+
+# The resume token of a streamed article
+def resume_token(document):
+  '''
+  resume_token(document) -> (datetime, str)
+
+  The (pub_datetime, _id) keyset of an article yielded by `iter_documents`. Passing it as `after`
+  resumes the stream right after that article.
+  '''
+
+  return document.get(__PUB_DATETIME__), document[__ID__]
+
+
+# the articles following a resume token
+def __after__(token):
+  '''
+  __after__(token) -> dict
+
+  The filter matching the articles after the (pub_datetime, _id) keyset in the `__KEYSET_SORT__`
+  order. The articles without a `pub_datetime` sort first.
+  '''
+
+  pub_datetime, document_id = token
+
+  return {
+      __OR__: [
+          {
+              __PUB_DATETIME__: {
+                  __GT__: pub_datetime
+              } if pub_datetime is not None else {
+                  __NE__: None
+              }
+          },
+          {
+              __PUB_DATETIME__: pub_datetime,
+              __ID__: {
+                  __GT__: document_id
+              }
+          }
+      ]
+  }
+
+
+# Resolving a projection profile
+def projection_for(projection):
+  '''
+  projection_for(projection) -> dict
+
+  The projection of the articles returned by the queries.
+
+  Input(s):
+
+    :param: projection `str|dict|list[str]` -- A profile of `__PROJECTION_PROFILES__`, `summary`,
+    `byline` or `full`, or a projection handed as is to mongo
+
+  Output(s):
+
+    :return: projection `dict` -- The projection, None for the whole documents
+  '''
+
+  if not isinstance(projection, str):
+    return projection
+
+  if projection not in __PROJECTION_PROFILES__:
+    raise ValueError('Unknown projection profile {profile}, use one of {profiles}'.format(
+        profile=projection, profiles=', '.join(sorted(__PROJECTION_PROFILES__))))
+
+  profile = __PROJECTION_PROFILES__[projection]
+
+  return dict(profile) if profile is not None else None
+
+
+# the projection of the streamed articles, always keeping the keyset fields
+def __keyset_projection__(projection):
+  '''
+  __keyset_projection__(projection) -> dict
+  '''
+
+  projection = projection_for(projection)
+
+  if projection is None:
+    return None
+
+  if not isinstance(projection, dict):
+    projection = dict((field, True) for field in projection)
+  else:
+    projection = dict(projection)
+
+  if any(projection.values()):
+    projection[__PUB_DATETIME__] = True
+  else:
+    projection.pop(__PUB_DATETIME__, None)
+
+  projection.pop(__ID__, None)
+
+  return projection
+
+
+# Streaming the matching articles
+def iter_documents(collection, query, projection=None, batch_size=__FIND_BATCH_SIZE__, after=None):
+  '''
+  iter_documents(collection, query, projection=None, batch_size=500, after=None) -> generator[dict]
+
+  Yields the articles matching the query in (pub_datetime, _id) order, `batch_size` at a time.
+  Every batch is a new query for the articles after the last one yielded (keyset pagination), so
+  the memory held stays flat, the first article comes back as soon as the first batch does and no
+  server cursor is kept open between the batches.
+
+  Input(s):
+
+    :param: collection `Collection` -- The collection queried
+
+    :param: query `dict` -- The filter of the articles
+
+    :param: projection `str|dict|list[str]` -- The projection profile or the fields returned,
+    `pub_datetime` and `_id` are always kept -- defaults to all the fields
+
+    :param: batch_size `int` -- The number of articles fetched per query -- defaults to 500
+
+    :param: after `(datetime, str)` -- The `resume_token` of the last article already seen --
+    defaults to the start
+
+  Output(s):
+
+    :return: articles `generator[dict]` -- The matching articles
+  '''
+
+  projection = __keyset_projection__(projection)
+
+  while True:
+    page_query = query if after is None else {__AND__: [query, __after__(after)]}
+
+    page = list(collection.find(page_query, projection).sort(__KEYSET_SORT__).limit(batch_size))
+
+    for document in page:
+      yield document
+
+    if len(page) < batch_size:
+      return
+
+    after = resume_token(page[-1])
+
+
+# Query#3. Search for articles based on user entry.
+# Querying mongodb
+@__cached_query__
+def search_in_articles(user_entry, ranked=False, limit=None, stream=False,
+                       projection=__SUMMARY_PROFILE__,
+                       batch_size=__FIND_BATCH_SIZE__, after=None):
+  '''
+  search_in_articles(user_entry, ranked=False, limit=None, stream=False, projection='summary',
+                     batch_size=500, after=None) -> list[dict]
+
+  Query#3 - Search for articles based on user entry.
+
+  Searches the articles on the `snippet`, `lead_paragraph` and `abstract` fields for the patterns
+  sought by the user. This function returns the cursor object that can then be iterated to get all
+  the matching articles.
+
+  With `ranked`, the search runs on the `text_search` index of the archives collection instead
+  (see `nyt_indexes.ensure_indexes`): the words of the user entry are matched, stemmed, on the
+  `headline.main`, `abstract`, `snippet` and `lead_paragraph` fields, weighted by
+  `__TEXT_WEIGHTS__`, and the articles come back best match first with their relevance `score`.
+  Quoted phrases and `-excluded` words follow the mongo `$text` syntax.
+
+  Input(s):
+
+    :param: user_entry `str` -- The string or pattern the user is looking for.
+
+    :param: ranked `bool` -- Rank the articles using the text index -- defaults to False
+
+    :param: limit `int` -- The maximum number of articles returned -- defaults to all the matching
+    articles, or `__SEARCH_LIMIT__` when ranked
+
+    :param: stream `bool` -- Yield the articles with `iter_documents` instead of returning a list
+    -- defaults to False
+
+    :param: projection `str|dict|list[str]` -- The projection profile, `summary`, `byline` or
+    `full`, or the fields returned -- defaults to `summary`
+
+    :param: batch_size `int` -- The number of articles fetched per query when streaming -- defaults
+    to 500
+
+    :param: after `(datetime, str)` -- Resume the stream after this `resume_token` -- defaults to
+    the start
+
+    Ranked results are ordered by score, not by the keyset, so they are streamed with a plain
+    cursor and can't be resumed with `after`.
+
+  Output(s):
+
+    :return: articles `list[dict]` -- The list of article documents
+  '''
+
+  client = get_client()
+
+  db = client.get_database(__DATABASE_NAME__)
+
+  '''
+  Sample mongo shell query:
+
+  db.archives.find({
+      $and: [{
+          "document_type": "article"
+      }, {
+
+          $or: [{
+              "lead_paragraph": {
+                  $regex: /.*of the need.*/i
+              }
+          }, {
+              "snippet": {
+                  $regex: /.*of the need.*/i
+              }
+          }, {
+              "abstract": {
+                  $regex: /.*of the need.*/i
+              }
+          }]
+      }]
+  })
+  '''
+
+  query = {
+      __AND__: [
+          {
+              __DOCUMENT_TYPE__: "article"
+          },
+          {
+              __OR__: [
+                  {
+                      __LEAD_PARAGRAPH__: {
+                          __REGEX__: re.compile('.*{pattern}.*'.format(
+                              pattern='.*'.join(user_entry.split(' '))),
+                              re.IGNORECASE)
+                      }
+                  },
+                  {
+                      __SNIPPET__: {
+                          __REGEX__: re.compile('.*{pattern}.*'.format(
+                              pattern='.*'.join(user_entry.split(' '))),
+                              re.IGNORECASE)
+                      }
+                  },
+                  {
+                      __ABSTRACT__: {
+                          __REGEX__: re.compile('.*{pattern}.*'.format(
+                              pattern='.*'.join(user_entry.split(' '))),
+                              re.IGNORECASE)
+                      }
+                  }
+              ]
+          }
+      ]
+  }
+
+  '''
+  Sample mongo shell query, ranked:
+
+  db.archives.find({
+      "document_type": "article",
+      $text: {
+          $search: "of the need"
+      }
+  }, {
+      "score": {
+          $meta: "textScore"
+      }
+  }).sort({
+      "score": {
+          $meta: "textScore"
+      }
+  }).limit(20)
+  '''
+
+  if ranked:
+    if after is not None:
+      raise ValueError('Ranked search results can not be resumed with a keyset')
+
+    score = {__META__: __TEXT_SCORE__}
+
+    ranked_projection = dict(__keyset_projection__(projection) or dict())
+    ranked_projection[__SCORE__] = score
+
+    cursor = db[__COLLECTION_NAME__].find({
+        __DOCUMENT_TYPE__: "article",
+        __TEXT__: {
+            __SEARCH__: user_entry
+        }
+    }, ranked_projection).sort([(__SCORE__, score)]).limit(
+        limit if limit is not None else __SEARCH_LIMIT__)
+
+    if stream:
+      return cursor.batch_size(batch_size)
+  elif stream:
+    documents = iter_documents(db[__COLLECTION_NAME__], query, projection=projection,
+                               batch_size=batch_size, after=after)
+
+    return documents if limit is None else islice(documents, limit)
+  else:
+    cursor = db[__COLLECTION_NAME__].find(query, projection_for(projection))
+
+    if limit is not None:
+      cursor = cursor.limit(limit)
+
+  articles = list(cursor) if cursor is not None else list()
+
+  return articles
+
+
+# The edit distance of two names, None when above the limit
+def __edit_distance__(source, target, limit):
+  '''
+  __edit_distance__(source, target, limit) -> int
+
+  The Levenshtein distance of the two strings, None as soon as it is known to be above the limit.
+  '''
+
+  if abs(len(source) - len(target)) > limit:
+    return None
+
+  previous = list(range(len(target) + 1))
+
+  for row, source_character in enumerate(source, 1):
+    current = [row]
+
+    for column, target_character in enumerate(target, 1):
+      current.append(min(previous[column] + 1, current[column - 1] + 1,
+                         previous[column - 1] + (source_character != target_character)))
+
+    if min(current) > limit:
+      return None
+
+    previous = current
+
+  return previous[-1] if previous[-1] <= limit else None
+
+
+# Whether a reporter name is close enough to the searched name parts
+def __fuzzy_name_match__(parts, name_tokens):
+  '''
+  __fuzzy_name_match__(parts, name_tokens) -> bool
+
+  Whether every searched name token matches a token of the reporter name, in order, allowing
+  `__FUZZY_DISTANCE__` typos per token of at least `__FUZZY_MIN_LENGTH__` characters.
+  '''
+
+  position = 0
+
+  for part in parts:
+    limit = __FUZZY_DISTANCE__ if len(part) >= __FUZZY_MIN_LENGTH__ else 0
+
+    while position < len(name_tokens) and \
+            __edit_distance__(part, name_tokens[position], limit) is None:
+      position += 1
+
+    if position == len(name_tokens):
+      return False
+
+    position += 1
+
+  return True
+
+
+# The distinct reporter names of the dataset
+def __distinct_reporter_names__(client, collection):
+  '''
+  __distinct_reporter_names__(client, collection) -> list[(str, tuple[str])]
+
+  The distinct full names of `reporter_names` with their tokens, read from the `name` index and
+  kept until the dataset generation changes.
+  '''
+
+  generation = dataset_generation(client)
+  key = (__DATABASE_NAME__, __COLLECTION_NAME__)
+
+  with __REPORTER_NAMES_LOCK__:
+    cached = __REPORTER_NAMES_CACHE__.get(key)
+
+    if cached is not None and cached[0] == generation:
+      return cached[1]
+
+  names = [(name, tuple(name.split()))
+           for name in collection.distinct('{reporter_names}.{name}'.format(
+               reporter_names=__REPORTER_NAMES__, name=__NAME_KEY__)) if name]
+
+  with __REPORTER_NAMES_LOCK__:
+    __REPORTER_NAMES_CACHE__[key] = (generation, names)
+
+  return names
+
+
+# Query#4. Find articles by reporter name.
+@__cached_query__
+def search_articles_reporter_name(first_name='', middle_name='', last_name='', stream=False,
+                                  projection=__SUMMARY_PROFILE__, batch_size=__FIND_BATCH_SIZE__,
+                                  after=None, match=__PREFIX_MATCH__):
+  '''
+  search_articles_reporter_name(first_name, middle_name, last_name, stream=False,
+                                projection='summary', batch_size=500, after=None,
+                                match='prefix') -> list[dict]
+
+  Query#4. Find articles by reporter name.
+
+  Searches the articles for the given name of reporter and then returns the cursor object which can
+  be iterated upon to get the matching list of articles.
+
+  The status being looked for is ```reported```. Other statuses are ignored.
+
+  The names are matched against the case folded `reporter_names` (see `normalize_document`), so
+  the search is served by the `reporter_names` indexes, `Hays`, `HAYS` and `hays` all match. The
+  name parts left empty (or `-`) match any name.
+
+  Input(s):
+
+    :param: first_name `str` -- The first name of the reporter. -- defaults to ''
+
+    :param: middle_name `str` -- The middle name of the reporter.  -- defaults to ''
+
+    :param last_name `str` -- The last name of the reporter.  -- defaults to ''
+
+    :param: stream `bool` -- Yield the articles with `iter_documents` instead of returning a list
+    -- defaults to False
+
+    :param: projection `str|dict|list[str]` -- The projection profile, `summary`, `byline` or
+    `full`, or the fields returned -- defaults to `summary`
+
+    :param: batch_size `int` -- The number of articles fetched per query when streaming -- defaults
+    to 500
+
+    :param: after `(datetime, str)` -- Resume the stream after this `resume_token` -- defaults to
+    the start
+
+    :param: match `str` -- `exact` for whole name parts, `prefix` for the name parts starting with
+    the given ones, eg: `Const` for `Constance`, or `fuzzy` for the full names within a typo per
+    name part, eg: `Constanse Hayes` for `Constance L. Hays` -- defaults to `prefix`
+
+  Output(s):
+
+    :return: articles `list[dict]` -- The list of article documents
+  '''
+
+  if match not in __NAME_MATCHES__:
+    raise ValueError('Unknown name match {match}, use one of {matches}'.format(
+        match=match, matches=', '.join(__NAME_MATCHES__)))
+
+  client = get_client()
+
+  db = client.get_database(__DATABASE_NAME__)
+
+  '''
+  Sample mongo shell query:
+
+  db.archives.find({
+        'reporter_names': {
+          $elemMatch: {
+            'last': /^hays/,
+            'first': /^constance/,
+            'middle': /^l/,
+            'role': 'reported'
+          }
+        },
+        'document_type': 'article'
+  })
+  '''
+
+  parts = OrderedDict((part, __fold_name__(name)) for part, name in (
+      (__NAME_LAST__, last_name), (__NAME_FIRST__, first_name), (__NAME_MIDDLE__, middle_name)))
+
+  name_query = OrderedDict()
+
+  if match == __FUZZY_MATCH__:
+    searched = [parts[part] for part in (__NAME_FIRST__, __NAME_MIDDLE__, __NAME_LAST__)
+                if parts[part]]
+    searched_tokens = ' '.join(searched).split()
+
+    name_query[__NAME_KEY__] = {
+        __IN__: [name for name, name_tokens
+                 in __distinct_reporter_names__(client, db[__COLLECTION_NAME__])
+                 if __fuzzy_name_match__(searched_tokens, name_tokens)]
+    }
+  else:
+    for part, name in parts.items():
+      if name:
+        name_query[part] = name if match == __EXACT_MATCH__ else \
+            {__REGEX__: '^' + re.escape(name)}
+
+  name_query[__ROLE__] = 'reported'
+
+  query = {
+      __REPORTER_NAMES__: {
+          __ELEM_MATCH__: name_query
+      },
+      __DOCUMENT_TYPE__: 'article'
+  }
+
+  if stream:
+    return iter_documents(db[__COLLECTION_NAME__], query, projection=projection,
+                          batch_size=batch_size, after=after)
+
+  cursor = db[__COLLECTION_NAME__].find(query, projection_for(projection))
+
+  articles = list(cursor) if cursor is not None else list()
+
+  return articles
+
+
+# Query#13. List all the types of material with article count
+@__cached_query__
+def list_articles_type_of_materials(use_rollups=True):
+  '''
+
+  list_articles_type_of_materials(use_rollups=True) -> list[dict]
+
+  Query#13. List all the types of material with article count.
+
+  This function will list all the articles according to the `type_of_material` field and their
+  associated counts.
+
+  Input(s):
+
+    :param: use_rollups `bool` -- Answer from the rollup collection when it covers the dataset,
+    see `__rollups_ready__` -- defaults to True
+
+  Output(s):
+
+    :return: articles `list[dict]` -- The types of material and their article `count`, most
+    frequent first
+
+  Note: Internally uses the mongo's pipeline aggregation query instead of map-reduce query.
+  '''
+
+  client = get_client()
+
+  db = client.get_database(__DATABASE_NAME__)
+
+  # a grouping query, followed by pipeline aggregation
+  # unlike the `find` queries, pymongo expects a `list` as argument
+  # for `aggregate` queries.
+
+  '''
+  Sample Mongo shell query:
+
+  db.archives.aggregate([{
+    $group: {
+      '_id': '$type_of_material',
+      'count': {
+        $sum: 1
+      }
+    }
+  }, {
+    $sort: {
+      'count': -1
+    }
+  }])
+  '''
+
+  # every article is read, a collection scan is cheaper than walking the whole index. The types
+  # come most frequent first, like the rollups return them
+  pipeline_query = [
+      {
+          __GROUP__: {
+              __ID_OP__: '${type}'.format(type=__TYPE_OF_MATERIAL__),
+              'count': {
+                  __SUM__: 1
+              }
+          }
+      },
+      {
+          __SORT__: {
+              'count': DESCENDING
+          }
+      }
+  ]
+
+  if use_rollups and __rollups_ready__(client):
+    cursor = __rollup_counts__(client, __TYPE_OF_MATERIAL_ROLLUP__, 'count')
+  else:
+    cursor = __aggregate_groups__(db[__COLLECTION_NAME__], pipeline_query)
+
+  articles = list(cursor) if cursor is not None else list()
+
+  return articles
+
+
+# Query#7. Find the most productive reporter (reporter)
+@__cached_query__
+def most_productive_reporter(use_rollups=True, approximate=False):
+  '''
+
+  most_productive_reporter(use_rollups=True, approximate=False) -> dict
 
   Query#7. Find the most productive reporter (reporter)
 
@@ -559,7 +3206,11 @@ def most_productive_reporter():
 
   Input(s):
 
-    None
+    :param: use_rollups `bool` -- Answer from the rollup collection when it covers the dataset,
+    see `__rollups_ready__` -- defaults to True
+
+    :param: approximate `bool` -- Answer from the mergeable sketches written at ingest, the answer
+    carries its `lower` bound and `error`, see `heavy_hitters` -- defaults to False
 
   Output(s):
 
@@ -650,7 +3301,15 @@ def most_productive_reporter():
       }
   ]
 
-  cursor = db[__COLLECTION_NAME__].aggregate(pipeline_query, allowDiskUse=True)
+  answers = __approximate_top__(client, __REPORTER_ROLLUP__, 'article_count', 1) \
+      if approximate else None
+
+  if answers is not None:
+    cursor = answers
+  elif use_rollups and __rollups_ready__(client):
+    cursor = __rollup_counts__(client, __REPORTER_ROLLUP__, 'article_count', limit=1)
+  else:
+    cursor = __aggregate_groups__(db[__COLLECTION_NAME__], pipeline_query)
 
   most_productive_reporter = None
 
@@ -662,168 +3321,230 @@ def most_productive_reporter():
   return most_productive_reporter
 
 
-# Query#1. Compare the top news keywords for the years 2015-2017 and 2005-2007 to
-# see what the news has been about. (Basically try and find the difference tha
-# thas come about in last 10 years.)
-def compare_news_keywords():
+# the publication year ranges compared by Query#1
+def __keyword_periods__(periods):
   '''
-  compare_news_keywords() -> (list[dict], list[dict])
+  __keyword_periods__(periods) -> list[(int, int)]
 
-  Query#1: Compare the top news keywords for the years 2015-2017 and 2005-2007 to
-  see what the news has been about. (Basically try and find the difference that
-  has come about in last 10 years.)
+  Normalizes the periods, a year or a (first year, last year) pair each.
+  '''
 
-  Fetches the top 10 keywords for years 2005-2007 and 2015-2017 and return the lists of these
-  words with the most popular words on the top of each list.
+  normalized = list()
 
-  Input(s):
+  for period in periods:
+    first_year, last_year = (period, period) if isinstance(period, int) else tuple(period)
 
-    None
+    if first_year > last_year:
+      raise ValueError('The period {period} ends before it starts'.format(period=period))
 
-  Output(s):
+    normalized.append((first_year, last_year))
+
+  if len(normalized) == 0:
+    raise ValueError('At least one period is needed')
+
+  return normalized
 
-    :return: phase1_words `list[dict]` -- The list of keyword values, length = 10 and list index 0
-    is the most frequent keyword for year range 2005-2007.
 
-    :return: phase2_words `list[dict]` -- The list of keyword values, length = 10 and list index 0
-    is the most frequent keyword for year range 2015-2017.
+# the top keywords of every period in one aggregation
+def __period_keyword_counts__(client, periods, k, use_rollups=True):
   '''
+  __period_keyword_counts__(client, periods, k, use_rollups=True) -> list[list[dict]]
 
-  client = get_client()
+  Counts the keywords of every period in a single aggregation: the articles of all the periods are
+  matched once, every keyword is counted per period with a conditional `$sum`, and a `$facet` per
+  period keeps its top k keywords.
 
-  db = client.get_database(__DATABASE_NAME__)
+  Output(s):
 
-  phase1_words = None
-  phase2_words = None
+    :return: period_words `list[list[dict]]` -- The top k keywords of every period, most frequent
+    first, as `{"_id": keyword, "counts": [count in every period]}` documents
+  '''
 
   '''
-  Sample mongo shell query:
+  Sample mongo shell query, for 2005-2007 and 2015-2017:
 
-  // for year 2005-2007 -- top 10 keywords a.k.a tags
   db.archives.aggregate([{
       $match: {
-          "pub_date": {
-              $regex: /200[5-7].*/i
-          }
+          $or: [{"pub_year": {$gte: 2005, $lte: 2007}}, {"pub_year": {$gte: 2015, $lte: 2017}}]
       }
   }, {
       $unwind: "$keywords"
   }, {
       $group: {
           _id: "$keywords",
-          count: {
-              $sum: 1
+          period_0: {
+              $sum: {$cond: [{$and: [{$gte: ["$pub_year", 2005]}, {$lte: ["$pub_year", 2007]}]}, 1, 0]}
+          },
+          period_1: {
+              $sum: {$cond: [{$and: [{$gte: ["$pub_year", 2015]}, {$lte: ["$pub_year", 2017]}]}, 1, 0]}
           }
       }
   }, {
-      $sort: {
-          count: -1
+      $facet: {
+          period_0: [{$match: {period_0: {$gt: 0}}}, {$sort: {period_0: -1, _id: 1}}, {$limit: 10}],
+          period_1: [{$match: {period_1: {$gt: 0}}}, {$sort: {period_1: -1, _id: 1}}, {$limit: 10}]
       }
-  }, {
-      $limit: 10
   }])
+  '''
 
-  // for year 2015 - 2017 -- top 10 keywords a.k.a tags
-  db.archives.aggregate([{
-      $match: {
-          "pub_date": {
-              $regex: /201[5-7].*/i
-          }
-      }
-  }, {
-      $unwind: "$keywords"
-  }, {
-      $group: {
-          _id: "$keywords",
-          count: {
-              $sum: 1
-          }
-      }
-  }, {
-      $sort: {
-          count: -1
-      }
-  }, {
-      $limit: 10
-  }])
+  if use_rollups and __rollups_ready__(client):
+    collection = __rollups__(client)
+    year_field = __ROLLUP_YEAR__
+    counted = '${count}'.format(count=__ROLLUP_COUNT__)
+    stages = [
+        {
+            __MATCH__: {
+                __ROLLUP_DIMENSION__: __KEYWORD_ROLLUP__
+            }
+        }
+    ]
+    group_key = '${key}'.format(key=__ROLLUP_KEY__)
+  else:
+    collection = client.get_database(__DATABASE_NAME__)[__COLLECTION_NAME__]
+    year_field = __PUB_YEAR__
+    counted = 1
+    stages = [
+        {
+            __MATCH__: dict()
+        },
+        {
+            __UNWIND__: '${pattern}'.format(pattern=__KEYWORDS__)
+        }
+    ]
+    group_key = '${pattern}'.format(pattern=__KEYWORDS__)
+
+  stages[0][__MATCH__][__OR__] = [{year_field: {__GTEQ__: first_year, __LTEQ__: last_year}}
+                                  for first_year, last_year in periods]
+
+  fields = [__PERIOD_FIELD_FORMAT__.format(index=index) for index in range(len(periods))]
+
+  group = {__ID_OP__: group_key}
+
+  for field, (first_year, last_year) in zip(fields, periods):
+    in_period = {
+        __AND__: [{__GTEQ__: ['${year}'.format(year=year_field), first_year]},
+                  {__LTEQ__: ['${year}'.format(year=year_field), last_year]}]
+    }
+    group[field] = {__SUM__: {__COND__: [in_period, counted, 0]}}
+
+  stages.append({__GROUP__: group})
+  stages.append({
+      __FACET__: dict((field, [{__MATCH__: {field: {__GT__: 0}}},
+                               {__SORT__: SON([(field, -1), (__ID_OP__, 1)])},
+                               {__LIMIT__: k}]) for field in fields)
+  })
+
+  facets = next(collection.aggregate(stages, allowDiskUse=True), None) or dict()
+
+  return [[{__ID__: word[__ID__], __COUNTS_FIELD__: [word[other] for other in fields]}
+           for word in facets.get(field, list())] for field in fields]
+
+
+# Query#1. Compare the top news keywords for the years 2015-2017 and 2005-2007 to
+# see what the news has been about. (Basically try and find the difference tha
+# thas come about in last 10 years.)
+@__cached_query__
+def compare_news_keywords(periods=__KEYWORD_PERIODS__, k=__TOP_KEYWORDS__, use_rollups=True):
   '''
+  compare_news_keywords(periods=((2005, 2007), (2015, 2017)), k=10, use_rollups=True)
+    -> tuple[list[dict]]
 
-  # query is for aggregation pipeline of pymongo
-  # query for year range 2005-2007
-  phase1_query = [
-      {
-          __MATCH__: {
-              __PUB_DATE__: {
-                  __REGEX__: re.compile('200[5-7].*', re.IGNORECASE)
-              }
-          }
-      },
-      {
-          __UNWIND__: '${pattern}'.format(pattern=__KEYWORDS__)
-      },
-      {
-          __GROUP__: {
-              __ID_OP__: '${pattern}'.format(pattern=__KEYWORDS__),
-              __COUNT_FIELD__: {
-                  __SUM__: 1
-              }
-          }
-      },
-      {
-          __SORT__: {
-              __COUNT_FIELD__: -1
-          }
-      },
-      {
-          __LIMIT__: 10
-      }
-  ]
+  Query#1: Compare the top news keywords for the years 2015-2017 and 2005-2007 to
+  see what the news has been about. (Basically try and find the difference that
+  has come about in last 10 years.)
 
-  cursor = db[__COLLECTION_NAME__].aggregate(phase1_query, allowDiskUse=True)
+  Fetches the top k keywords of every period and returns the lists of these words with the most
+  popular words on the top of each list. All the periods are counted in a single aggregation, see
+  `compare_keyword_periods` for the ranks of every keyword across the periods.
 
-  phase1_words = list(cursor) if cursor is not None else list()
+  Input(s):
 
-  phase2_query = [
-      {
-          __MATCH__: {
-              __PUB_DATE__: {
-                  __REGEX__: re.compile('201[5-7].*', re.IGNORECASE)
-              }
-          }
-      },
-      {
-          __UNWIND__: '${pattern}'.format(pattern=__KEYWORDS__)
-      },
-      {
-          __GROUP__: {
-              __ID_OP__: '${pattern}'.format(pattern=__KEYWORDS__),
-              __COUNT_FIELD__: {
-                  __SUM__: 1
-              }
-          }
-      },
-      {
-          __SORT__: {
-              __COUNT_FIELD__: -1
-          }
-      },
-      {
-          __LIMIT__: 10
-      }
-  ]
+    :param: periods `list` -- The periods compared, a year or a (first year, last year) pair each
+    -- defaults to 2005-2007 and 2015-2017
+
+    :param: k `int` -- The number of keywords per period -- defaults to 10
+
+    :param: use_rollups `bool` -- Answer from the rollup collection when it covers the dataset,
+    see `__rollups_ready__` -- defaults to True
+
+  Output(s):
+
+    :return: period_words `tuple[list[dict]]` -- One list of `{"_id": keyword, "count": count}`
+    per period, of length at most k, list index 0 being the most frequent keyword of the period.
+  '''
+
+  periods = __keyword_periods__(periods)
+
+  period_words = __period_keyword_counts__(get_client(), periods, k, use_rollups=use_rollups)
+
+  return tuple([{__ID__: word[__ID__], __COUNT_FIELD__: word[__COUNTS_FIELD__][index]}
+                for word in words] for index, words in enumerate(period_words))
+
+
+# Query#1, the ranks of the top keywords across the periods
+@__cached_query__
+def compare_keyword_periods(periods=__KEYWORD_PERIODS__, k=__TOP_KEYWORDS__, use_rollups=True):
+  '''
+  compare_keyword_periods(periods=((2005, 2007), (2015, 2017)), k=10, use_rollups=True)
+    -> list[dict]
+
+  Compares the keywords of any number of periods in a single aggregation: every keyword in the top
+  k of at least one period is reported with its count and rank in every period.
+
+  Input(s):
+
+    :param: periods `list` -- The periods compared, a year or a (first year, last year) pair each,
+    eg: `range(2005, 2011)` for six separate years -- defaults to 2005-2007 and 2015-2017
+
+    :param: k `int` -- The number of top keywords of every period -- defaults to 10
+
+    :param: use_rollups `bool` -- Answer from the rollup collection when it covers the dataset,
+    see `__rollups_ready__` -- defaults to True
+
+  Output(s):
+
+    :return: keywords `list[dict]` -- `_id` (the keyword), `counts` and `ranks` (1 based, None
+    outside the top k) in every period, and `rank_deltas`, the places gained from every period to
+    the next (None when the keyword is outside the top k of either). Sorted by the best rank across
+    the periods.
+  '''
 
-  cursor = db[__COLLECTION_NAME__].aggregate(phase2_query, allowDiskUse=True)
+  periods = __keyword_periods__(periods)
 
-  phase2_words = list(cursor) if cursor is not None else list()
+  period_words = __period_keyword_counts__(get_client(), periods, k, use_rollups=use_rollups)
 
-  return (phase1_words, phase2_words)
+  keywords = OrderedDict()
+
+  for index, words in enumerate(period_words):
+    for rank, word in enumerate(words, start=1):
+      key = dumps(word[__ID__], sort_keys=True, default=str)
+
+      if key not in keywords:
+        keywords[key] = {
+            __ID__: word[__ID__],
+            __COUNTS_FIELD__: word[__COUNTS_FIELD__],
+            __RANKS_FIELD__: [None] * len(periods)
+        }
+
+      keywords[key][__RANKS_FIELD__][index] = rank
+
+  for keyword in keywords.values():
+    ranks = keyword[__RANKS_FIELD__]
+    keyword[__RANK_DELTAS_FIELD__] = [
+        previous - current if previous is not None and current is not None else None
+        for previous, current in zip(ranks, ranks[1:])
+    ]
+
+  return sorted(keywords.values(),
+                key=lambda keyword: min(rank for rank in keyword[__RANKS_FIELD__] if rank))
 
 
 # Query#2: Find the most popular news keywords from the entire archives
 # collection.
-def most_popular_news_keywords():
+@__cached_query__
+def most_popular_news_keywords(use_rollups=True, approximate=False):
   '''
-  most_popular_news_keywords() -> list[dict]
+  most_popular_news_keywords(use_rollups=True, approximate=False) -> list[dict]
 
   Query#2: Find the most popular `news` keywords from the entire archives.
 
@@ -833,7 +3554,11 @@ def most_popular_news_keywords():
 
   Input(s):
 
-    None
+    :param: use_rollups `bool` -- Answer from the rollup collection when it covers the dataset,
+    see `__rollups_ready__` -- defaults to True
+
+    :param: approximate `bool` -- Answer from the mergeable sketches written at ingest, the answer
+    carries its `lower` bound and `error`, see `heavy_hitters` -- defaults to False
 
   Output(s):
 
@@ -848,6 +3573,15 @@ def most_popular_news_keywords():
 
   most_popular_keywords = None
 
+  if approximate:
+    most_popular_keywords = __approximate_top__(client, __NEWS_KEYWORD_ROLLUP__, __COUNT_FIELD__, 5)
+
+    if most_popular_keywords is not None:
+      return most_popular_keywords
+
+  if use_rollups and __rollups_ready__(client):
+    return __rollup_counts__(client, __NEWS_KEYWORD_ROLLUP__, __COUNT_FIELD__, limit=5)
+
   '''
   Sample mongo shell query:
 
@@ -901,124 +3635,402 @@ def most_popular_news_keywords():
       }
   ]
 
-  cursor = db[__COLLECTION_NAME__].aggregate(query, allowDiskUse=True)
+  cursor = db[__COLLECTION_NAME__].aggregate(query, allowDiskUse=True)
+
+  most_popular_keywords = list(cursor) if cursor is not None else list()
+
+  return most_popular_keywords
+
+
+# Query#6: Find the articles that have occurred on page# x over these years.
+@__cached_query__
+def xpage_articles(page_number=1, stream=False, projection=__SUMMARY_PROFILE__,
+                   batch_size=__FIND_BATCH_SIZE__, after=None):
+  '''
+  xpage_articles(page_number=1, stream=False, projection='summary', batch_size=500,
+                 after=None) -> list[dict]
+
+  Query#6: Find the articles that have occured on page# x over these years.
+
+  Fetches the list of documents for the articles that have occurred on page number `page_number`
+  over these years in the dataset (archives).
+
+  Input(s):
+
+    :param: page_number `int` -- The printed page number you are looking for.
+
+    :param: stream `bool` -- Yield the articles with `iter_documents` instead of returning a list
+    -- defaults to False
+
+    :param: projection `str|dict|list[str]` -- The projection profile, `summary`, `byline` or
+    `full`, or the fields returned -- defaults to `summary`
+
+    :param: batch_size `int` -- The number of articles fetched per query when streaming -- defaults
+    to 500
+
+    :param: after `(datetime, str)` -- Resume the stream after this `resume_token` -- defaults to
+    the start
+
+  Output(s):
+
+    :return: articles `list[dict]` -- The list of `article` documents occurring
+    on the printed page provided.
+  '''
+
+  client = get_client()
+
+  db = client.get_database(__DATABASE_NAME__)
+
+  articles = None
+
+  '''
+  Sample mongo shell query:
+
+  // Query#6. Find the articles that have occured on page# x over these years.
+  db.archives.find({
+      $and: [{
+          "page": 90
+      }, {
+          "document_type": "article"
+      }]
+  })
+  '''
+
+  query = {
+      __AND__: [
+          {
+              __PAGE__: int(page_number)
+          },
+          {
+              __DOCUMENT_TYPE__: "article"
+          }
+      ]
+  }
+
+  if stream:
+    return iter_documents(db[__COLLECTION_NAME__], query, projection=projection,
+                          batch_size=batch_size, after=after)
+
+  cursor = db[__COLLECTION_NAME__].find(query, projection_for(projection))
+
+  articles = list(cursor) if cursor is not None else list()
+
+  return articles
+
+
+# Query#8. Find the longest article (page or word count)
+@__cached_query__
+def longest_article(projection=__SUMMARY_PROFILE__):
+  '''
+  longest_article(projection='summary') -> dict
+
+  Query#8. Find the longest article (page or word count)
+
+  Finds and returns the longest article depending on the word count
+  (document) obtained from the archives dataset.
+
+  Input(s):
+
+    :param: projection `str|dict|list[str]` -- The projection profile, `summary`, `byline` or
+    `full`, or the fields returned -- defaults to `summary`
+
+  Output(s):
+
+    :return: article `dict` -- The longest article mongo document
+  '''
+
+  client = get_client()
+
+  db = client.get_database(__DATABASE_NAME__)
+
+  article = None
+
+  '''
+  Sample mongo shell query:
+
+  //Query#8. Find the longest article (page or word count)
+  db.archives.find({
+      "document_type": "article"
+  }).sort({
+      "word_count": -1
+  }).limit(1)
+  '''
+
+  query = {
+      __DOCUMENT_TYPE__: 'article'
+  }
+
+  cursor = db[__COLLECTION_NAME__].find(
+      query, projection_for(projection)).sort(__WORD_COUNT__, DESCENDING).limit(1)
+
+  article = list(cursor) if cursor is not None else list()
+
+  article = article[0] if len(article) > 0 else None
+
+  return article
+
 
-  most_popular_keywords = list(cursor) if cursor is not None else list()
+# The entity catalog of the archives collection
+def __entities__(client):
+  '''
+  __entities__(client) -> Collection
 
-  return most_popular_keywords
+  The entity catalog, `<collection>_entities`, kept next to the archives collection. It holds one
+  document per named entity, a `persons`, `organizations`, `glocations` or `subject` keyword value,
+  with its case folded forms (see `__fold_name__`) and the number of keywords naming it:
 
+    {"_id": "organizations:AT&T (CORP.)", "kind": "organizations", "value": "AT&T (CORP.)",
+     "folded": "at t corp", "tokens": ["at", "t", "corp"], "count": 212, "generation": 7}
 
-# Query#6: Find the articles that have occurred on page# x over these years.
-def xpage_articles(page_number=1):
+  The `_catalog` document records the dataset generation the catalog was built from.
   '''
-  xpage_articles(page_number=1) -> list[dict]
 
-  Query#6: Find the articles that have occured on page# x over these years.
+  return client.get_database(__DATABASE_NAME__)[__COLLECTION_NAME__ + __ENTITIES_SUFFIX__]
 
-  Fetches the list of documents for the articles that have occurred on page number `page_number`
-  over these years in the dataset (archives).
 
-  Input(s):
+# The id of an entity
+def entity_id(kind, value):
+  '''
+  entity_id(kind, value) -> str
 
-    :param: page_number `int` -- The printed page number you are looking for.
+  The catalog id of the keyword value, `kind:value`, eg: `organizations:MATTEL INC`.
+  '''
 
-  Output(s):
+  return '{kind}:{value}'.format(kind=kind, value=value)
 
-    :return: articles `list[dict]` -- The list of `article` documents occurring
-    on the printed page provided.
+
+# Building the entity catalog
+def build_entity_catalog(client=None, batch_size=__INSERT_BATCH_SIZE__):
   '''
+  build_entity_catalog(client=None, batch_size=__INSERT_BATCH_SIZE__) -> int
 
-  client = get_client()
+  Builds the entity catalog (see `__entities__`) from the `keyword` rollups, or from the archives
+  when the rollups don't cover the dataset, and drops the entities no longer found. The ingest
+  rebuilds it after every run of `create_archives_dataset`.
 
-  db = client.get_database(__DATABASE_NAME__)
+  Input(s):
 
-  articles = None
+    :param: client `MongoClient` -- The client to use -- defaults to the shared client
 
-  '''
-  Sample mongo shell query:
+    :param: batch_size `int` -- The number of entities per `bulk_write` -- defaults to
+    __INSERT_BATCH_SIZE__
 
-  // Query#6. Find the articles that have occured on page# x over these years.
-  db.archives.find({
-      $and: [{
-          "print_page": "90"
-      }, {
-          "document_type": "article"
-      }]
-  })
+  Output(s):
+
+    :return: entity_count `int` -- The number of entities in the catalog
   '''
 
-  query = {
-      __AND__: [
-          {
-              __PRINT_PAGE__: str(page_number)
+  client = get_client() if client is None else client
+
+  generation = dataset_generation(client)
+
+  if __rollups_ready__(client):
+    source = __rollups__(client)
+    prefix = '{key}.'.format(key=__ROLLUP_KEY__)
+    pipeline = [
+        {
+            __MATCH__: {
+                __ROLLUP_DIMENSION__: __KEYWORD_ROLLUP__,
+                prefix + __KEYWORDS_NAME__: {__IN__: list(__ENTITY_KINDS__)}
+            }
+        }
+    ]
+    count = '${count}'.format(count=__ROLLUP_COUNT__)
+  else:
+    source = client.get_database(__DATABASE_NAME__)[__COLLECTION_NAME__]
+    prefix = '{keywords}.'.format(keywords=__KEYWORDS__)
+    pipeline = [
+        {
+            __MATCH__: {
+                prefix + __KEYWORDS_NAME__: {__IN__: list(__ENTITY_KINDS__)}
+            }
+        },
+        {
+            __UNWIND__: '${keywords}'.format(keywords=__KEYWORDS__)
+        },
+        {
+            __MATCH__: {
+                prefix + __KEYWORDS_NAME__: {__IN__: list(__ENTITY_KINDS__)}
+            }
+        }
+    ]
+    count = 1
+
+  pipeline.append({
+      __GROUP__: {
+          __ID_OP__: {
+              __ENTITY_KIND__: '$' + prefix + __KEYWORDS_NAME__,
+              __ENTITY_VALUE__: '$' + prefix + __KEYWORDS_VALUE__
           },
-          {
-              __DOCUMENT_TYPE__: "article"
+          __ENTITY_COUNT__: {
+              __SUM__: count
           }
-      ]
+      }
+  })
+
+  collection = __entities__(client)
+
+  collection.create_index([(__ENTITY_KIND__, ASCENDING), (__ENTITY_FOLDED__, ASCENDING)])
+  collection.create_index([(__ENTITY_KIND__, ASCENDING), (__ENTITY_TOKENS__, ASCENDING)])
+  collection.create_index([(__ENTITY_KIND__, ASCENDING), (__ENTITY_COUNT__, DESCENDING)])
+
+  entities = (ReplaceOne({__ID__: entity_id(group[__ID_OP__][__ENTITY_KIND__],
+                                            group[__ID_OP__][__ENTITY_VALUE__])},
+                         __entity_document__(group[__ID_OP__][__ENTITY_KIND__],
+                                             group[__ID_OP__][__ENTITY_VALUE__],
+                                             group[__ENTITY_COUNT__], generation),
+                         upsert=True)
+              for group in source.aggregate(pipeline, allowDiskUse=True)
+              if isinstance(group[__ID_OP__].get(__ENTITY_VALUE__), str))
+
+  entity_count = 0
+
+  for batch, _ in __batches__(entities, batch_size):
+    collection.bulk_write(batch, ordered=False)
+    entity_count += len(batch)
+
+  collection.delete_many({__ID__: {__NE__: __CATALOG_ID__},
+                          __ENTITY_GENERATION__: {__NE__: generation}})
+  collection.replace_one({__ID__: __CATALOG_ID__}, {__ENTITY_GENERATION__: generation},
+                         upsert=True)
+
+  warning('Built the entity catalog, {count} entities'.format(count=entity_count))
+
+  return entity_count
+
+
+# The catalog document of an entity
+def __entity_document__(kind, value, count, generation):
+  '''
+  __entity_document__(kind, value, count, generation) -> dict
+  '''
+
+  folded = __fold_name__(value)
+
+  return {
+      __ENTITY_KIND__: kind,
+      __ENTITY_VALUE__: value,
+      __ENTITY_FOLDED__: folded,
+      __ENTITY_TOKENS__: folded.split(),
+      __ENTITY_COUNT__: count,
+      __ENTITY_GENERATION__: generation
   }
 
-  cursor = db[__COLLECTION_NAME__].find(query)
 
-  articles = list(cursor) if cursor is not None else list()
+# Whether the entity catalog is up to date
+def __entity_catalog_ready__(client):
+  '''
+  __entity_catalog_ready__(client) -> bool
 
-  return articles
+  The catalog answers the name lookups only when it was built from the current dataset generation,
+  entities ingested since would be missed otherwise.
+  '''
 
+  catalog = __entities__(client).find_one({__ID__: __CATALOG_ID__})
 
-# Query#8. Find the longest article (page or word count)
-def longest_article():
+  return catalog is not None and catalog.get(__ENTITY_GENERATION__) == dataset_generation(client)
+
+
+# The catalog query of the entities named by a prefix
+def __entity_query__(prefix, kinds):
   '''
-  longest_article() -> dict
+  __entity_query__(prefix, kinds) -> dict
 
-  Query#8. Find the longest article (page or word count)
+  Every case folded token of the prefix has to start a token of the entity, in any order, eg:
+  `mattel`, `Matt` and `inc matt` all find `MATTEL INC`.
+  '''
 
-  Finds and returns the longest article depending on the word count
-  (document) obtained from the archives dataset.
+  query = {__ENTITY_KIND__: {__IN__: list(kinds)}}
+
+  tokens = __fold_name__(prefix).split()
+
+  if tokens:
+    query[__AND__] = [{__ENTITY_TOKENS__: {__REGEX__: '^' + re.escape(token)}}
+                      for token in tokens]
+
+  return query
+
+
+# Autocompleting the named entities
+def autocomplete_entities(prefix, kinds=__ENTITY_KINDS__, limit=__AUTOCOMPLETE_LIMIT__,
+                          client=None):
+  '''
+  autocomplete_entities(prefix, kinds=__ENTITY_KINDS__, limit=10, client=None) -> list[dict]
+
+  The most frequent entities of the catalog named by the prefix being typed (see
+  `__entity_query__`), served by the `kind`, `tokens` index of the catalog.
 
   Input(s):
 
-    None
+    :param: prefix `str` -- The name typed so far, case and punctuation are ignored
+
+    :param: kinds `tuple[str]` -- The keyword names searched, any of `persons`, `organizations`,
+    `glocations` and `subject` -- defaults to all of them
+
+    :param: limit `int` -- The number of entities -- defaults to 10
+
+    :param: client `MongoClient` -- The client to use -- defaults to the shared client
 
   Output(s):
 
-    :return: article `dict` -- The longest article mongo document
+    :return: entities `list[dict]` -- `_id` (the `entity_id`), `kind`, `value` and `count`, most
+    frequent first, empty until `build_entity_catalog` has run
   '''
 
-  client = get_client()
+  unknown_kinds = set(kinds) - set(__ENTITY_KINDS__)
 
-  db = client.get_database(__DATABASE_NAME__)
+  if unknown_kinds:
+    raise ValueError('Unknown entity kinds {kinds}, use any of {entity_kinds}'.format(
+        kinds=', '.join(sorted(unknown_kinds)), entity_kinds=', '.join(__ENTITY_KINDS__)))
 
-  article = None
+  client = get_client() if client is None else client
+
+  cursor = __entities__(client).find(
+      __entity_query__(prefix, kinds),
+      {__ENTITY_KIND__: True, __ENTITY_VALUE__: True, __ENTITY_COUNT__: True})
 
+  return list(cursor.sort([(__ENTITY_COUNT__, DESCENDING), (__ID__, ASCENDING)]).limit(limit))
+
+
+# The articles naming any of the entities
+def __entity_articles__(db, kind, values, stream, projection, batch_size, after):
   '''
-  Sample mongo shell query:
+  __entity_articles__(db, kind, values, stream, projection, batch_size, after) -> list[dict]
 
-  //Query#8. Find the longest article (page or word count)
-  db.archives.find({
-      "document_type": "article"
-  }).sort({
-      "word_count": -1
-  }).limit(1)
+  The articles with a `kind` keyword equal to one of the values, served by the
+  `keywords.name`, `keywords.value` index.
   '''
 
   query = {
-      __DOCUMENT_TYPE__: 'article'
+      __KEYWORDS__: {
+          __ELEM_MATCH__: {
+              __KEYWORDS_NAME__: kind,
+              __KEYWORDS_VALUE__: {
+                  __IN__: list(values)
+              }
+          }
+      }
   }
 
-  cursor = db[__COLLECTION_NAME__].find(
-      query).sort(__WORD_COUNT__, DESCENDING).limit(1)
+  if stream:
+    return iter_documents(db[__COLLECTION_NAME__], query, projection=projection,
+                          batch_size=batch_size, after=after)
 
-  article = list(cursor) if cursor is not None else list()
+  cursor = db[__COLLECTION_NAME__].find(query, projection_for(projection))
 
-  article = article[0] if len(article) > 0 else None
+  articles = list(cursor) if cursor is not None else list()
 
-  return article
+  return articles
 
 
 # Query#5. Find articles about specific people or organizations
-def search_people_or_organization(search_string, flag_person=False):
+@__cached_query__
+def search_people_or_organization(search_string, flag_person=False, stream=False,
+                                  projection=__SUMMARY_PROFILE__, batch_size=__FIND_BATCH_SIZE__,
+                                  after=None):
   '''
-  search_people_or_organization(flag_person=False, search_string) -> list[dict]
+  search_people_or_organization(search_string, flag_person=False, stream=False,
+                                projection='summary', batch_size=500, after=None) -> list[dict]
 
   Query#5. Find articles about specific people or organizations
 
@@ -1026,11 +4038,29 @@ def search_people_or_organization(search_string, flag_person=False):
 
   The flag_person will determine if the query is about people(false) or organization(true)
 
+  The name is first resolved to the entities of the catalog (see `autocomplete_entities`), every
+  token of the name starting a token of the entity, and the articles are then looked up by the
+  exact keyword values. Until the catalog is built from the current dataset the name is matched as
+  a literal, case insensitive substring of the keyword values.
+
   Input(s):
 
     :param: flag_person `bool` -- The flag to determine whether the query is about people or not. -- defaults to false
 
-    :param: search_string `str` -- The name of the person or organization. -- no default
+    :param: search_string `str` -- The name of the person or organization, a ValueError is raised
+    when it has no letter or digit. -- no default
+
+    :param: stream `bool` -- Yield the articles with `iter_documents` instead of returning a list
+    -- defaults to False
+
+    :param: projection `str|dict|list[str]` -- The projection profile, `summary`, `byline` or
+    `full`, or the fields returned -- defaults to `summary`
+
+    :param: batch_size `int` -- The number of articles fetched per query when streaming -- defaults
+    to 500
+
+    :param: after `(datetime, str)` -- Resume the stream after this `resume_token` -- defaults to
+    the start
 
   Output(s):
 
@@ -1041,59 +4071,115 @@ def search_people_or_organization(search_string, flag_person=False):
 
   db = client.get_database(__DATABASE_NAME__)
 
+  kind = "organizations" if not flag_person else "persons"
+
+  # a name without any letter or digit would match every entity of the kind
+  if not __fold_name__(search_string):
+    raise ValueError('Nothing to search for in the name {search_string!r}'.format(
+        search_string=search_string))
+
   '''
   Mongo shell sample query:
 
-  //#5 -- Organization
-  db.archives.find({
-    “keywords”: {
-      $elemMatch: {
-        “name”: “organizations”,
-        “value”: {
-          $regex: /.*MATTEL.*/i
-        }
-      }
-    }
+  //#5 -- Organization, the values resolved by the entity catalog
+  db.archives_entities.find({
+    "kind": {$in: ["organizations"]},
+    $and: [{"tokens": /^mattel/}]
   })
 
-  //#5 -- People
   db.archives.find({
-    “keywords”: {
+    "keywords": {
       $elemMatch: {
-        “name”: “persons”,
-        “value”: {
-          $regex: /.*CONDOLEEZZA.*/i
+        "name": "organizations",
+        "value": {
+          $in: ["MATTEL INC"]
         }
       }
     }
   })
   '''
 
+  if __entity_catalog_ready__(client):
+    values = [entity[__ENTITY_VALUE__] for entity in __entities__(client).find(
+        __entity_query__(search_string, (kind,)), {__ENTITY_VALUE__: True})]
+
+    return __entity_articles__(db, kind, values, stream, projection, batch_size, after)
+
   query = {
       __KEYWORDS__: {
           __ELEM_MATCH__: {
-              __KEYWORDS_NAME__: "organizations" if not flag_person else "persons",
+              __KEYWORDS_NAME__: kind,
               __KEYWORDS_VALUE__: {
-                  __REGEX__: re.compile('.*{pattern}.*'.format(
-                      pattern=search_string), re.IGNORECASE)
+                  __REGEX__: re.compile(re.escape(search_string), re.IGNORECASE)
               }
           }
       }
   }
 
-  cursor = db[__COLLECTION_NAME__].find(query)
+  if stream:
+    return iter_documents(db[__COLLECTION_NAME__], query, projection=projection,
+                          batch_size=batch_size, after=after)
+
+  cursor = db[__COLLECTION_NAME__].find(query, projection_for(projection))
 
   articles = list(cursor) if cursor is not None else list()
 
   return articles
 
 
+# Query#5. Find the articles about an entity of the catalog
+@__cached_query__
+def entity_articles(entity, stream=False, projection=__SUMMARY_PROFILE__,
+                    batch_size=__FIND_BATCH_SIZE__, after=None):
+  '''
+  entity_articles(entity, stream=False, projection='summary', batch_size=500,
+                  after=None) -> list[dict]
+
+  Query#5. Find the articles about an entity picked from `autocomplete_entities`, by its exact
+  keyword value.
+
+  Input(s):
+
+    :param: entity `str` -- The `entity_id`, eg: `organizations:MATTEL INC`
+
+    :param: stream `bool` -- Yield the articles with `iter_documents` instead of returning a list
+    -- defaults to False
+
+    :param: projection `str|dict|list[str]` -- The projection profile, `summary`, `byline` or
+    `full`, or the fields returned -- defaults to `summary`
+
+    :param: batch_size `int` -- The number of articles fetched per query when streaming -- defaults
+    to 500
+
+    :param: after `(datetime, str)` -- Resume the stream after this `resume_token` -- defaults to
+    the start
+
+  Output(s):
+
+    :return: articles `list[dict]` -- The list of articles
+  '''
+
+  kind, _, value = entity.partition(':')
+
+  if kind not in __ENTITY_KINDS__ or not value:
+    raise ValueError('Not an entity id {entity}, expected one of {kinds} and the value, eg: '
+                     'organizations:MATTEL INC'.format(entity=entity,
+                                                       kinds=', '.join(__ENTITY_KINDS__)))
+
+  db = get_client().get_database(__DATABASE_NAME__)
+
+  return __entity_articles__(db, kind, (value,), stream, projection, batch_size, after)
+
+
 # Query#10: Find the articles published in certain time range (date)
-def articles_between(begin_time, end_time):
+@__cached_query__
+def articles_between(begin_time, end_time, stream=False, projection=__SUMMARY_PROFILE__,
+                     batch_size=__FIND_BATCH_SIZE__, after=None):
   '''
-  articles_between(begin_time, end_time) -> list[dict]
+  articles_between(begin_time, end_time, stream=False, projection='summary',
+                   batch_size=500, after=None) -> list[dict]
 
-  Finds the articles published between the `begin_time` and `end_time`.
+  Finds the articles published between the `begin_time` (included) and `end_time` (excluded).
 
   Input(s):
 
@@ -1101,6 +4187,18 @@ def articles_between(begin_time, end_time):
 
     :param: end_time `str` -- The end of the time/date range -- yyyy-mm-dd format
 
+    :param: stream `bool` -- Yield the articles with `iter_documents` instead of returning a list
+    -- defaults to False
+
+    :param: projection `str|dict|list[str]` -- The projection profile, `summary`, `byline` or
+    `full`, or the fields returned -- defaults to `summary`
+
+    :param: batch_size `int` -- The number of articles fetched per query when streaming -- defaults
+    to 500
+
+    :param: after `(datetime, str)` -- Resume the stream after this `resume_token` -- defaults to
+    the start
+
   Output(s):
 
     :return: articles `list[dict]` -- The list of all the article/documents that were published in
@@ -1115,28 +4213,32 @@ def articles_between(begin_time, end_time):
   Sample Mongo shell query
   db.archives.find({
     $and: [{
-        "pub_date": { $gt: "2000-04-01" }
+        "pub_datetime": { $gte: ISODate("2000-04-01") }
     }, {
-        "pub_date": { $lt: "2000-05-01" }
+        "pub_datetime": { $lt: ISODate("2000-05-01") }
     }]
   })
   '''
   query = {
       __AND__: [
           {
-              __PUB_DATE__: {
-                  __GT__: begin_time
+              __PUB_DATETIME__: {
+                  __GTEQ__: datetime.strptime(begin_time, __DATE_FORMAT__)
               }
           },
           {
-              __PUB_DATE__: {
-                  __LT__: end_time
+              __PUB_DATETIME__: {
+                  __LT__: datetime.strptime(end_time, __DATE_FORMAT__)
               }
           }
       ]
   }
 
-  cursor = db[__COLLECTION_NAME__].find(query)
+  if stream:
+    return iter_documents(db[__COLLECTION_NAME__], query, projection=projection,
+                          batch_size=batch_size, after=after)
+
+  cursor = db[__COLLECTION_NAME__].find(query, projection_for(projection))
 
   articles = list(cursor) if cursor is not None else list()
 
@@ -1144,14 +4246,19 @@ def articles_between(begin_time, end_time):
 
 
 # Query#11: Find the organization that appears the most in NYT
-def most_organization():
+@__cached_query__
+def most_organization(use_rollups=True, approximate=False):
   '''
-  most_organization() -> dict
+  most_organization(use_rollups=True, approximate=False) -> dict
 
   Query#11: Find the organization that appears the most in NYT
 
   Input(s):
-    None
+    :param: use_rollups `bool` -- Answer from the rollup collection when it covers the dataset,
+    see `__rollups_ready__` -- defaults to True
+
+    :param: approximate `bool` -- Answer from the mergeable sketches written at ingest, the answer
+    carries its `lower` bound and `error`, see `heavy_hitters` -- defaults to False
 
   Output(s):
     :return: organization `dict` -- The organization that appears the most in NYT
@@ -1166,20 +4273,16 @@ def most_organization():
   '''
   Sample mongo shell query:
   db.archives.aggregate([{
-        $unwind: '$keywords'
-    }, {
         $match: {
-            $and: [{
-                'keywords.name': "organizations"
-            }, {
-                'keywords.value': {
-                    $regex: /.+/
-                }
-            }]
+            'keyword_values.organizations': {
+                $exists: true
+            }
         }
+    }, {
+        $unwind: '$keyword_values.organizations'
     }, {
         $group: {
-            '_id': '$keywords.value',
+            '_id': '$keyword_values.organizations',
             'organization_count': {
                 $sum: 1
             }
@@ -1192,33 +4295,21 @@ def most_organization():
   '''
 
   query = [
-      {
-          __UNWIND__: '${keywords}'.format(
-              keywords=__KEYWORDS__)
-      },
       {
           __MATCH__: {
-              __AND__: [
-                  {
-                      '{keywords}.{name}'.format(
-                          keywords=__KEYWORDS__,
-                          name=__KEYWORDS_NAME__): 'organizations'
-                  },
-                  {
-                      '{keywords}.{value}'.format(
-                          keywords=__KEYWORDS__,
-                          value=__KEYWORDS_VALUE__): {
-                          __REGEX__: re.compile('.+', re.IGNORECASE)
-                      }
-                  }
-              ]
+              '{keyword_values}.organizations'.format(keyword_values=__KEYWORD_VALUES__): {
+                  __EXISTS__: True
+              }
           }
       },
+      {
+          __UNWIND__: '${keyword_values}.organizations'.format(
+              keyword_values=__KEYWORD_VALUES__)
+      },
       {
           __GROUP__: {
-              __ID_OP__: '${keywords}.{value}'.format(
-                  keywords=__KEYWORDS__,
-                  value=__KEYWORDS_VALUE__),
+              __ID_OP__: '${keyword_values}.organizations'.format(
+                  keyword_values=__KEYWORD_VALUES__),
               'organization_count': {
                   __SUM__: 1
               }
@@ -1231,7 +4322,15 @@ def most_organization():
       }
   ]
 
-  cursor = db[__COLLECTION_NAME__].aggregate(query, allowDiskUse=True)
+  answers = __approximate_top__(client, __ORGANIZATION_ROLLUP__, 'organization_count', 1) \
+      if approximate else None
+
+  if answers is not None:
+    cursor = answers
+  elif use_rollups and __rollups_ready__(client):
+    cursor = __rollup_counts__(client, __ORGANIZATION_ROLLUP__, 'organization_count', limit=1)
+  else:
+    cursor = __aggregate_groups__(db[__COLLECTION_NAME__], query)
 
   organization = list(cursor) if cursor is not None else list()
 
@@ -1241,14 +4340,16 @@ def most_organization():
 
 
 # Query#12: Find the section-name for which maximum number of articles written
-def most_section():
+@__cached_query__
+def most_section(use_rollups=True):
   '''
-  most_section() -> dict
+  most_section(use_rollups=True) -> dict
 
   Query#12: Find the section-name for which maximum number of articles written
 
   Input(s):
-    None
+    :param: use_rollups `bool` -- Answer from the rollup collection when it covers the dataset,
+    see `__rollups_ready__` -- defaults to True
 
   Output(s):
     :return: section `dict` -- The section-name for which maximum number of articles written
@@ -1303,7 +4404,10 @@ def most_section():
       }
   ]
 
-  cursor = db[__COLLECTION_NAME__].aggregate(query, allowDiskUse=True)
+  if use_rollups and __rollups_ready__(client):
+    cursor = __rollup_counts__(client, __SECTION_ROLLUP__, 'section_count', limit=1)
+  else:
+    cursor = __aggregate_groups__(db[__COLLECTION_NAME__], query)
 
   section = list(cursor) if cursor is not None else list()
 
@@ -1313,9 +4417,10 @@ def most_section():
 
 
 # Query#9. Find the number of original article from NYT (source)
-def count_original_articles():
+@__cached_query__
+def count_original_articles(use_rollups=True):
   '''
-  count_original_articles() -> int
+  count_original_articles(use_rollups=True) -> int
 
   Query#9. Find the number of original article from NYT (source)
 
@@ -1324,7 +4429,8 @@ def count_original_articles():
 
   Input(s):
 
-    None
+    :param: use_rollups `bool` -- Answer from the rollup collection when it covers the dataset,
+    see `__rollups_ready__` -- defaults to True
 
   Output(s):
 
@@ -1366,96 +4472,197 @@ def count_original_articles():
       }
   ]
 
-  cursor = db[__COLLECTION_NAME__].aggregate(query, allowDiskUse=True)
+  if use_rollups and __rollups_ready__(client):
+    cursor = __rollup_counts__(client, __SOURCE_ROLLUP__, 'orig_count', key='The New York Times')
+  else:
+    cursor = db[__COLLECTION_NAME__].aggregate(query, allowDiskUse=True)
 
   org_articles_count = list(cursor) if cursor is not None else 0
 
   return org_articles_count
 
 
-# Query#14: Find which month had highest number of articles written
-def highest_articles_month():
-  '''
-  highest_articles_month() -> (str, int)
+# The splits of the monthly article histogram, (rollup dimension, article field)
+__HISTOGRAM_SPLITS__ = OrderedDict([
+    ('document_type', (__DOCUMENT_TYPE_ROLLUP__, __DOCUMENT_TYPE__)),
+    ('section', (__SECTION_ROLLUP__, __SECTION_NAME__))
+])
 
-  Query#14: Find which month had highest number of articles written
 
-  Finds the month with the maximum article count and returns the date as mm/yyyy and the count
+# Query#14: The number of articles of every month
+@__cached_query__
+def monthly_article_histogram(split_by=None, use_rollups=True):
+  '''
+  monthly_article_histogram(split_by=None, use_rollups=True) -> list[dict]
+
+  Query#14: The number of articles published every month, bucketed on the derived `pub_year` and
+  `pub_month` fields, optionally split by document type or section.
 
   Input(s):
 
-    None
+    :param: split_by `str` -- `document_type` to count every document per document type, or
+    `section` to count the articles per section name -- defaults to None, the articles only
 
-  Output(s):
+    :param: use_rollups `bool` -- Answer from the rollup collection when it covers the dataset,
+    see `__rollups_ready__` -- defaults to True
 
-    :return: max_times `str` -- The date string in mm/yyyy format
+  Output(s):
 
-    :return: count `int` -- The count for the max articles
+    :return: histogram `list[dict]` -- One entry per month in chronological order, `year`,
+    `month` and `count`, and the `counts` per document type or section when split, eg:
+    `{"year": 2005, "month": 1, "count": 412, "counts": {"Business": 57, ...}}`
   '''
 
+  if split_by is not None and split_by not in __HISTOGRAM_SPLITS__:
+    raise ValueError('Unknown split {split_by}, use one of {splits}'.format(
+        split_by=split_by, splits=', '.join(__HISTOGRAM_SPLITS__)))
+
   client = get_client()
 
   db = client.get_database(__DATABASE_NAME__)
 
   '''
-  Sample mongo shell query:
+  Sample mongo shell query, split by section:
   db.archives.aggregate([{
     $match: {
         "document_type": "article"
     }
   }, {
     $group: {
-        _id: "$pub_date",
+        _id: {
+            year: "$pub_year",
+            month: "$pub_month",
+            key: "$section_name"
+        },
         pub_count: {
             $sum: 1
         }
     }
-  }, {
-    $sort: {
-        pub_count: -1
-    }
   }])
   '''
-  query = [
-      {
-          __MATCH__: {
-              __DOCUMENT_TYPE__: 'article'
-          }
-      },
-      {
-          __GROUP__: {
-              __ID_OP__: '${pub_date}'.format(
-                  pub_date=__PUB_DATE__),
-              'pub_count': {
-                  __SUM__: 1
-              }
-          }
-      },
-      {
-          __SORT__: {
-              'pub_count': -1
-          }
-      }
-  ]
 
-  cursor = db[__COLLECTION_NAME__].aggregate(query, allowDiskUse=True)
+  if split_by is None:
+    dimension, field = __ARTICLE_MONTH_ROLLUP__, None
+  else:
+    dimension, field = __HISTOGRAM_SPLITS__[split_by]
+
+  flag = 'document_type_rollups' if dimension == __DOCUMENT_TYPE_ROLLUP__ else 'rollups'
+
+  if use_rollups and __rollups_ready__(client, flag):
+    group_id = {
+        'year': '${year}'.format(year=__ROLLUP_YEAR__),
+        'month': '${month}'.format(month=__ROLLUP_MONTH__)
+    }
+
+    if field is not None:
+      group_id[__ROLLUP_KEY__] = '${key}'.format(key=__ROLLUP_KEY__)
+
+    query = [
+        {
+            __MATCH__: {
+                __ROLLUP_DIMENSION__: dimension
+            }
+        },
+        {
+            __GROUP__: {
+                __ID_OP__: group_id,
+                'pub_count': {
+                    __SUM__: '${count}'.format(count=__ROLLUP_COUNT__)
+                }
+            }
+        }
+    ]
+
+    cursor = __rollups__(client).aggregate(query, allowDiskUse=True)
+  else:
+    group_id = {
+        'year': '${pub_year}'.format(pub_year=__PUB_YEAR__),
+        'month': '${pub_month}'.format(pub_month=__PUB_MONTH__)
+    }
+
+    if field is not None:
+      group_id[__ROLLUP_KEY__] = '${field}'.format(field=field)
+
+    query = [
+        {
+            __GROUP__: {
+                __ID_OP__: group_id,
+                'pub_count': {
+                    __SUM__: 1
+                }
+            }
+        }
+    ]
+
+    if split_by != 'document_type':
+      query.insert(0, {__MATCH__: {__DOCUMENT_TYPE__: 'article'}})
+
+    cursor = db[__COLLECTION_NAME__].aggregate(query, allowDiskUse=True)
+
+  months = dict()
+
+  for bucket in cursor:
+    year, month = bucket[__ID__].get('year'), bucket[__ID__].get('month')
+
+    if year is None or month is None:
+      continue
+
+    entry = months.get((year, month))
+
+    if entry is None:
+      entry = months[(year, month)] = {'year': year, 'month': month, 'count': 0}
+
+      if field is not None:
+        entry['counts'] = dict()
+
+    entry['count'] += bucket['pub_count']
+
+    if field is not None:
+      key = bucket[__ID__].get(__ROLLUP_KEY__)
+      entry['counts'][key] = entry['counts'].get(key, 0) + bucket['pub_count']
+
+  return [months[year_month] for year_month in sorted(months)]
+
+
+# Query#14: Find which month had highest number of articles written
+@__cached_query__
+def highest_articles_month(use_rollups=True):
+  '''
+  highest_articles_month(use_rollups=True) -> (str, int)
+
+  Query#14: Find which month had highest number of articles written
+
+  Finds the month with the maximum article count and returns the date as mm/yyyy and the count,
+  the earliest month on ties. The months are read from `monthly_article_histogram`.
+
+  Input(s):
+
+    :param: use_rollups `bool` -- Answer from the rollup collection when it covers the dataset,
+    see `__rollups_ready__` -- defaults to True
 
-  max_times = list(cursor) if cursor is not None else list()
+  Output(s):
+
+    :return: max_times `str` -- The date string in mm/yyyy format
+
+    :return: count `int` -- The count for the max articles
+  '''
 
-  max_times = max_times[0] if len(max_times) > 0 else None
+  histogram = monthly_article_histogram(use_rollups=use_rollups)
 
-  if max_times is not None:
-    st = datetime.strptime(max_times[__ID__], '%Y-%m-%dT%H:%M:%SZ')
-    count = int(max_times['pub_count'])
-    max_times = '{month}/{year}'.format(month=st.month, year=st.year)
+  if len(histogram) == 0:
+    return None, 0
 
-  return max_times, count
+  # the histogram is chronological, so `max` keeps the earliest of the busiest months
+  busiest = max(histogram, key=lambda entry: entry['count'])
+
+  return '{month}/{year}'.format(month=busiest['month'], year=busiest['year']), busiest['count']
 
 
 # Query#15. Find 10 most popular article in the given timeframe
-def front_page_articles(begin_time, end_time):
+@__cached_query__
+def front_page_articles(begin_time, end_time, projection=__SUMMARY_PROFILE__):
   '''
-  front_page_articles(begin_time, end_time) -> list[dict]
+  front_page_articles(begin_time, end_time, projection='summary') -> list[dict]
 
   Query#15. Find 10 most popular article in the given timeframe
 
@@ -1467,6 +4674,9 @@ def front_page_articles(begin_time, end_time):
 
     :param: end_time `str` -- The end time range, a string in format 'yyyy-mm-dd'
 
+    :param: projection `str|dict|list[str]` -- The projection profile, `summary`, `byline` or
+    `full`, or the fields returned -- defaults to `summary`
+
   Output(s):
 
     :return: front_articles `list[dict]` -- The 10 articles from front page for the given time range
@@ -1482,15 +4692,15 @@ def front_page_articles(begin_time, end_time):
   // #15. Find 10 most popular article in the given timeframe
   db.archives.find({
     $and: [{
-        "pub_date": {
-            $gt: "2000-04-01"
+        "pub_datetime": {
+            $gte: ISODate("2000-04-01")
         }
     }, {
-        "pub_date": {
-            $lt: "2000-04-10"
+        "pub_datetime": {
+            $lt: ISODate("2000-04-10")
         }
     }, {
-        "print_page": "1"
+        "page": 1
     }, {
         "document_type": "article"
     }]
@@ -1499,17 +4709,17 @@ def front_page_articles(begin_time, end_time):
   query = {
       __AND__: [
           {
-              __PUB_DATE__: {
-                  __GT__: begin_time
+              __PUB_DATETIME__: {
+                  __GTEQ__: datetime.strptime(begin_time, __DATE_FORMAT__)
               }
           },
           {
-              __PUB_DATE__: {
-                  __LT__: end_time
+              __PUB_DATETIME__: {
+                  __LT__: datetime.strptime(end_time, __DATE_FORMAT__)
               }
           },
           {
-              __PRINT_PAGE__: "1"
+              __PAGE__: 1
           },
           {
               __DOCUMENT_TYPE__: "article"
@@ -1517,7 +4727,7 @@ def front_page_articles(begin_time, end_time):
       ]
   }
 
-  cursor = db[__COLLECTION_NAME__].find(query).limit(10)
+  cursor = db[__COLLECTION_NAME__].find(query, projection_for(projection)).limit(10)
 
   front_articles = list(cursor) if cursor is not None else list()
 
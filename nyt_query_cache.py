@@ -0,0 +1,264 @@
+# nyt_query_cache.py
+# -*- coding: utf-8 -*-
+
+
+'''
+Result cache of the NYT archiver queries.
+
+The archives only change when months are ingested, so the result of a query is cached per function
+and arguments until the next ingest. Every entry remembers the dataset generation it was computed
+on, a counter the ingest bumps (see `nyt_queries.dataset_generation`), and is dropped once the
+generation moved on. Entries are kept in memory, least recently used evicted first, and optionally
+on the local disk so other processes and restarts reuse them. Both tiers expire entries after a
+time to live.
+'''
+
+# python standard library imports
+from collections import OrderedDict
+from copy import deepcopy
+from hashlib import sha256
+from inspect import signature
+from json import dumps
+from os import listdir
+from os import makedirs
+from os import remove
+from os import replace
+from os.path import exists
+from os.path import join
+from tempfile import mkstemp
+from threading import Lock
+from time import time
+import pickle
+
+
+# Constants
+__MAX_ENTRIES__ = 256
+__TTL_SECONDS__ = 300.0
+__CACHE_FILE_FORMAT__ = '{key}.pickle'
+
+
+class QueryCache(object):
+  '''
+  QueryCache(max_entries=256, ttl=300.0, cache_dir=None)
+
+  The two tier (memory, disk) result cache of the queries.
+
+  Input(s):
+
+    :param: max_entries `int` -- The number of results kept in memory -- defaults to 256
+
+    :param: ttl `float` -- The seconds a result stays valid, None to keep it until the next
+    ingest -- defaults to 300
+
+    :param: cache_dir `str` -- The directory of the on-disk tier, None keeps the results in memory
+    only -- defaults to None
+  '''
+
+  def __init__(self, max_entries=__MAX_ENTRIES__, ttl=__TTL_SECONDS__, cache_dir=None):
+    self.max_entries = max_entries
+    self.ttl = ttl
+    self.cache_dir = cache_dir
+    self._entries = OrderedDict()
+    self._lock = Lock()
+    self._stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0,
+                   'invalidations': 0}
+
+    if cache_dir is not None:
+      makedirs(cache_dir, exist_ok=True)
+
+  def __count__(self, **increments):
+    with self._lock:
+      for key, increment in increments.items():
+        self._stats[key] += increment
+
+  def key(self, function, args, kwargs, namespace=None):
+    '''
+    key(function, args, kwargs, namespace=None) -> str
+
+    The cache key of a call, the same for every way of passing the same arguments (positional,
+    keyword or defaulted).
+    '''
+
+    arguments = signature(function).bind(*args, **kwargs)
+    arguments.apply_defaults()
+
+    normalized = dumps([function.__module__, function.__name__, namespace,
+                        sorted(arguments.arguments.items())], sort_keys=True, default=repr)
+
+    return sha256(normalized.encode('utf-8')).hexdigest()
+
+  def __valid__(self, entry, generation):
+    '''
+    __valid__(entry, generation) -> bool
+
+    Drops the entries of an older generation or past their time to live.
+    '''
+
+    entry_generation, stored_at, _ = entry
+
+    if entry_generation != generation:
+      self.__count__(invalidations=1)
+      return False
+
+    if self.ttl is not None and time() - stored_at > self.ttl:
+      self.__count__(expirations=1)
+      return False
+
+    return True
+
+  def __path__(self, key):
+    return join(self.cache_dir, __CACHE_FILE_FORMAT__.format(key=key))
+
+  def __read_disk__(self, key):
+    path = self.__path__(key)
+
+    if not exists(path):
+      return None
+
+    try:
+      with open(path, 'rb') as cache_file:
+        return pickle.load(cache_file)
+    except (OSError, EOFError, pickle.UnpicklingError):
+      return None
+
+  def __discard__(self, key):
+    try:
+      remove(self.__path__(key))
+    except FileNotFoundError:
+      pass
+
+  def __write_disk__(self, key, entry):
+    descriptor, temp_path = mkstemp(dir=self.cache_dir, suffix='.part')
+
+    try:
+      with open(descriptor, 'wb') as cache_file:
+        pickle.dump(entry, cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+      replace(temp_path, self.__path__(key))
+    except Exception:
+      remove(temp_path)
+      raise
+
+  def __remember__(self, key, entry):
+    with self._lock:
+      self._entries[key] = entry
+      self._entries.move_to_end(key)
+
+      while len(self._entries) > self.max_entries:
+        self._entries.popitem(last=False)
+        self._stats['evictions'] += 1
+
+  def get(self, key, generation):
+    '''
+    get(key, generation) -> (bool, object)
+
+    Looks the key up in memory, then on disk.
+
+    Output(s):
+
+      :return: found `bool` -- Whether a valid result was cached
+
+      :return: result `object` -- A copy of the cached result, None when not found
+    '''
+
+    with self._lock:
+      entry = self._entries.get(key)
+
+      if entry is not None:
+        self._entries.move_to_end(key)
+
+    if entry is not None:
+      if self.__valid__(entry, generation):
+        self.__count__(hits=1)
+        return True, deepcopy(entry[2])
+
+      with self._lock:
+        self._entries.pop(key, None)
+
+    if self.cache_dir is not None:
+      entry = self.__read_disk__(key)
+
+      if entry is not None:
+        if self.__valid__(entry, generation):
+          self.__remember__(key, entry)
+          self.__count__(hits=1, disk_hits=1)
+          return True, deepcopy(entry[2])
+
+        self.__discard__(key)
+
+    self.__count__(misses=1)
+
+    return False, None
+
+  def put(self, key, generation, result):
+    '''
+    put(key, generation, result)
+
+    Caches the result computed on the dataset generation.
+    '''
+
+    entry = (generation, time(), deepcopy(result))
+
+    self.__remember__(key, entry)
+
+    if self.cache_dir is not None:
+      self.__write_disk__(key, entry)
+
+  def call(self, function, args, kwargs, generation, namespace=None):
+    '''
+    call(function, args, kwargs, generation, namespace=None) -> object
+
+    Returns the cached result of `function(*args, **kwargs)` for the dataset generation, calling
+    the function on a miss.
+    '''
+
+    key = self.key(function, args, kwargs, namespace=namespace)
+
+    found, result = self.get(key, generation)
+
+    if found:
+      return result
+
+    result = function(*args, **kwargs)
+
+    self.put(key, generation, result)
+
+    return result
+
+  def clear(self):
+    '''
+    clear()
+
+    Drops every cached result, in memory and on disk.
+    '''
+
+    with self._lock:
+      self._entries.clear()
+
+    if self.cache_dir is not None:
+      for key in list(self.__disk_keys__()):
+        self.__discard__(key)
+
+  def __disk_keys__(self):
+    suffix = __CACHE_FILE_FORMAT__.format(key='')
+
+    for name in listdir(self.cache_dir):
+      if name.endswith(suffix):
+        yield name[:-len(suffix)]
+
+  def stats(self):
+    '''
+    stats() -> dict
+
+    The cache metrics since the cache was created: `hits` (`disk_hits` of them from the disk),
+    `misses`, `evictions` (LRU), `expirations` (TTL), `invalidations` (ingest), the `entries` in
+    memory and the `hit_ratio`.
+    '''
+
+    with self._lock:
+      stats = dict(self._stats)
+      stats['entries'] = len(self._entries)
+
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_ratio'] = stats['hits'] / lookups if lookups > 0 else 0.0
+
+    return stats
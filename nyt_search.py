@@ -0,0 +1,314 @@
+# nyt_search.py
+# -*- coding: utf-8 -*-
+
+
+'''
+In-process BM25 search over the NYT articles, for offline use.
+
+`BM25Index` is an inverted index of the `headline.main`, `abstract`, `snippet` and
+`lead_paragraph` fields, weighted like the `text_search` index of the archives collection
+(`nyt_queries.__TEXT_WEIGHTS__`), that ranks the articles with BM25F. It can be built from the
+archives collection (`index_collection`) or straight from the cached archives API responses without
+a mongodb server (`index_archives_cache`), and saved to disk to be searched later.
+'''
+
+# python standard library imports
+from collections import defaultdict
+from heapq import nlargest
+from json import dump
+from json import load
+from logging import warning
+from math import log
+from time import perf_counter
+import gzip
+import re
+
+
+# NYT Archiver imports
+import nyt_queries
+from nyt_queries import get_client
+from nyt_queries import iter_archive_documents
+from nyt_queries import archive_months
+from nyt_queries import __TEXT_WEIGHTS__
+from nyt_queries import __SEARCH_LIMIT__
+from nyt_queries import __SCORE__
+from nyt_queries import __ID__
+from nyt_queries import __DOCUMENT_TYPE__
+from nyt_queries import __HEADLINE__
+from nyt_queries import __HEADLINE_MAIN__
+from nyt_queries import __PUB_DATE__
+from nyt_cache import ArchivesCache
+
+
+# Constants
+__K1__ = 1.2
+__B__ = 0.75
+__TOKEN_PATTERN__ = re.compile(r'[a-z0-9]+')
+__STOP_WORDS__ = frozenset([
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'but', 'by', 'for', 'from', 'has', 'have', 'he',
+    'her', 'his', 'in', 'is', 'it', 'its', 'of', 'on', 'or', 'she', 'that', 'the', 'their', 'they',
+    'this', 'to', 'was', 'were', 'which', 'who', 'will', 'with'
+])
+__FIND_BATCH_SIZE__ = 1000
+
+
+# splitting a text into search terms
+def tokenize(text):
+  '''
+  tokenize(text) -> list[str]
+
+  The lower case words and numbers of the text, without the stop words.
+  '''
+
+  if not isinstance(text, str):
+    return list()
+
+  return [token for token in __TOKEN_PATTERN__.findall(text.lower())
+          if token not in __STOP_WORDS__]
+
+
+# the value of a dotted field path, eg: `headline.main`
+def __field__(document, path):
+  '''
+  __field__(document, path) -> object
+  '''
+
+  value = document
+
+  for name in path.split('.'):
+    value = value.get(name) if isinstance(value, dict) else None
+
+  return value
+
+
+class BM25Index(object):
+  '''
+  BM25Index(weights=None, k1=1.2, b=0.75)
+
+  Inverted index ranking the articles with BM25F: the term frequencies and the lengths of every
+  field are multiplied by the weight of the field before the usual BM25 saturation.
+
+  Input(s):
+
+    :param: weights `dict` -- The weight of every indexed field -- defaults to the weights of the
+    `text_search` index
+
+    :param: k1 `float` -- The term frequency saturation -- defaults to 1.2
+
+    :param: b `float` -- The length normalization -- defaults to 0.75
+  '''
+
+  def __init__(self, weights=None, k1=__K1__, b=__B__):
+    self.weights = dict(__TEXT_WEIGHTS__ if weights is None else weights)
+    self.k1 = k1
+    self.b = b
+    self.postings = defaultdict(dict)
+    self.ids = list()
+    self.headlines = list()
+    self.pub_dates = list()
+    self.lengths = list()
+    self.total_length = 0.0
+
+  def __len__(self):
+    return len(self.ids)
+
+  def add(self, document):
+    '''
+    add(document)
+
+    Indexes the article. Only `_id`, the headline and `pub_date` are kept next to the terms so the
+    results can be shown without the archives collection.
+    '''
+
+    position = len(self.ids)
+    frequencies = defaultdict(float)
+    length = 0.0
+
+    for field, weight in self.weights.items():
+      tokens = tokenize(__field__(document, field))
+      length += weight * len(tokens)
+
+      for token in tokens:
+        frequencies[token] += weight
+
+    for token, frequency in frequencies.items():
+      self.postings[token][position] = frequency
+
+    self.ids.append(document.get(__ID__))
+    self.headlines.append(__field__(document, '{headline}.{main}'.format(
+        headline=__HEADLINE__, main=__HEADLINE_MAIN__)))
+    self.pub_dates.append(document.get(__PUB_DATE__))
+    self.lengths.append(length)
+    self.total_length += length
+
+  def search(self, query, limit=__SEARCH_LIMIT__):
+    '''
+    search(query, limit=20) -> list[dict]
+
+    Ranks the indexed articles against the words of the query.
+
+    Input(s):
+
+      :param: query `str` -- The words searched for
+
+      :param: limit `int` -- The maximum number of articles returned -- defaults to 20
+
+    Output(s):
+
+      :return: articles `list[dict]` -- `_id`, `headline`, `pub_date` and `score` of the best
+      matching articles, best match first
+    '''
+
+    if len(self.ids) == 0:
+      return list()
+
+    document_count = len(self.ids)
+    average_length = self.total_length / document_count or 1.0
+    scores = defaultdict(float)
+
+    for token in set(tokenize(query)):
+      postings = self.postings.get(token)
+
+      if not postings:
+        continue
+
+      idf = log(1.0 + (document_count - len(postings) + 0.5) / (len(postings) + 0.5))
+
+      for position, frequency in postings.items():
+        norm = self.k1 * (1.0 - self.b + self.b * self.lengths[position] / average_length)
+        scores[position] += idf * frequency * (self.k1 + 1.0) / (frequency + norm)
+
+    best = nlargest(limit, scores.items(), key=lambda item: item[1])
+
+    return [{
+        __ID__: self.ids[position],
+        __HEADLINE__: self.headlines[position],
+        __PUB_DATE__: self.pub_dates[position],
+        __SCORE__: score
+    } for position, score in best]
+
+  def save(self, path):
+    '''
+    save(path)
+
+    Writes the index to a gzip compressed JSON file.
+    '''
+
+    with gzip.open(path, 'wt', encoding='utf-8') as index_file:
+      dump({
+          'weights': self.weights,
+          'k1': self.k1,
+          'b': self.b,
+          'ids': self.ids,
+          'headlines': self.headlines,
+          'pub_dates': self.pub_dates,
+          'lengths': self.lengths,
+          'postings': {token: list(postings.items()) for token, postings in self.postings.items()}
+      }, index_file)
+
+  @classmethod
+  def load(cls, path):
+    '''
+    load(path) -> BM25Index
+
+    Reads an index written by `save`.
+    '''
+
+    with gzip.open(path, 'rt', encoding='utf-8') as index_file:
+      saved = load(index_file)
+
+    index = cls(weights=saved['weights'], k1=saved['k1'], b=saved['b'])
+    index.ids = saved['ids']
+    index.headlines = saved['headlines']
+    index.pub_dates = saved['pub_dates']
+    index.lengths = saved['lengths']
+    index.total_length = sum(index.lengths)
+
+    for token, postings in saved['postings'].items():
+      index.postings[token] = dict((position, frequency) for position, frequency in postings)
+
+    return index
+
+  @classmethod
+  def build(cls, documents, **kwargs):
+    '''
+    build(documents, **kwargs) -> BM25Index
+
+    Indexes the articles, the `document_type` `article` ones only like `search_in_articles`.
+    '''
+
+    index = cls(**kwargs)
+
+    started_at = perf_counter()
+
+    for document in documents:
+      if document.get(__DOCUMENT_TYPE__) == 'article':
+        index.add(document)
+
+    warning('Indexed {count} articles, {terms} terms in {seconds:.2f}s'.format(
+        count=len(index), terms=len(index.postings), seconds=perf_counter() - started_at))
+
+    return index
+
+
+# Building the index from the archives collection
+def index_collection(client=None, **kwargs):
+  '''
+  index_collection(client=None, **kwargs) -> BM25Index
+
+  Builds the BM25 index of the articles in the archives collection, reading only the indexed
+  fields.
+
+  Input(s):
+
+    :param: client `MongoClient` -- The client to use -- defaults to the shared client
+
+    :param: kwargs `dict` -- The `BM25Index` options
+  '''
+
+  client = get_client() if client is None else client
+
+  collection = client.get_database(nyt_queries.__DATABASE_NAME__)[nyt_queries.__COLLECTION_NAME__]
+
+  weights = kwargs.get('weights') or __TEXT_WEIGHTS__
+
+  projection = dict((field, True) for field in list(weights) + [__DOCUMENT_TYPE__, __PUB_DATE__])
+
+  cursor = collection.find({__DOCUMENT_TYPE__: 'article'}, projection,
+                           batch_size=__FIND_BATCH_SIZE__)
+
+  return BM25Index.build(cursor, **kwargs)
+
+
+# Building the index from the cached archives API responses, without mongodb
+def index_archives_cache(cache_dir, months=None, **kwargs):
+  '''
+  index_archives_cache(cache_dir, months=None, **kwargs) -> BM25Index
+
+  Builds the BM25 index straight from the archives cache (see `nyt_queries.set_archives_cache`),
+  for searching the archives offline. Months missing from the cache are skipped.
+
+  Input(s):
+
+    :param: cache_dir `str` -- The directory of the archives cache
+
+    :param: months `list[(int, int)]` -- The (year, month) pairs indexed -- defaults to the months
+    of `archive_months()`
+
+    :param: kwargs `dict` -- The `BM25Index` options
+  '''
+
+  cache = ArchivesCache(cache_dir)
+
+  def documents():
+    for year, month in (archive_months() if months is None else months):
+      cached_response = cache.open(year, month)
+
+      if cached_response is None:
+        continue
+
+      with cached_response:
+        for document in iter_archive_documents(cached_response):
+          yield document
+
+  return BM25Index.build(documents(), **kwargs)
@@ -0,0 +1,457 @@
+# nyt_sketches.py
+# -*- coding: utf-8 -*-
+
+
+'''
+Mergeable sketches of the NYT archives, for approximate answers over any range of months.
+
+`CountMinSketch` estimates the count of any key with a bounded over-estimate, `SpaceSaving` keeps
+the heaviest keys with the bounds of their counts, and `HeavyHitters` pairs them: one of them is
+built per month and dimension during the ingest (see `nyt_queries.heavy_hitters`) and the sketches
+of any range of months are merged on demand. `HyperLogLog` estimates the number of distinct keys
+the same way (see `nyt_queries.distinct_count`).
+
+The sketches only hold plain values so they can be stored in mongodb as they are: keys are strings
+and the counters are packed little endian into bytes.
+'''
+
+# python standard library imports
+from array import array
+from hashlib import blake2b
+from math import e
+from math import exp
+from math import log
+from math import sqrt
+import sys
+
+
+# Constants
+__CM_WIDTH__ = 2048
+__CM_DEPTH__ = 4
+__SS_CAPACITY__ = 1000
+__HLL_PRECISION__ = 12
+__COUNTER_TYPE__ = 'I'
+__HASH_MASK__ = (1 << 64) - 1
+
+
+# packing the counters
+def __pack__(counters):
+  '''
+  __pack__(counters) -> bytes
+
+  The counters as little endian bytes, whatever the byte order of the machine.
+  '''
+
+  if sys.byteorder == 'big':
+    counters = array(counters.typecode, counters)
+    counters.byteswap()
+
+  return counters.tobytes()
+
+
+def __unpack__(data, typecode=__COUNTER_TYPE__):
+  '''
+  __unpack__(data, typecode='I') -> array
+  '''
+
+  counters = array(typecode)
+  counters.frombytes(data)
+
+  if sys.byteorder == 'big':
+    counters.byteswap()
+
+  return counters
+
+
+class CountMinSketch(object):
+  '''
+  CountMinSketch(width=2048, depth=4)
+
+  Count-Min sketch of the key counts. An estimate is never below the true count, and exceeds it by
+  at most `e / width` of the total count with a probability of `1 - exp(-depth)`.
+
+  Input(s):
+
+    :param: width `int` -- The counters per row -- defaults to 2048
+
+    :param: depth `int` -- The rows, one hash function each -- defaults to 4
+  '''
+
+  def __init__(self, width=__CM_WIDTH__, depth=__CM_DEPTH__, counters=None, total=0):
+    self.width = width
+    self.depth = depth
+    self.counters = array(__COUNTER_TYPE__, bytes(4 * width * depth)) if counters is None \
+        else counters
+    self.total = total
+
+  def __cells__(self, key):
+    '''
+    __cells__(key) -> generator[int]
+
+    The counter of the key in every row, from two 64 bit hashes (Kirsch-Mitzenmacher).
+    '''
+
+    digest = blake2b(key.encode('utf-8'), digest_size=16).digest()
+    first = int.from_bytes(digest[:8], 'little')
+    second = int.from_bytes(digest[8:], 'little') | 1
+
+    for row in range(self.depth):
+      yield row * self.width + ((first + row * second) & __HASH_MASK__) % self.width
+
+  def add(self, key, count=1):
+    '''
+    add(key, count=1)
+    '''
+
+    for cell in self.__cells__(key):
+      self.counters[cell] += count
+
+    self.total += count
+
+  def estimate(self, key):
+    '''
+    estimate(key) -> int
+
+    The estimated count of the key, never below its true count.
+    '''
+
+    return min(self.counters[cell] for cell in self.__cells__(key))
+
+  def error_bound(self):
+    '''
+    error_bound() -> float
+
+    The most an estimate exceeds the true count by, with a probability of `confidence()`.
+    '''
+
+    return e / self.width * self.total
+
+  def confidence(self):
+    '''
+    confidence() -> float
+    '''
+
+    return 1.0 - exp(-self.depth)
+
+  def merge(self, other):
+    '''
+    merge(other) -> CountMinSketch
+
+    The sketch of both key streams. Both sketches must have the same dimensions.
+    '''
+
+    if (self.width, self.depth) != (other.width, other.depth):
+      raise ValueError('Can not merge Count-Min sketches of different dimensions')
+
+    counters = array(__COUNTER_TYPE__, map(sum, zip(self.counters, other.counters)))
+
+    return CountMinSketch(self.width, self.depth, counters=counters,
+                          total=self.total + other.total)
+
+  def to_document(self):
+    '''
+    to_document() -> dict
+    '''
+
+    return {'width': self.width, 'depth': self.depth, 'total': self.total,
+            'counters': __pack__(self.counters)}
+
+  @classmethod
+  def from_document(cls, document):
+    '''
+    from_document(document) -> CountMinSketch
+    '''
+
+    return cls(document['width'], document['depth'], counters=__unpack__(document['counters']),
+               total=document['total'])
+
+
+class SpaceSaving(object):
+  '''
+  SpaceSaving(capacity=1000)
+
+  Space-Saving summary of the heaviest keys. Every monitored key has an upper bound `count` and an
+  `error`, its true count being between `count - error` and `count`. A key that is not monitored
+  occurred at most `floor` times.
+
+  Input(s):
+
+    :param: capacity `int` -- The number of keys monitored -- defaults to 1000
+  '''
+
+  def __init__(self, capacity=__SS_CAPACITY__, counters=None, floor=0):
+    self.capacity = capacity
+    self.counters = dict() if counters is None else counters
+    self.floor = floor
+
+  def add(self, key, count=1):
+    '''
+    add(key, count=1)
+
+    Counts the key, replacing the least counted key when the summary is full.
+    '''
+
+    counter = self.counters.get(key)
+
+    if counter is not None:
+      counter[0] += count
+      return
+
+    if len(self.counters) >= self.capacity:
+      evicted = min(self.counters, key=lambda monitored: self.counters[monitored][0])
+      self.floor = max(self.floor, self.counters.pop(evicted)[0])
+
+    self.counters[key] = [self.floor + count, self.floor]
+
+  @classmethod
+  def from_counts(cls, counts, capacity=__SS_CAPACITY__):
+    '''
+    from_counts(counts, capacity=1000) -> SpaceSaving
+
+    The summary of exact `{key: count}` counts, eg: the counts of an ingested month. The heaviest
+    keys are kept without error.
+    '''
+
+    ranked = sorted(counts.items(), key=lambda item: item[1], reverse=True)
+
+    return cls(capacity,
+               counters=dict((key, [count, 0]) for key, count in ranked[:capacity]),
+               floor=ranked[capacity][1] if len(ranked) > capacity else 0)
+
+  def merge(self, other):
+    '''
+    merge(other) -> SpaceSaving
+
+    The summary of both key streams, with the capacity of this summary. A key missing from one of
+    the summaries is counted with its floor, as count and as error.
+    '''
+
+    counters = dict()
+
+    for key in set(self.counters) | set(other.counters):
+      count, error = self.counters.get(key, (self.floor, self.floor))
+      other_count, other_error = other.counters.get(key, (other.floor, other.floor))
+      counters[key] = [count + other_count, error + other_error]
+
+    ranked = sorted(counters, key=lambda key: counters[key][0], reverse=True)
+
+    floor = self.floor + other.floor
+
+    if len(ranked) > self.capacity:
+      floor = max(floor, counters[ranked[self.capacity]][0])
+
+    return SpaceSaving(self.capacity,
+                       counters=dict((key, counters[key]) for key in ranked[:self.capacity]),
+                       floor=floor)
+
+  def top(self, k):
+    '''
+    top(k) -> list[(str, int, int)]
+
+    The k heaviest keys with their count and error, heaviest first.
+    '''
+
+    ranked = sorted(self.counters.items(), key=lambda item: (-item[1][0], item[0]))
+
+    return [(key, count, error) for key, (count, error) in ranked[:k]]
+
+  def to_document(self):
+    '''
+    to_document() -> dict
+    '''
+
+    return {'capacity': self.capacity, 'floor': self.floor,
+            'counters': [[key, count, error] for key, (count, error) in self.counters.items()]}
+
+  @classmethod
+  def from_document(cls, document):
+    '''
+    from_document(document) -> SpaceSaving
+    '''
+
+    return cls(document['capacity'],
+               counters=dict((key, [count, error]) for key, count, error in document['counters']),
+               floor=document['floor'])
+
+
+class HeavyHitters(object):
+  '''
+  HeavyHitters(width=2048, depth=4, capacity=1000)
+
+  The Count-Min sketch and the Space-Saving summary of the same key stream. The Space-Saving
+  summary finds the heaviest keys, and the Count-Min sketch tightens the upper bound of their
+  counts.
+  '''
+
+  def __init__(self, width=__CM_WIDTH__, depth=__CM_DEPTH__, capacity=__SS_CAPACITY__,
+               count_min=None, space_saving=None):
+    self.count_min = CountMinSketch(width, depth) if count_min is None else count_min
+    self.space_saving = SpaceSaving(capacity) if space_saving is None else space_saving
+
+  @property
+  def total(self):
+    return self.count_min.total
+
+  def add(self, key, count=1):
+    '''
+    add(key, count=1)
+    '''
+
+    self.count_min.add(key, count)
+    self.space_saving.add(key, count)
+
+  @classmethod
+  def from_counts(cls, counts, width=__CM_WIDTH__, depth=__CM_DEPTH__, capacity=__SS_CAPACITY__):
+    '''
+    from_counts(counts, width=2048, depth=4, capacity=1000) -> HeavyHitters
+
+    The sketches of exact `{key: count}` counts.
+    '''
+
+    count_min = CountMinSketch(width, depth)
+
+    for key, count in counts.items():
+      count_min.add(key, count)
+
+    return cls(count_min=count_min, space_saving=SpaceSaving.from_counts(counts, capacity))
+
+  def merge(self, other):
+    '''
+    merge(other) -> HeavyHitters
+    '''
+
+    return HeavyHitters(count_min=self.count_min.merge(other.count_min),
+                        space_saving=self.space_saving.merge(other.space_saving))
+
+  def top(self, k):
+    '''
+    top(k) -> list[dict]
+
+    The k heaviest keys, heaviest first.
+
+    Output(s):
+
+      :return: heavy_hitters `list[dict]` -- `key`, `count` (the upper bound of its count), `lower`
+      (the lower bound) and `error` (`count - lower`)
+    '''
+
+    heavy_hitters = list()
+
+    for key, count, error in self.space_saving.top(k):
+      upper = min(count, self.count_min.estimate(key))
+      lower = min(count - error, upper)
+      heavy_hitters.append({'key': key, 'count': upper, 'lower': lower, 'error': upper - lower})
+
+    return sorted(heavy_hitters, key=lambda heavy_hitter: -heavy_hitter['count'])
+
+  def to_document(self):
+    '''
+    to_document() -> dict
+    '''
+
+    return {'count_min': self.count_min.to_document(),
+            'space_saving': self.space_saving.to_document()}
+
+  @classmethod
+  def from_document(cls, document):
+    '''
+    from_document(document) -> HeavyHitters
+    '''
+
+    return cls(count_min=CountMinSketch.from_document(document['count_min']),
+               space_saving=SpaceSaving.from_document(document['space_saving']))
+
+
+class HyperLogLog(object):
+  '''
+  HyperLogLog(precision=12)
+
+  HyperLogLog estimate of the number of distinct keys, in `2 ** precision` one byte registers. The
+  relative standard error of the estimate is `1.04 / sqrt(2 ** precision)`, 1.6% for the default
+  4096 registers, whatever the number of keys, and merging the registers of several sketches gives
+  the estimate of their union.
+
+  Input(s):
+
+    :param: precision `int` -- The number of hash bits picking the register, 4 to 16 -- defaults
+    to 12
+  '''
+
+  def __init__(self, precision=__HLL_PRECISION__, registers=None):
+    if not 4 <= precision <= 16:
+      raise ValueError('The HyperLogLog precision must be between 4 and 16')
+
+    self.precision = precision
+    self.registers = bytearray(1 << precision) if registers is None else bytearray(registers)
+
+  def add(self, key):
+    '''
+    add(key)
+    '''
+
+    hashed = int.from_bytes(blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little')
+
+    register = hashed >> (64 - self.precision)
+    remaining = hashed & ((1 << (64 - self.precision)) - 1)
+
+    # the position of the first 1 bit of the remaining bits
+    rank = 64 - self.precision - remaining.bit_length() + 1
+
+    if rank > self.registers[register]:
+      self.registers[register] = rank
+
+  def count(self):
+    '''
+    count() -> int
+
+    The estimated number of distinct keys added.
+    '''
+
+    size = len(self.registers)
+    alpha = 0.7213 / (1.0 + 1.079 / size)
+
+    estimate = alpha * size * size / sum(2.0 ** -register for register in self.registers)
+
+    empty = self.registers.count(0)
+
+    # linear counting is more accurate while most of the registers are empty
+    if estimate <= 2.5 * size and empty > 0:
+      estimate = size * log(size / float(empty))
+
+    return int(round(estimate))
+
+  def relative_error(self):
+    '''
+    relative_error() -> float
+
+    The relative standard error of `count()`.
+    '''
+
+    return 1.04 / sqrt(len(self.registers))
+
+  def merge(self, other):
+    '''
+    merge(other) -> HyperLogLog
+
+    The sketch of the union of both key sets. Both sketches must have the same precision.
+    '''
+
+    if self.precision != other.precision:
+      raise ValueError('Can not merge HyperLogLog sketches of different precisions')
+
+    return HyperLogLog(self.precision, registers=bytes(map(max, self.registers, other.registers)))
+
+  def to_document(self):
+    '''
+    to_document() -> dict
+    '''
+
+    return {'precision': self.precision, 'registers': bytes(self.registers)}
+
+  @classmethod
+  def from_document(cls, document):
+    '''
+    from_document(document) -> HyperLogLog
+    '''
+
+    return cls(document['precision'], registers=document['registers'])
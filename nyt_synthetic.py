@@ -0,0 +1,290 @@
+# nyt_synthetic.py
+# -*- coding: utf-8 -*-
+
+
+'''
+Deterministic synthetic NYT archives.
+
+Generates articles shaped like the archives API documents (see the sample document of
+`nyt_archiver`), with skewed keyword, reporter, section and page distributions like the real
+archives: a few keywords, reporters and sections account for most of the articles. A month is
+generated from its (seed, year, month) alone, so any month can be generated again, in any order or
+process, and always yields the same articles.
+'''
+
+# python standard library imports
+from calendar import monthrange
+from hashlib import sha256
+from itertools import accumulate
+from random import Random
+
+
+# NYT Archiver imports
+from nyt_queries import archive_months
+
+
+# Constants
+__DEFAULT_SEED__ = 185
+__ZIPF_EXPONENT__ = 1.1
+__KEYWORD_COUNT__ = 2000
+__REPORTER_COUNT__ = 800
+__VOCABULARY_COUNT__ = 5000
+
+__SECTIONS__ = [('U.S.', 18), ('World', 14), ('New York and Region', 12), ('Business', 12),
+                ('Sports', 10), ('Arts', 9), ('Opinion', 8), ('Style', 5), ('Technology', 4),
+                ('Science', 3), ('Health', 3), ('Travel', 2)]
+__TYPES_OF_MATERIAL__ = [('News', 70), ('Review', 8), ('Op-Ed', 6), ('Editorial', 4),
+                         ('Letter', 5), ('Obituary', 3), ('Brief', 4)]
+__DOCUMENT_TYPES__ = [('article', 86), ('blogpost', 10), ('multimedia', 4)]
+__SOURCES__ = [('The New York Times', 88), ('AP', 7), ('Reuters', 4),
+               ('International Herald Tribune', 1)]
+__KEYWORD_NAMES__ = [('subject', 50), ('persons', 18), ('organizations', 17), ('glocations', 15)]
+
+__FIRST_NAMES__ = ['John', 'Mary', 'David', 'Sarah', 'Michael', 'Elizabeth', 'James', 'Jennifer',
+                   'Robert', 'Linda', 'William', 'Susan', 'Richard', 'Karen', 'Thomas', 'Nancy',
+                   'Charles', 'Lisa', 'Daniel', 'Margaret', 'Matthew', 'Laura', 'Anthony', 'Julie']
+__MIDDLE_NAMES__ = [None, None, None, 'A.', 'B.', 'C.', 'D.', 'E.', 'J.', 'L.', 'M.', 'R.']
+__LAST_NAMES__ = ['SMITH', 'JOHNSON', 'WILLIAMS', 'BROWN', 'JONES', 'GARCIA', 'MILLER', 'DAVIS',
+                  'RODRIGUEZ', 'MARTINEZ', 'WILSON', 'ANDERSON', 'TAYLOR', 'THOMAS', 'MOORE',
+                  'JACKSON', 'MARTIN', 'LEE', 'THOMPSON', 'WHITE', 'HARRIS', 'CLARK', 'LEWIS',
+                  'ROBINSON', 'WALKER', 'YOUNG', 'ALLEN', 'KING', 'WRIGHT', 'SCOTT', 'GREEN']
+
+# Values of the sample document and of the sample query arguments, kept among the most frequent
+__SAMPLE_REPORTER__ = {'firstname': 'Constance', 'middlename': 'L.', 'lastname': 'HAYS'}
+__SAMPLE_KEYWORDS__ = [('organizations', 'MATTEL INC'), ('subject', 'DOLLS'), ('subject', 'TOYS'),
+                       ('subject', 'BARBIE (DOLL)')]
+__SAMPLE_PHRASE__ = 'ever mindful of the need'
+
+__SYLLABLES__ = ['ba', 'co', 'di', 'fe', 'ga', 'hi', 'jo', 'ka', 'lu', 'ma', 'ne', 'po', 'ra',
+                 'si', 'te', 'vo', 'wa', 'ye', 'zu', 'ter', 'son', 'ment', 'tion', 'ing']
+
+
+# cumulative Zipf weights of `count` ranked values
+def __zipf_weights__(count, exponent=__ZIPF_EXPONENT__):
+  '''
+  __zipf_weights__(count, exponent) -> list[float]
+  '''
+
+  return list(accumulate(1.0 / (rank ** exponent) for rank in range(1, count + 1)))
+
+
+# cumulative weights of (value, weight) pairs
+def __cumulative__(weighted):
+  '''
+  __cumulative__(weighted) -> (list, list[float])
+  '''
+
+  return [value for value, _ in weighted], list(accumulate(weight for _, weight in weighted))
+
+
+class __Vocabulary__(object):
+  '''
+  __Vocabulary__(seed)
+
+  The keywords, reporters and words the synthetic articles are drawn from, the same for every month
+  of a seed. The sample document values come first so that they are the most frequent ones.
+  '''
+
+  def __init__(self, seed):
+    rng = Random('vocabulary-{seed}'.format(seed=seed))
+
+    self.words = __SAMPLE_PHRASE__.split(' ')
+    self.words += [''.join(rng.choice(__SYLLABLES__) for _ in range(rng.randint(1, 4)))
+                   for _ in range(__VOCABULARY_COUNT__ - len(self.words))]
+    self.word_weights = __zipf_weights__(len(self.words))
+
+    names, name_weights = __cumulative__(__KEYWORD_NAMES__)
+
+    self.keywords = [{'name': name, 'value': value} for name, value in __SAMPLE_KEYWORDS__] + [{
+        'name': rng.choices(names, cum_weights=name_weights)[0],
+        'value': ' '.join(rng.choice(self.words[:500]) for _ in range(rng.randint(1, 3))).upper()
+    } for _ in range(__KEYWORD_COUNT__ - len(__SAMPLE_KEYWORDS__))]
+    self.keyword_weights = __zipf_weights__(len(self.keywords))
+
+    self.reporters = [dict(__SAMPLE_REPORTER__)] + [{
+        'firstname': rng.choice(__FIRST_NAMES__),
+        'middlename': rng.choice(__MIDDLE_NAMES__),
+        'lastname': rng.choice(__LAST_NAMES__)
+    } for _ in range(__REPORTER_COUNT__ - 1)]
+    self.reporter_weights = __zipf_weights__(len(self.reporters))
+
+  def text(self, rng, word_count):
+    return ' '.join(rng.choices(self.words, cum_weights=self.word_weights, k=word_count))
+
+
+__VOCABULARIES__ = dict()
+
+__SECTION_VALUES__, __SECTION_WEIGHTS__ = __cumulative__(__SECTIONS__)
+__MATERIAL_VALUES__, __MATERIAL_WEIGHTS__ = __cumulative__(__TYPES_OF_MATERIAL__)
+__DOCUMENT_TYPE_VALUES__, __DOCUMENT_TYPE_WEIGHTS__ = __cumulative__(__DOCUMENT_TYPES__)
+__SOURCE_VALUES__, __SOURCE_WEIGHTS__ = __cumulative__(__SOURCES__)
+
+
+def __vocabulary__(seed):
+  if seed not in __VOCABULARIES__:
+    __VOCABULARIES__[seed] = __Vocabulary__(seed)
+
+  return __VOCABULARIES__[seed]
+
+
+# the printed page of an article, mostly the first pages of the sections
+def __print_page__(rng):
+  '''
+  __print_page__(rng) -> str
+  '''
+
+  roll = rng.random()
+
+  if roll < 0.08:
+    return ''
+  if roll < 0.2:
+    return '1'
+  if roll < 0.3:
+    return '{section}{page}'.format(section=rng.choice('ABCDE'), page=rng.randint(1, 12))
+
+  return str(min(int(rng.paretovariate(1.2)), 80))
+
+
+# Generating one synthetic article
+def __article__(rng, vocabulary, year, month, index, seed):
+  '''
+  __article__(rng, vocabulary, year, month, index, seed) -> dict
+  '''
+
+  day = rng.randint(1, monthrange(year, month)[1])
+  section = rng.choices(__SECTION_VALUES__, cum_weights=__SECTION_WEIGHTS__)[0]
+
+  keyword_count = min(int(rng.expovariate(1 / 4.0)), 12)
+  keywords = list()
+
+  for keyword in rng.choices(vocabulary.keywords, cum_weights=vocabulary.keyword_weights,
+                             k=keyword_count):
+    if keyword not in keywords:
+      keywords.append(dict(keyword))
+
+  persons = list()
+
+  for rank, reporter in enumerate(rng.choices(vocabulary.reporters,
+                                              cum_weights=vocabulary.reporter_weights,
+                                              k=1 if rng.random() < 0.85 else 2), start=1):
+    if all(person['lastname'] != reporter['lastname'] or
+           person['firstname'] != reporter['firstname'] for person in persons):
+      persons.append(dict(reporter, rank=rank, role='reported', organization=''))
+
+  byline = {
+      'person': persons,
+      'original': 'By ' + ' and '.join(
+          ' '.join(name for name in (person['firstname'], person['middlename'], person['lastname'])
+                   if name).upper() for person in persons)
+  } if rng.random() < 0.8 else None
+
+  lead_paragraph = vocabulary.text(rng, rng.randint(25, 70))
+
+  headline = vocabulary.text(rng, rng.randint(4, 10)).title()
+
+  return {
+      '_id': sha256('{seed}-{year}-{month}-{index}'.format(
+          seed=seed, year=year, month=month, index=index).encode('utf-8')).hexdigest()[:24],
+      'web_url': '{base}/{year}/{month:02d}/{day:02d}/{section}/{index}.html'.format(
+          base='http://www.nytimes.com', year=year, month=month, day=day, index=index,
+          section=section.lower().replace(' ', '-').replace('.', '')),
+      'snippet': lead_paragraph[:200],
+      'lead_paragraph': lead_paragraph,
+      'abstract': vocabulary.text(rng, rng.randint(10, 40)) if rng.random() < 0.6 else None,
+      'print_page': __print_page__(rng),
+      'blog': list(),
+      'source': rng.choices(__SOURCE_VALUES__, cum_weights=__SOURCE_WEIGHTS__)[0],
+      'multimedia': list(),
+      'headline': {
+          'main': headline
+      },
+      'keywords': keywords,
+      'pub_date': '{year}-{month:02d}-{day:02d}T{hour:02d}:{minute:02d}:00Z'.format(
+          year=year, month=month, day=day, hour=rng.randint(0, 23), minute=rng.randint(0, 59)),
+      'document_type': rng.choices(__DOCUMENT_TYPE_VALUES__,
+                                  cum_weights=__DOCUMENT_TYPE_WEIGHTS__)[0],
+      'news_desk': section + ' Desk',
+      'section_name': section,
+      'subsection_name': None,
+      'byline': byline,
+      'type_of_material': rng.choices(__MATERIAL_VALUES__, cum_weights=__MATERIAL_WEIGHTS__)[0],
+      'word_count': int(rng.lognormvariate(6.6, 0.6)),
+      'slideshow_credits': None
+  }
+
+
+# Generating the articles of a month
+def generate_month(year, month, count, seed=__DEFAULT_SEED__):
+  '''
+  generate_month(year, month, count, seed=185) -> generator[dict]
+
+  Yields `count` synthetic articles published in the year, month, as the archives API returns them.
+
+  Input(s):
+
+    :param: year `int` -- The publication year
+
+    :param: month `int` -- The publication month
+
+    :param: count `int` -- The number of articles
+
+    :param: seed `int` -- The seed of the corpus -- defaults to 185
+
+  Output(s):
+
+    :return: articles `generator[dict]` -- The articles, the same for the same arguments
+  '''
+
+  vocabulary = __vocabulary__(seed)
+
+  rng = Random('{seed}-{year}-{month}'.format(seed=seed, year=year, month=month))
+
+  for index in range(count):
+    yield __article__(rng, vocabulary, year, month, index, seed)
+
+
+# Splitting the corpus over the months
+def month_sizes(size, months=None):
+  '''
+  month_sizes(size, months=None) -> list[(int, int, int)]
+
+  Spreads `size` articles evenly over the months.
+
+  Input(s):
+
+    :param: size `int` -- The number of articles of the corpus
+
+    :param: months `list[(int, int)]` -- The (year, month) pairs -- defaults to `archive_months()`
+
+  Output(s):
+
+    :return: month_sizes `list[(int, int, int)]` -- The (year, month, count) of every month
+  '''
+
+  months = archive_months() if months is None else months
+
+  per_month, remainder = divmod(size, len(months))
+
+  return [(year, month, per_month + (1 if index < remainder else 0))
+          for index, (year, month) in enumerate(months)]
+
+
+# Generating the whole corpus
+def generate_corpus(size, seed=__DEFAULT_SEED__, months=None):
+  '''
+  generate_corpus(size, seed=185, months=None) -> generator[dict]
+
+  Yields the `size` synthetic articles of the corpus, month after month.
+
+  Input(s):
+
+    :param: size `int` -- The number of articles
+
+    :param: seed `int` -- The seed of the corpus -- defaults to 185
+
+    :param: months `list[(int, int)]` -- The (year, month) pairs -- defaults to `archive_months()`
+  '''
+
+  for year, month, count in month_sizes(size, months=months):
+    for article in generate_month(year, month, count, seed=seed):
+      yield article
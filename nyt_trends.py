@@ -0,0 +1,486 @@
+# nyt_trends.py
+# -*- coding: utf-8 -*-
+
+
+'''
+Keyword trends and bursts over the monthly time series of the NYT archives.
+
+`keyword_series` counts every keyword per publication month, from the keyword rollups when they
+cover the dataset (see `nyt_queries.__rollups__`) or from the archives collection otherwise, and
+keeps the counts as a dense NumPy matrix, one row per dictionary encoded keyword and one column per
+month. The scores of `KeywordSeries` are computed on the whole matrix at once:
+
+  burst -- how far the count of a month is above what the frequency of the keyword over the
+  previous months predicts, as a binomial z score (election night, a hurricane)
+
+  emerging -- the log2 ratio of the frequency of the keyword within a window of months to its
+  frequency before the window (a story that keeps growing)
+
+NumPy is optional for the rest of the NYT archiver, it is only needed here.
+'''
+
+# python standard library imports
+from json import dumps
+from json import loads
+from logging import warning
+from time import perf_counter
+
+try:
+  import numpy as np
+except ImportError:  # the trends are the only part of the archiver needing numpy
+  np = None
+
+
+# NYT Archiver imports
+import nyt_queries
+from nyt_queries import get_client
+from nyt_queries import __rollups__
+from nyt_queries import __rollups_ready__
+from nyt_queries import __ROLLUP_DIMENSION__
+from nyt_queries import __ROLLUP_YEAR__
+from nyt_queries import __ROLLUP_MONTH__
+from nyt_queries import __ROLLUP_KEY__
+from nyt_queries import __ROLLUP_COUNT__
+from nyt_queries import __KEYWORD_ROLLUP__
+from nyt_queries import __TYPE_OF_MATERIAL_ROLLUP__
+from nyt_queries import __KEYWORDS__
+from nyt_queries import __PUB_YEAR__
+from nyt_queries import __PUB_MONTH__
+from nyt_queries import __ID__
+from nyt_queries import __GROUP__
+from nyt_queries import __SUM__
+from nyt_queries import __UNWIND__
+from nyt_queries import __COUNT_FIELD__
+
+
+# Constants
+__BASELINE_MONTHS__ = 6
+__MIN_COUNT__ = 5
+__TOP_K__ = 10
+__FIND_BATCH_SIZE__ = 5000
+
+
+# NumPy is an optional dependency
+def __require_numpy__():
+  '''
+  __require_numpy__()
+
+  Raises an ImportError explaining how to get NumPy when it is not installed.
+  '''
+
+  if np is None:
+    raise ImportError('The keyword trends need NumPy, install it with `pip install numpy`')
+
+
+# sums of the previous months
+def __trailing_sums__(values, months):
+  '''
+  __trailing_sums__(values, months) -> ndarray
+
+  The sum of the `months` values preceding every column of `values` along its last axis, fewer at
+  the start of the series.
+  '''
+
+  padded = np.zeros(values.shape[:-1] + (values.shape[-1] + 1,), dtype=np.float64)
+  np.cumsum(values, axis=-1, out=padded[..., 1:])
+
+  upper = np.arange(values.shape[-1])
+  lower = np.maximum(upper - months, 0)
+
+  return padded[..., upper] - padded[..., lower]
+
+
+# the dictionary key of a keyword
+def __encoded__(keyword):
+  '''
+  __encoded__(keyword) -> object
+
+  A hashable value equal for equal keywords, the (name, value, ...) items of the keyword documents.
+  '''
+
+  try:
+    encoded = tuple(sorted(keyword.items())) if isinstance(keyword, dict) else keyword
+    hash(encoded)
+  except TypeError:
+    encoded = dumps(keyword, sort_keys=True, default=str)
+
+  return encoded
+
+
+class KeywordSeries(object):
+  '''
+  KeywordSeries(keywords, months, counts, totals)
+
+  The monthly counts of every keyword.
+
+  Input(s):
+
+    :param: keywords `list[dict]` -- The keywords, the row of a keyword is its index in the list
+
+    :param: months `list[(int, int)]` -- The (year, month) of every column, in chronological order
+
+    :param: counts `ndarray` -- The (keywords, months) matrix of the article counts
+
+    :param: totals `ndarray` -- The number of articles of every month
+  '''
+
+  def __init__(self, keywords, months, counts, totals):
+    __require_numpy__()
+
+    self.keywords = keywords
+    self.months = [tuple(month) for month in months]
+    self.counts = counts
+    self.totals = totals
+
+  def __len__(self):
+    return len(self.keywords)
+
+  @classmethod
+  def from_counts(cls, rows, totals):
+    '''
+    from_counts(rows, totals) -> KeywordSeries
+
+    Builds the series from `(keyword, year, month, count)` rows and the `{(year, month): articles}`
+    totals, dictionary encoding the keywords as they come.
+    '''
+
+    __require_numpy__()
+
+    months = sorted(totals)
+    columns = dict((month, column) for column, month in enumerate(months))
+
+    ids = dict()
+    keywords = list()
+    row_ids = list()
+    column_ids = list()
+    values = list()
+
+    for keyword, year, month, count in rows:
+      column = columns.get((year, month))
+
+      if column is None:
+        continue
+
+      encoded = __encoded__(keyword)
+      row = ids.get(encoded)
+
+      if row is None:
+        row = ids[encoded] = len(keywords)
+        keywords.append(keyword)
+
+      row_ids.append(row)
+      column_ids.append(column)
+      values.append(count)
+
+    # one bincount over the flat cell index instead of a Python loop over the matrix
+    cells = np.asarray(row_ids, dtype=np.int64) * len(months) + \
+        np.asarray(column_ids, dtype=np.int64)
+    counts = np.bincount(cells, weights=np.asarray(values, dtype=np.float64),
+                         minlength=len(keywords) * len(months))
+
+    return cls(keywords, months,
+               counts.reshape(len(keywords), len(months)).astype(np.int32),
+               np.asarray([totals[month] for month in months], dtype=np.int64))
+
+  def columns(self, start=None, end=None):
+    '''
+    columns(start=None, end=None) -> ndarray
+
+    The columns of the months from `start` to `end` (year, month), both included.
+    '''
+
+    return np.asarray([column for column, month in enumerate(self.months)
+                       if (start is None or month >= tuple(start)) and
+                       (end is None or month <= tuple(end))], dtype=np.int64)
+
+  def burst_scores(self, baseline=__BASELINE_MONTHS__):
+    '''
+    burst_scores(baseline=6) -> ndarray
+
+    The (keywords, months) matrix of the burst scores: the count of every keyword in every month
+    against the count expected from its frequency over the `baseline` previous months, as a
+    binomial z score. The first month has no baseline and scores 0.
+    '''
+
+    counts = self.counts.astype(np.float64)
+    totals = self.totals.astype(np.float64)
+
+    prior_counts = __trailing_sums__(counts, baseline)
+    prior_totals = __trailing_sums__(totals, baseline)
+
+    # smoothed, so that a keyword never seen before does not get an infinite score
+    frequency = (prior_counts + 0.5) / (prior_totals + 1.0)
+    expected = totals * frequency
+
+    scores = (counts - expected) / np.sqrt(expected * (1.0 - frequency) + 1.0)
+
+    return np.where(prior_totals > 0, scores, 0.0)
+
+  def emerging_scores(self, start, end=None):
+    '''
+    emerging_scores(start, end=None) -> ndarray
+
+    The log2 ratio of the frequency of every keyword from `start` to `end` (year, month) to its
+    frequency in the months before `start`.
+    '''
+
+    window = self.columns(start, end)
+    before = np.arange(window[0] if len(window) > 0 else 0)
+
+    window_frequency = (self.counts[:, window].sum(axis=1) + 0.5) / \
+        (self.totals[window].sum() + 1.0)
+    before_frequency = (self.counts[:, before].sum(axis=1) + 0.5) / \
+        (self.totals[before].sum() + 1.0)
+
+    return np.log2(window_frequency / before_frequency)
+
+  def __top__(self, scores, k):
+    '''
+    __top__(scores, k) -> ndarray
+
+    The rows of the k highest finite scores, highest first.
+    '''
+
+    candidates = np.flatnonzero(np.isfinite(scores))
+
+    if len(candidates) > k:
+      candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+  def top_bursts(self, k=__TOP_K__, start=None, end=None, baseline=__BASELINE_MONTHS__,
+                 min_count=__MIN_COUNT__):
+    '''
+    top_bursts(k=10, start=None, end=None, baseline=6, min_count=5) -> list[dict]
+
+    The k keywords with the highest burst within the window, each with its burstiest month.
+
+    Input(s):
+
+      :param: k `int` -- The number of keywords -- defaults to 10
+
+      :param: start `(int, int)` -- The first month of the window -- defaults to the first month
+
+      :param: end `(int, int)` -- The last month of the window -- defaults to the last month
+
+      :param: baseline `int` -- The number of previous months the frequency is measured on --
+      defaults to 6
+
+      :param: min_count `int` -- Ignore the months with fewer articles for the keyword -- defaults
+      to 5
+
+    Output(s):
+
+      :return: bursts `list[dict]` -- `keyword`, `year`, `month`, `count`, `expected` (the count
+      predicted by the baseline) and `score`, highest score first
+    '''
+
+    window = self.columns(start, end)
+
+    if len(window) == 0 or len(self.keywords) == 0:
+      return list()
+
+    counts = self.counts[:, window]
+    scores = np.where(counts >= min_count, self.burst_scores(baseline)[:, window], -np.inf)
+
+    best_columns = scores.argmax(axis=1)
+    best_scores = scores[np.arange(len(self.keywords)), best_columns]
+
+    bursts = list()
+
+    for row in self.__top__(best_scores, k):
+      column = window[best_columns[row]]
+      count = int(self.counts[row, column])
+      bursts.append({
+          'keyword': self.keywords[row],
+          'year': self.months[column][0],
+          'month': self.months[column][1],
+          'count': count,
+          'expected': self.__expected__(row, column, baseline),
+          'score': float(best_scores[row])
+      })
+
+    return bursts
+
+  def __expected__(self, row, column, baseline):
+    '''
+    __expected__(row, column, baseline) -> float
+
+    The count of the keyword in the month predicted by its previous `baseline` months.
+    '''
+
+    previous = slice(max(column - baseline, 0), column)
+
+    frequency = (self.counts[row, previous].sum() + 0.5) / (self.totals[previous].sum() + 1.0)
+
+    return float(self.totals[column] * frequency)
+
+  def top_emerging(self, k=__TOP_K__, start=None, end=None, min_count=__MIN_COUNT__):
+    '''
+    top_emerging(k=10, start=None, end=None, min_count=5) -> list[dict]
+
+    The k keywords whose frequency grew the most from before the window to within it.
+
+    Input(s):
+
+      :param: k `int` -- The number of keywords -- defaults to 10
+
+      :param: start `(int, int)` -- The first month of the window -- defaults to the last month
+
+      :param: end `(int, int)` -- The last month of the window -- defaults to the last month
+
+      :param: min_count `int` -- Ignore the keywords with fewer articles in the window -- defaults
+      to 5
+
+    Output(s):
+
+      :return: keywords `list[dict]` -- `keyword`, `count` (in the window), `before` (the count
+      before the window) and `score`, highest score first
+    '''
+
+    if len(self.months) == 0 or len(self.keywords) == 0:
+      return list()
+
+    start = self.months[-1] if start is None else tuple(start)
+    window = self.columns(start, end)
+
+    if len(window) == 0:
+      return list()
+
+    window_counts = self.counts[:, window].sum(axis=1)
+    before_counts = self.counts[:, :window[0]].sum(axis=1)
+
+    scores = np.where(window_counts >= min_count, self.emerging_scores(start, end), -np.inf)
+
+    return [{
+        'keyword': self.keywords[row],
+        'count': int(window_counts[row]),
+        'before': int(before_counts[row]),
+        'score': float(scores[row])
+    } for row in self.__top__(scores, k)]
+
+  def save(self, path):
+    '''
+    save(path)
+
+    Writes the series to a compressed `.npz` file.
+    '''
+
+    np.savez_compressed(path,
+                        keywords=np.asarray([dumps(keyword, default=str)
+                                             for keyword in self.keywords]),
+                        months=np.asarray(self.months, dtype=np.int32).reshape(-1, 2),
+                        counts=self.counts,
+                        totals=self.totals)
+
+  @classmethod
+  def load(cls, path):
+    '''
+    load(path) -> KeywordSeries
+
+    Reads a series written by `save`.
+    '''
+
+    __require_numpy__()
+
+    with np.load(path, allow_pickle=False) as saved:
+      return cls([loads(keyword) for keyword in saved['keywords']],
+                 [tuple(int(part) for part in month) for month in saved['months']],
+                 saved['counts'],
+                 saved['totals'])
+
+
+# The monthly keyword counts from the rollups
+def __rollup_rows__(client):
+  '''
+  __rollup_rows__(client) -> (generator, dict)
+  '''
+
+  rollups = __rollups__(client)
+
+  totals = dict()
+
+  # every article counts once in the `type_of_material` rollup
+  for entry in rollups.find({__ROLLUP_DIMENSION__: __TYPE_OF_MATERIAL_ROLLUP__},
+                            {__ROLLUP_YEAR__: True, __ROLLUP_MONTH__: True,
+                             __ROLLUP_COUNT__: True}):
+    month = (entry[__ROLLUP_YEAR__], entry[__ROLLUP_MONTH__])
+    totals[month] = totals.get(month, 0) + entry[__ROLLUP_COUNT__]
+
+  cursor = rollups.find({__ROLLUP_DIMENSION__: __KEYWORD_ROLLUP__},
+                        {__ID__: False, __ROLLUP_KEY__: True, __ROLLUP_YEAR__: True,
+                         __ROLLUP_MONTH__: True, __ROLLUP_COUNT__: True},
+                        batch_size=__FIND_BATCH_SIZE__)
+
+  rows = ((entry[__ROLLUP_KEY__], entry[__ROLLUP_YEAR__], entry[__ROLLUP_MONTH__],
+           entry[__ROLLUP_COUNT__]) for entry in cursor)
+
+  return rows, totals
+
+
+# The monthly keyword counts from the archives collection
+def __raw_rows__(client):
+  '''
+  __raw_rows__(client) -> (generator, dict)
+  '''
+
+  collection = client.get_database(nyt_queries.__DATABASE_NAME__)[nyt_queries.__COLLECTION_NAME__]
+
+  month = {'year': '${year}'.format(year=__PUB_YEAR__),
+           'month': '${month}'.format(month=__PUB_MONTH__)}
+
+  totals = dict(((entry[__ID__]['year'], entry[__ID__]['month']), entry[__COUNT_FIELD__])
+                for entry in collection.aggregate([
+                    {__GROUP__: {__ID__: month, __COUNT_FIELD__: {__SUM__: 1}}}
+                ], allowDiskUse=True)
+                if entry[__ID__].get('year') is not None)
+
+  month['keyword'] = '${keywords}'.format(keywords=__KEYWORDS__)
+
+  cursor = collection.aggregate([
+      {__UNWIND__: '${keywords}'.format(keywords=__KEYWORDS__)},
+      {__GROUP__: {__ID__: month, __COUNT_FIELD__: {__SUM__: 1}}}
+  ], allowDiskUse=True, batchSize=__FIND_BATCH_SIZE__)
+
+  rows = ((entry[__ID__]['keyword'], entry[__ID__].get('year'), entry[__ID__].get('month'),
+           entry[__COUNT_FIELD__]) for entry in cursor)
+
+  return rows, totals
+
+
+# Building the keyword series of the archives
+def keyword_series(client=None, use_rollups=True):
+  '''
+  keyword_series(client=None, use_rollups=True) -> KeywordSeries
+
+  Counts every keyword of the archives per publication month.
+
+  Input(s):
+
+    :param: client `MongoClient` -- The client to use -- defaults to the shared client
+
+    :param: use_rollups `bool` -- Read the keyword rollups when they cover the dataset instead of
+    aggregating the archives collection -- defaults to True
+
+  Output(s):
+
+    :return: series `KeywordSeries` -- The keywords by months matrix
+  '''
+
+  __require_numpy__()
+
+  client = get_client() if client is None else client
+
+  started_at = perf_counter()
+
+  if use_rollups and __rollups_ready__(client):
+    rows, totals = __rollup_rows__(client)
+  else:
+    rows, totals = __raw_rows__(client)
+
+  series = KeywordSeries.from_counts(rows, totals)
+
+  warning('Built the series of {keywords} keywords over {months} months in {seconds:.2f}s'.format(
+      keywords=len(series), months=len(series.months), seconds=perf_counter() - started_at))
+
+  return series
@@ -0,0 +1,8 @@
+# __init__.py
+# -*- coding: utf-8 -*-
+
+
+'''
+The tests of the NYT archiver, run with `python -m pytest` from the repository root. The mongo
+cluster is replaced by mongomock and the NYT archives API by `nyt_archive_server`.
+'''
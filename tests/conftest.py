@@ -0,0 +1,68 @@
+# conftest.py
+# -*- coding: utf-8 -*-
+
+
+'''
+The fixtures of the tests: a mongomock client standing in for the mongo cluster and the stand-in
+NYT archives API server, see `nyt_archive_server`.
+'''
+
+# third party imports
+import mongomock
+import pytest
+
+# NYT Archiver imports
+import nyt_queries
+import nyt_archive_server
+
+
+# A fresh mongomock client shared by the query functions, and the module state reset around it
+@pytest.fixture
+def client(monkeypatch):
+  mongo_client = mongomock.MongoClient()
+
+  monkeypatch.setattr(nyt_queries, 'get_client', lambda *args, **kwargs: mongo_client)
+  monkeypatch.setattr(nyt_queries, '__QUERY_CACHE__', None)
+  monkeypatch.setattr(nyt_queries, '__GENERATION_TTL__', nyt_queries.__GENERATION_TTL__)
+  monkeypatch.setattr(nyt_queries, '__ARCHIVES_CACHE__', None)
+  monkeypatch.setattr(nyt_queries, '__PARALLEL_AGGREGATION__', None)
+  monkeypatch.setattr(nyt_queries, '__REPORTER_NAMES_CACHE__', dict())
+  monkeypatch.setattr(nyt_queries, '__CACHED_GENERATION__', {'generation': None,
+                                                             'checked_at': 0.0, 'forgotten': 0})
+  # the retries of the ingest don't need to wait for real
+  monkeypatch.setattr(nyt_queries, 'sleep', lambda seconds: None)
+
+  return mongo_client
+
+
+# Starting the stand-in archives API, `archives_server(**options)` with the `ArchiveStandIn` options
+@pytest.fixture
+def archives_server(monkeypatch):
+  servers = list()
+
+  def start(**options):
+    options.setdefault('docs_per_month', 30)
+    server = nyt_archive_server.serve(port=0, **options)
+    servers.append(server)
+    monkeypatch.setattr(nyt_queries, '__NYT_API_BASE_PATH__', server.base_path)
+    return server
+
+  yield start
+
+  for server in servers:
+    server.shutdown()
+    server.server_close()
+
+
+# The months of the ingested dataset
+DATASET_MONTHS = [(2005, 1), (2005, 2), (2005, 3)]
+
+
+# A dataset ingested from the stand-in archives API into the mongomock client
+@pytest.fixture
+def dataset(client, archives_server):
+  server = archives_server(docs_per_month=60)
+
+  nyt_queries.create_archives_dataset(workers=2, months=DATASET_MONTHS)
+
+  return server
@@ -0,0 +1,45 @@
+# test_cache.py
+# -*- coding: utf-8 -*-
+
+
+'''
+Tests of the on-disk cache of the archives API responses, `ArchivesCache`.
+'''
+
+# python standard library imports
+from datetime import datetime
+from io import BytesIO
+from os.path import exists
+
+# NYT Archiver imports
+from nyt_cache import ArchivesCache
+from nyt_cache import __month_closed__
+
+
+def test_month_closes_in_new_york_time():
+  assert not __month_closed__(2005, 1, now=datetime(2005, 1, 31, 12))
+  assert not __month_closed__(2005, 1, now=datetime(2005, 2, 1, 4, 59))
+  assert __month_closed__(2005, 1, now=datetime(2005, 2, 1, 5))
+  assert not __month_closed__(2005, 12, now=datetime(2006, 1, 1, 0, 30))
+  assert __month_closed__(2005, 12, now=datetime(2006, 1, 2))
+
+
+def test_past_months_are_cached(tmp_path):
+  cache = ArchivesCache(str(tmp_path))
+
+  with cache.record(2005, 1, BytesIO(b'{"response": {"docs": []}}')) as response:
+    response.read()
+
+  assert exists(cache.path(2005, 1))
+  assert cache.open(2005, 1).read() == b'{"response": {"docs": []}}'
+
+
+def test_current_month_is_not_cached(tmp_path):
+  cache = ArchivesCache(str(tmp_path))
+  now = datetime.utcnow()
+
+  with cache.record(now.year, now.month, BytesIO(b'{"response": {"docs": []}}')) as response:
+    response.read()
+
+  assert not exists(cache.path(now.year, now.month))
+  assert cache.open(now.year, now.month) is None
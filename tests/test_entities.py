@@ -0,0 +1,28 @@
+# test_entities.py
+# -*- coding: utf-8 -*-
+
+
+'''
+Tests of Query#5, the people and organizations resolved through the entity catalog.
+'''
+
+# third party imports
+import pytest
+
+# NYT Archiver imports
+import nyt_queries
+
+
+@pytest.mark.parametrize('search_string', ['', '   ', '.,', "'"])
+def test_empty_names_are_rejected(client, dataset, search_string):
+  with pytest.raises(ValueError):
+    nyt_queries.search_people_or_organization(search_string)
+
+
+def test_names_resolve_through_the_catalog(client, dataset):
+  assert nyt_queries.__entity_catalog_ready__(client)
+
+  organization = nyt_queries.autocomplete_entities('', kinds=('organizations',), limit=1)[0]
+  articles = nyt_queries.search_people_or_organization(organization[nyt_queries.__ENTITY_VALUE__])
+
+  assert len(articles) >= organization['count']
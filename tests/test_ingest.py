@@ -0,0 +1,43 @@
+# test_ingest.py
+# -*- coding: utf-8 -*-
+
+
+'''
+Tests of the dataset creation against the stand-in archives API, see `create_archives_dataset`.
+'''
+
+# NYT Archiver imports
+import nyt_queries
+
+
+MONTHS = [(2005, month) for month in range(1, 9)]
+
+
+def test_ingest_marks_every_month_done(client, archives_server):
+  archives_server()
+
+  nyt_queries.create_archives_dataset(workers=2, months=MONTHS)
+
+  manifest = nyt_queries.read_manifest(client)
+
+  assert sorted(manifest) == MONTHS
+  assert all(entry['status'] == 'done' and entry['count'] == 30 for entry in manifest.values())
+
+
+def test_ingest_retries_faulty_responses(client, archives_server):
+  server = archives_server(truncate_rate=0.3, error_rate=0.1, throttle_rate=0.1, seed=7)
+
+  nyt_queries.create_archives_dataset(workers=2, months=MONTHS, retries=10)
+
+  manifest = nyt_queries.read_manifest(client)
+  stats = server.stand_in.stats()
+
+  assert all(entry['status'] == 'done' for entry in manifest.values())
+  assert stats['truncated'] + stats['errors'] + stats['throttled'] > 0
+  assert stats['requests'] > len(MONTHS)
+
+  # the replayed months were upserted, not duplicated, and their rollups counted once
+  collection = client[nyt_queries.__DATABASE_NAME__][nyt_queries.__COLLECTION_NAME__]
+  assert len(collection.distinct(nyt_queries.__ID__)) == 30 * len(MONTHS)
+  assert nyt_queries.count_original_articles.__wrapped__(use_rollups=True) == \
+      nyt_queries.count_original_articles.__wrapped__(use_rollups=False)
@@ -0,0 +1,69 @@
+# test_query_cache.py
+# -*- coding: utf-8 -*-
+
+
+'''
+Tests of the query result cache and of its invalidation by the dataset generation.
+'''
+
+# NYT Archiver imports
+import nyt_queries
+
+
+def test_cached_until_the_generation_is_bumped(client, dataset):
+  nyt_queries.set_query_cache(generation_ttl=60.0)
+
+  first = nyt_queries.count_original_articles(use_rollups=False)[0]['orig_count']
+  assert nyt_queries.count_original_articles(use_rollups=False)[0]['orig_count'] == first
+  assert nyt_queries.query_cache_stats()['hits'] == 1
+
+  collection = client[nyt_queries.__DATABASE_NAME__][nyt_queries.__COLLECTION_NAME__]
+  article = collection.find_one({nyt_queries.__SOURCE__: 'The New York Times'},
+                                {nyt_queries.__ID__: False})
+  article[nyt_queries.__ID__] = 'added'
+  collection.insert_one(article)
+
+  # without a new generation the stale result is still served
+  assert nyt_queries.count_original_articles(use_rollups=False)[0]['orig_count'] == first
+
+  nyt_queries.__bump_generation__(client)
+
+  assert nyt_queries.count_original_articles(use_rollups=False)[0]['orig_count'] == first + 1
+  assert nyt_queries.query_cache_stats()['invalidations'] == 1
+
+
+def test_streams_are_not_cached(client, dataset):
+  nyt_queries.set_query_cache()
+
+  first = list(nyt_queries.articles_between('2005-01-01', '2005-02-01', True))
+  second = list(nyt_queries.articles_between('2005-01-01', '2005-02-01', True))
+
+  assert first == second and len(first) > 0
+  assert nyt_queries.query_cache_stats()['misses'] == 0
+
+
+def test_results_are_not_shared_across_servers(client, dataset, monkeypatch):
+  nyt_queries.set_query_cache()
+
+  first = nyt_queries.count_original_articles(use_rollups=False)
+
+  # the same database and collection names on another server, with the same generation
+  monkeypatch.setattr(nyt_queries, '__PORT__', '27018')
+  collection = client[nyt_queries.__DATABASE_NAME__][nyt_queries.__COLLECTION_NAME__]
+  collection.delete_many({nyt_queries.__SOURCE__: 'The New York Times'})
+
+  assert nyt_queries.count_original_articles(use_rollups=False) != first
+  assert nyt_queries.query_cache_stats()['hits'] == 0
+
+
+def test_generation_read_outside_the_lock(client, dataset, monkeypatch):
+  nyt_queries.set_query_cache(generation_ttl=0.0)
+  dataset_generation = nyt_queries.dataset_generation
+
+  def locked_dataset_generation(client=None):
+    assert not nyt_queries.__CACHED_GENERATION_LOCK__.locked()
+    return dataset_generation(client)
+
+  monkeypatch.setattr(nyt_queries, 'dataset_generation', locked_dataset_generation)
+
+  assert nyt_queries.__cached_generation__() == dataset_generation()
@@ -0,0 +1,50 @@
+# test_resume.py
+# -*- coding: utf-8 -*-
+
+
+'''
+Tests of the resumable ingest and of the keyset pagination of the streamed articles.
+'''
+
+# NYT Archiver imports
+import nyt_queries
+from tests.conftest import DATASET_MONTHS
+
+
+def test_resume_skips_done_months(client, dataset):
+  requests = dataset.stand_in.stats()['requests']
+
+  report = nyt_queries.create_archives_dataset(workers=2, months=DATASET_MONTHS + [(2005, 4)])
+
+  statuses = dict(((month_report['year'], month_report['month']), month_report['status'])
+                  for month_report in report['months'])
+
+  assert all(statuses[month] == 'skipped' for month in DATASET_MONTHS)
+  assert statuses[(2005, 4)] == 'done'
+  assert dataset.stand_in.stats()['requests'] == requests + 1
+
+
+def test_no_resume_ingests_again(client, dataset):
+  requests = dataset.stand_in.stats()['requests']
+
+  nyt_queries.create_archives_dataset(workers=2, months=DATASET_MONTHS, resume=False)
+
+  collection = client[nyt_queries.__DATABASE_NAME__][nyt_queries.__COLLECTION_NAME__]
+
+  assert dataset.stand_in.stats()['requests'] == requests + len(DATASET_MONTHS)
+  assert len(collection.distinct(nyt_queries.__ID__)) == 60 * len(DATASET_MONTHS)
+
+
+def test_keyset_resume(client, dataset):
+  collection = client[nyt_queries.__DATABASE_NAME__][nyt_queries.__COLLECTION_NAME__]
+
+  articles = list(nyt_queries.iter_documents(collection, dict(), batch_size=7))
+
+  assert len(articles) == 60 * len(DATASET_MONTHS)
+
+  for stop in (1, 7, 50, len(articles) - 1):
+    resumed = nyt_queries.iter_documents(collection, dict(), batch_size=7,
+                                         after=nyt_queries.resume_token(articles[stop - 1]))
+
+    assert [article[nyt_queries.__ID__] for article in resumed] == \
+        [article[nyt_queries.__ID__] for article in articles[stop:]]
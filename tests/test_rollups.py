@@ -0,0 +1,56 @@
+# test_rollups.py
+# -*- coding: utf-8 -*-
+
+
+'''
+Tests of the aggregate queries answered from the rollups, compared with the raw pipelines.
+'''
+
+# third party imports
+import pytest
+
+# NYT Archiver imports
+import nyt_queries
+from nyt_queries import __result_counts__
+from nyt_queries import __ROLLUP_QUERIES__
+
+
+@pytest.mark.parametrize('query_name', __ROLLUP_QUERIES__)
+def test_rollups_match_raw_pipelines(client, dataset, query_name):
+  query = getattr(nyt_queries, query_name).__wrapped__
+
+  assert nyt_queries.__rollups_ready__(client)
+  assert __result_counts__(query(use_rollups=True)) == __result_counts__(query(use_rollups=False))
+
+
+def test_check_rollups(client, dataset):
+  checks = nyt_queries.check_rollups()
+
+  assert [check['query'] for check in checks] == list(__ROLLUP_QUERIES__)
+  assert all(check['consistent'] and check['rollups_ready'] for check in checks)
+  assert all(check['unready_months'] == list() for check in checks)
+
+
+def test_month_with_failed_writes_is_not_rollup_ready(client, dataset, monkeypatch):
+  write_batch = nyt_queries.__write_batch__
+
+  def failing_write_batch(collection, batch, batch_bytes, ordered):
+    batch_report = write_batch(collection, batch, batch_bytes, ordered)
+    batch_report.update(count=batch_report['count'] - 1, errors=1, failed={0})
+    return batch_report
+
+  monkeypatch.setattr(nyt_queries, '__write_batch__', failing_write_batch)
+
+  nyt_queries.create_archives_dataset(workers=1, months=[(2005, 4)])
+
+  assert not nyt_queries.__rollups_ready__(client)
+  assert nyt_queries.check_rollups()[0]['unready_months'] == ['2005-04']
+
+
+def test_types_of_material_in_the_same_order(client, dataset):
+  query = nyt_queries.list_articles_type_of_materials.__wrapped__
+
+  rollup_counts = [row['count'] for row in query(use_rollups=True)]
+  raw_counts = [row['count'] for row in query(use_rollups=False)]
+
+  assert rollup_counts == raw_counts == sorted(raw_counts, reverse=True)
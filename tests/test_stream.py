@@ -0,0 +1,55 @@
+# test_stream.py
+# -*- coding: utf-8 -*-
+
+
+'''
+Tests of the incremental parsing of the archives API responses, `iter_archive_documents`.
+'''
+
+# python standard library imports
+from io import BytesIO
+from json import dumps
+from json import loads
+
+# third party imports
+import pytest
+
+# NYT Archiver imports
+from nyt_queries import iter_archive_documents
+
+
+# Responses with numbers a chunk boundary can split, and values of every JSON type
+PAYLOADS = [
+    b'{"status":"OK","took":12.5,"response":{"docs":[{"_id":"a","word_count":1}],'
+    b'"meta":{"hits":1}}}',
+    b'{"response":{"docs":[-4.5e3]}}',
+    b'{"response":{"meta":{"hits":7},"docs":[1, 22.25e-1, true, null, "x\\u00e9", 1E+10, 0]}}',
+    dumps({'copyright': 'c', 'response': {'docs': [{'_id': str(i), 'n': i * 1.5, 'f': -i,
+                                                    'headline': {'main': 'é ' * i}}
+                                                   for i in range(20)],
+                                          'meta': {'hits': 20}}}).encode('utf-8')
+]
+
+
+@pytest.mark.parametrize('payload', PAYLOADS)
+def test_every_chunk_size(payload):
+  expected = loads(payload.decode('utf-8'))['response']
+
+  for chunk_size in range(1, len(payload) + 1):
+    meta = dict()
+    documents = list(iter_archive_documents(BytesIO(payload), meta=meta, chunk_size=chunk_size))
+
+    assert documents == expected['docs'], chunk_size
+    assert meta == expected.get('meta', dict()), chunk_size
+
+
+def test_malformed_value_fails_fast():
+  payload = dumps({'response': {'docs': [{'n': i} for i in range(1000)]}}).encode('utf-8')
+  payload = payload.replace(b'"n": 5}', b'"n": 5 oops}', 1)
+
+  stream = BytesIO(payload)
+
+  with pytest.raises(ValueError):
+    list(iter_archive_documents(stream, chunk_size=64))
+
+  assert stream.tell() < len(payload) // 2